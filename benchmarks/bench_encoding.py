@@ -0,0 +1,67 @@
+"""Benchmark the capped sparse shootings preprocessor against the notebook's one-hot version.
+
+    python benchmarks/bench_encoding.py --rows 200000
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from sklearn.compose import ColumnTransformer
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from cpd_pipeline.encoding import build_shootings_preprocessor, matrix_size_mb
+from cpd_pipeline.synthetic import make_shootings
+
+
+def notebook_preprocessor():
+    #the preprocessor from the notebook, StreetBlock and DateTimeOccured one-hot encoded
+    numerical_features = ['LATITUDE_X', 'LONGITUDE_X', 'Age', 'YearOccurred', 'DateOccurred', 'TimeOccurred']
+    categorical_features = ['District', 'StreetBlock', 'SNA_NEIGHBORHOOD', 'Race', 'Sex', 'Type',
+                            'DateTimeOccured', 'COMMUNITY_COUNCIL_NEIGHBORHOOD']
+    numerical_transformer = Pipeline(steps=[
+        ('imputer', SimpleImputer(strategy='median')),
+        ('scaler', StandardScaler()),
+    ])
+    categorical_transformer = Pipeline(steps=[
+        ('imputer', SimpleImputer(strategy='most_frequent')),
+        ('onehot', OneHotEncoder(handle_unknown='ignore')),
+    ])
+    return ColumnTransformer(transformers=[
+        ('num', numerical_transformer, numerical_features),
+        ('cat', categorical_transformer, categorical_features),
+    ])
+
+
+def run(name, preprocessor, train, test):
+    start = time.perf_counter()
+    preprocessor.fit(train)
+    fit_s = time.perf_counter() - start
+    start = time.perf_counter()
+    X_train = preprocessor.transform(train)
+    preprocessor.transform(test)
+    transform_s = time.perf_counter() - start
+    print(f'{name:<10} fit {fit_s:7.2f}s  transform {transform_s:7.2f}s  '
+          f'shape {X_train.shape}  {type(X_train).__name__}  {matrix_size_mb(X_train):8.1f} MB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200_000)
+    args = parser.parse_args()
+
+    df = make_shootings(args.rows)
+    split = int(len(df) * 0.8)
+    train, test = df.iloc[:split], df.iloc[split:]
+    run('notebook', notebook_preprocessor(), train, test)
+    run('capped', build_shootings_preprocessor(datetime_format='%Y/%m/%d %H:%M:%S'), train, test)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Benchmark the response-time feature module against the notebook's regression prep cell.
+
+    python benchmarks/bench_features.py --rows 3000000
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from cpd_pipeline.features import response_time_features
+from cpd_pipeline.synthetic import make_calls
+
+COLUMNS = ['CREATE_TIME_INCIDENT', 'DISPATCH_TIME_PRIMARY_UNIT', 'ARRIVAL_TIME_PRIMARY_UNIT',
+           'INCIDENT_TYPE_ID', 'SNA_NEIGHBORHOOD', 'PRIORITY']
+
+
+def notebook_cell(path):
+    #the regression prep cell from the notebook, with the same parsing and copies
+    df = pd.read_csv(path)
+    df['ARRIVAL_TIME_PRIMARY_UNIT'] = pd.to_datetime(df['ARRIVAL_TIME_PRIMARY_UNIT'])
+    df['DISPATCH_TIME_PRIMARY_UNIT'] = pd.to_datetime(df['DISPATCH_TIME_PRIMARY_UNIT'])
+    df['response_time'] = (df['ARRIVAL_TIME_PRIMARY_UNIT'] - df['DISPATCH_TIME_PRIMARY_UNIT']).dt.total_seconds() / 60
+    df['response_time'] = df['response_time'].fillna(df['response_time'].mean())
+    X = df.drop(columns=['response_time'])
+    y = df['response_time']
+    numeric_features = X.select_dtypes(include=['int64', 'float64']).columns
+    return X[numeric_features].to_numpy(), y.to_numpy()
+
+
+def feature_module(path):
+    df = pd.read_csv(path, usecols=COLUMNS, dtype={c: 'string' for c in COLUMNS[:3]} | {
+        'INCIDENT_TYPE_ID': 'category', 'SNA_NEIGHBORHOOD': 'category'})
+    X, y, _ = response_time_features(df)
+    return X, y
+
+
+def timed(fn, path):
+    start = time.perf_counter()
+    X, y = fn(path)
+    return time.perf_counter() - start, X, y
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=3_000_000)
+    parser.add_argument('--path', type=Path, default=Path('data/bench/calls_synthetic.csv'))
+    args = parser.parse_args()
+
+    if not args.path.exists():
+        print(f'writing {args.rows:,} synthetic calls to {args.path}')
+        args.path.parent.mkdir(parents=True, exist_ok=True)
+        make_calls(args.rows).to_csv(args.path, index=False)
+
+    old_s, _, old_y = timed(notebook_cell, args.path)
+    new_s, X, new_y = timed(feature_module, args.path)
+    same = np.allclose(old_y, new_y, rtol=1e-4, atol=1e-3)
+    print(f'notebook cell : {old_s:8.2f}s')
+    print(f'feature module: {new_s:8.2f}s  ({old_s / new_s:.1f}x faster, X {X.shape} {X.dtype}, '
+          f'{X.nbytes / 2 ** 20:.0f} MB)')
+    print(f'response times match: {same}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Benchmark the grid spatial index against brute-force haversine scans.
+
+    python benchmarks/bench_spatial.py --rows 1000000 --queries 500
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from cpd_pipeline.spatial import GridIndex, brute_force_radius, haversine_m
+from cpd_pipeline.synthetic import make_shootings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--radius', type=float, default=500.0)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    df = make_shootings(args.rows)
+    df['occurred'] = pd.to_datetime(df['DateTimeOccured'], format='%Y/%m/%d %H:%M:%S')
+    lat, lon = df['LATITUDE_X'].to_numpy(), df['LONGITUDE_X'].to_numpy()
+    times = df['occurred'].to_numpy()
+    rng = np.random.default_rng(1)
+    probes = rng.integers(0, len(df), args.queries)
+    end = df['occurred'].max()
+    start = end - pd.Timedelta(days=90)
+
+    t0 = time.perf_counter()
+    index = GridIndex.from_frame(df, time='occurred', cell_size=args.radius)
+    build_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    grid_hits = [index.radius(lat[i], lon[i], args.radius, start=start, end=end)[0] for i in probes]
+    grid_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    window = (times >= np.datetime64(start)) & (times < np.datetime64(end))
+    brute_hits = []
+    for i in probes:
+        ids, _ = brute_force_radius(lat, lon, lat[i], lon[i], args.radius)
+        brute_hits.append(ids[window[ids]])
+    brute_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    knn = [index.nearest(lat[i], lon[i], args.k)[1] for i in probes]
+    knn_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    knn_brute = [np.sort(haversine_m(lat, lon, lat[i], lon[i]))[:args.k] for i in probes]
+    knn_brute_s = time.perf_counter() - t0
+
+    same = all(set(a) == set(b) for a, b in zip(grid_hits, brute_hits))
+    #projection vs haversine differ by centimetres at city scale
+    knn_same = all(np.allclose(a, b, rtol=1e-3, atol=1.0) for a, b in zip(knn, knn_brute))
+    q = args.queries
+    print(f'index build      : {build_s:8.3f}s for {len(index):,} points')
+    print(f'radius {args.radius:.0f} m / 90d : grid {1000 * grid_s / q:8.3f} ms/query   '
+          f'brute {1000 * brute_s / q:8.3f} ms/query   ({brute_s / grid_s:.0f}x)  same results: {same}')
+    print(f'{args.k}-nearest       : grid {1000 * knn_s / q:8.3f} ms/query   '
+          f'brute {1000 * knn_brute_s / q:8.3f} ms/query   ({knn_brute_s / knn_s:.0f}x)  same results: {knn_same}')
+    print(index.density(start=start, end=end).head())
+
+
+if __name__ == '__main__':
+    main()
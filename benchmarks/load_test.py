@@ -0,0 +1,149 @@
+"""Load test of the local query service: latency percentiles and queries per second.
+
+    python benchmarks/load_test.py --rows 1m --threads 8 --queries 5000
+    python benchmarks/load_test.py --http --threads 16 --result-cache 0
+
+Writes synthetic raw files to ``data/bench/service/`` (once), starts a
+``QueryService`` on them and sends a random mix of filter / group / top-N
+queries from several threads. The queries are drawn from a fixed pool, so
+repeats show the result cache at work; ``--result-cache 0`` measures every
+query computed. With ``--http`` the queries go through the localhost
+endpoint instead of the Python API.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlencode
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from suite import parse_size  # noqa: E402
+
+DATASETS = ['calls', 'shootings', 'use_of_force']
+GROUPS = [['incident_type'], ['day_of_week', 'incident_type'], ['hour', 'neighborhood'], ['neighborhood'],
+          ['date'], ['district', 'incident_type'], []]
+
+
+def query_pool(size, seed=0):
+    """``size`` random queries over the synthetic datasets."""
+    from cpd_pipeline.synthetic import INCIDENT_TYPES, NEIGHBORHOODS
+
+    rng = np.random.default_rng(seed)
+    pool = []
+    for _ in range(size):
+        dataset = DATASETS[rng.choice(len(DATASETS), p=[0.7, 0.15, 0.15])]
+        query = {'group_by': GROUPS[rng.integers(len(GROUPS))]}
+        if rng.random() < 0.6:
+            query['neighborhood'] = str(rng.choice(NEIGHBORHOODS))
+        if dataset == 'calls' and rng.random() < 0.3:
+            query['incident_type'] = str(rng.choice(INCIDENT_TYPES))
+        if rng.random() < 0.3:
+            query['district'] = str(rng.integers(1, 6))
+        if rng.random() < 0.5:
+            month = rng.integers(0, 36)
+            query['start'] = f'{2022 + month // 12}-{month % 12 + 1:02d}-01'
+            query['end'] = f'{2022 + (month + 1) // 12}-{(month + 1) % 12 + 1:02d}-01'
+        if query['group_by'] and rng.random() < 0.7:
+            query['top'] = int(rng.choice([3, 5, 10]))
+        pool.append((dataset, query))
+    return pool
+
+
+def http_caller(base):
+    def call(dataset, query):
+        params = {k: ','.join(v) if isinstance(v, list) else v for k, v in query.items()}
+        with urllib.request.urlopen(f'{base}/query/{dataset}?{urlencode(params)}') as response:
+            return json.loads(response.read())['rows']
+    return call
+
+
+def run_load(call, pool, queries, threads, seed=1):
+    """Send ``queries`` random queries from ``pool`` on ``threads`` threads, return the latencies."""
+    order = np.random.default_rng(seed).integers(len(pool), size=queries)
+    latencies = np.zeros(queries)
+    counter = iter(range(queries))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            dataset, query = pool[order[i]]
+            start = time.perf_counter()
+            call(dataset, query)
+            latencies[i] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for future in [executor.submit(worker) for _ in range(threads)]:
+            future.result()
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', default='1m', help='synthetic calls rows, e.g. 100k or 1m')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--queries', type=int, default=5000)
+    parser.add_argument('--pool', type=int, default=500, help='distinct queries the load is drawn from')
+    parser.add_argument('--result-cache', type=int, default=256)
+    parser.add_argument('--http', action='store_true', help='query through the localhost HTTP endpoint')
+    parser.add_argument('--bench-dir', type=Path, default=ROOT / 'data' / 'bench' / 'service')
+    args = parser.parse_args()
+
+    #the service reads the raw files from its own data folder, set before the package is imported
+    rows = parse_size(args.rows)
+    data_dir = args.bench_dir / f'calls-{rows}'
+    os.environ['CPD_DATA_DIR'] = str(data_dir)
+    os.environ['CPD_STAGE_LOG'] = os.devnull
+
+    from cpd_pipeline.config import RAW_DIR, RAW_FILES
+    from cpd_pipeline.service import QueryService, make_server
+    from cpd_pipeline.synthetic import write_synthetic
+
+    for name in DATASETS:
+        path = RAW_DIR / RAW_FILES[name]
+        if not path.exists():
+            print(f'writing synthetic {name} rows to {path}', flush=True)
+            write_synthetic(name, rows if name == 'calls' else max(rows // 50, 1000), path, seed=5)
+
+    start = time.perf_counter()
+    service = QueryService(DATASETS, cache_size=args.result_cache)
+    print(f'service ready in {time.perf_counter() - start:.2f}s: {service.stats()["datasets"]}')
+
+    server = None
+    if args.http:
+        server = make_server(service, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        call = http_caller(f'http://127.0.0.1:{server.server_address[1]}')
+    else:
+        call = lambda dataset, query: service.query(dataset, **query)  # noqa: E731
+    try:
+        latencies, seconds = run_load(call, query_pool(args.pool), args.queries, args.threads)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    ms = latencies * 1000
+    print(f"{args.queries} queries on {args.threads} threads {'over http' if args.http else 'in process'}: "
+          f'{args.queries / seconds:,.0f} queries/s')
+    print(f'latency ms  p50 {np.percentile(ms, 50):.2f}  p90 {np.percentile(ms, 90):.2f}  '
+          f'p99 {np.percentile(ms, 99):.2f}  max {ms.max():.2f}')
+    print(f"result cache {service.stats()['cache']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,215 @@
+"""Offline benchmark suite over synthetic calls, shootings and use of force data.
+
+    python benchmarks/suite.py --sizes 10k,100k,1m
+    python benchmarks/suite.py --sizes 50m --datasets calls --stages load,aggregate
+    python benchmarks/suite.py --compare 1a2b3c4 HEAD
+
+Synthetic csv files are written once to ``data/bench/`` in chunks and reused.
+Every (dataset, size) runs in a fresh process, so peak RSS belongs to that
+run alone. Results are saved to ``benchmarks/results/<commit>.json`` and two
+commits can be compared step by step.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+STAGES = ['load', 'profile', 'aggregate', 'features', 'model']
+DATASETS = ['calls', 'shootings', 'use_of_force']
+RESULTS_DIR = ROOT / 'benchmarks' / 'results'
+
+
+def parse_size(text):
+    """'10k' -> 10000, '50m' -> 50000000."""
+    text = text.strip().lower().replace('_', '')
+    scale = {'k': 10 ** 3, 'm': 10 ** 6}.get(text[-1])
+    return int(float(text[:-1]) * scale) if scale else int(text)
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+    return commit, dirty
+
+
+def synthetic_file(name, rows, bench_dir):
+    from cpd_pipeline.synthetic import write_synthetic
+
+    path = Path(bench_dir) / f'{name}-{rows}.csv'
+    if not path.exists():
+        print(f'writing {rows:,} synthetic {name} rows to {path}', flush=True)
+        write_synthetic(name, rows, path)
+    return path
+
+
+def bench_dataset(name, rows, path, stages, model_rows):
+    """Run the selected stages on one synthetic file and return one record per timed step."""
+    import pandas as pd
+
+    from cpd_pipeline.instrument import count_rows, measure
+
+    records = []
+
+    def timed(stage, step, func, *args, **kwargs):
+        with measure(f'bench/{name}/{step}', log=False) as record:
+            result = func(*args, **kwargs)
+        records.append({'dataset': name, 'rows': rows, 'stage': stage, 'step': step,
+                        'wall_seconds': record['wall_seconds'], 'cpu_seconds': record['cpu_seconds'],
+                        'peak_rss_mb': record['peak_rss_mb'], 'rows_out': count_rows(result)})
+        return result
+
+    from cpd_pipeline.schemas import read_csv_typed
+
+    #the typed frame and its parquet copy are needed by every later stage
+    df = timed('load', 'read_csv_typed', read_csv_typed, path, name) if 'load' in stages else read_csv_typed(path, name)
+    parquet = path.with_suffix('.parquet')
+    if not parquet.exists() or parquet.stat().st_mtime < path.stat().st_mtime:
+        df.to_parquet(parquet, index=False)
+    if 'load' in stages:
+        timed('load', 'read_parquet', pd.read_parquet, parquet)
+
+    if 'profile' in stages:
+        from cpd_pipeline.profiling import profile_dataframe
+
+        timed('profile', 'profile_approximate', profile_dataframe, df, name, approximate=True)
+
+    if 'aggregate' in stages:
+        from cpd_pipeline.rollup import rollup_frame
+
+        if name == 'calls':
+            from cpd_pipeline.streaming import aggregate_calls
+
+            timed('aggregate', 'aggregate_calls_stream', aggregate_calls, parquet)
+        timed('aggregate', 'rollup_frame', rollup_frame, df, name)
+
+    X = y = None
+    if 'features' in stages or 'model' in stages:
+        if name == 'calls':
+            from cpd_pipeline.features import response_time_features
+
+            X, y, _ = timed('features', 'response_time_features', response_time_features, df, fill='drop')
+        elif name == 'shootings' and 'features' in stages:
+            from cpd_pipeline.encoding import build_shootings_preprocessor
+
+            timed('features', 'shootings_preprocessor', build_shootings_preprocessor().fit_transform, df)
+
+    if 'model' in stages and X is not None:
+        from cpd_pipeline.training import train_response_time_models
+
+        frac = min(1.0, model_rows / len(y)) if len(y) else 1.0
+        for kind in ('linear', 'hgb'):
+            timed('model', f'train_{kind}', train_response_time_models, X, y, kinds=(kind,),
+                  sample_frac=frac if frac < 1 else None)
+    return records
+
+
+def _run_isolated(name, rows, bench_dir, stages, model_rows):
+    #library steps log to data/runs by default, keep benchmark runs out of that log
+    os.environ['CPD_STAGE_LOG'] = os.devnull
+    #time the steps themselves, not memoized results
+    os.environ['CPD_MEMO'] = '0'
+    path = synthetic_file(name, rows, bench_dir)
+    return bench_dataset(name, rows, path, stages, model_rows)
+
+
+def run_suite(sizes, datasets, stages, bench_dir, model_rows=1_000_000):
+    records = []
+    for rows in sizes:
+        for name in datasets:
+            #a fresh process per run, so peak rss is not inherited from a bigger earlier run
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+                result = pool.submit(_run_isolated, name, rows, str(bench_dir), stages, model_rows).result()
+            for r in result:
+                print(f"{r['dataset']:<13} {r['rows']:>11,} {r['step']:<24} {r['wall_seconds']:>9.3f}s "
+                      f"cpu {r['cpu_seconds']:>9.3f}s  rss {r['peak_rss_mb'] or 0:>8.1f} MB", flush=True)
+            records.extend(result)
+    return records
+
+
+def save_results(records, out_dir=RESULTS_DIR):
+    commit, dirty = git_commit()
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    path = out_dir / f"{commit}{'-dirty' if dirty else ''}.json"
+    previous = json.loads(path.read_text())['records'] if path.exists() else []
+    #a rerun of the same step on the same commit replaces the old number
+    keys = {(r['dataset'], r['rows'], r['step']) for r in records}
+    merged = [r for r in previous if (r['dataset'], r['rows'], r['step']) not in keys] + records
+    path.write_text(json.dumps({
+        'commit': commit, 'dirty': dirty, 'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+        'records': merged,
+    }, indent=2))
+    return path
+
+
+def _results_file(ref, out_dir=RESULTS_DIR):
+    path = Path(ref)
+    if path.exists():
+        return path
+    if ref == 'HEAD':
+        commit, dirty = git_commit()
+        ref = f"{commit}{'-dirty' if dirty else ''}"
+    matches = sorted(Path(out_dir).glob(f'{ref}*.json'))
+    if not matches:
+        raise SystemExit(f'no benchmark results for {ref!r} in {out_dir}')
+    return matches[0]
+
+
+def compare(base, head, threshold=1.10, out_dir=RESULTS_DIR):
+    """Wall time ratio head / base per step; ratios above ``threshold`` are marked as regressions."""
+    import pandas as pd
+
+    frames = []
+    for label, ref in (('base', base), ('head', head)):
+        records = json.loads(_results_file(ref, out_dir).read_text())['records']
+        frames.append(pd.DataFrame(records).set_index(['dataset', 'rows', 'step'])['wall_seconds'].rename(label))
+    table = pd.concat(frames, axis=1, join='inner')
+    table['ratio'] = (table['head'] / table['base']).round(3)
+    table['regression'] = table['ratio'] > threshold
+    return table.sort_values('ratio', ascending=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10k,100k,1m', help='comma separated row counts, e.g. 10k,1m,50m')
+    parser.add_argument('--datasets', default=','.join(DATASETS))
+    parser.add_argument('--stages', default=','.join(STAGES))
+    parser.add_argument('--bench-dir', type=Path, default=ROOT / 'data' / 'bench')
+    parser.add_argument('--model-rows', type=int, default=1_000_000, help='training rows cap for the model stage')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'HEAD'), help='compare two saved results')
+    parser.add_argument('--threshold', type=float, default=1.10)
+    args = parser.parse_args()
+
+    if args.compare:
+        table = compare(*args.compare, threshold=args.threshold)
+        print(table.to_string())
+        return 1 if table['regression'].any() else 0
+
+    stages = [s for s in args.stages.split(',') if s]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f'unknown stages {sorted(unknown)}, expected some of {STAGES}')
+    records = run_suite([parse_size(s) for s in args.sizes.split(',')], args.datasets.split(','), stages,
+                        args.bench_dir, args.model_rows)
+    print(f'results saved to {save_results(records)}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
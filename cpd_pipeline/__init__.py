@@ -0,0 +1,22 @@
+"""Data pipeline helpers for the Cincinnati crime and police data project."""
+
+import importlib
+
+#submodule of each public name, imported on first use so the cli starts fast
+_EXPORTS = {
+    'SocrataClient': 'socrata',
+    'SocrataError': 'socrata',
+    'benchmark_load': 'cache',
+    'load_dataset': 'cache',
+    'load_store': 'sync',
+    'sync_dataset': 'sync',
+}
+
+__all__ = ['SocrataClient', 'SocrataError', 'benchmark_load', 'load_dataset', 'load_store',
+           'sync_dataset']
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    return getattr(importlib.import_module(f'.{_EXPORTS[name]}', __name__), name)
@@ -0,0 +1,116 @@
+"""Command line entry point: ``python -m cpd_pipeline run --stage ...``.
+
+Folder options are applied through the ``CPD_*`` environment variables
+before any pipeline module is imported, so they replace the paths in
+``config`` everywhere.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+
+def _parse_param(text):
+    """``stage.key=value`` with ``value`` read as JSON when possible."""
+    key, sep, value = text.partition('=')
+    name, dot, field = key.partition('.')
+    if not sep or not dot:
+        raise argparse.ArgumentTypeError(f'expected stage.key=value, got {text!r}')
+    try:
+        value = json.loads(value)
+    except json.JSONDecodeError:
+        pass
+    return name, field, value
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m cpd_pipeline', description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', help='data folder (CPD_DATA_DIR)')
+    parser.add_argument('--raw-dir', help='folder with the raw csv exports (CPD_RAW_DIR)')
+    parser.add_argument('--cache-dir', help='folder for the typed parquet cache (CPD_CACHE_DIR)')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('list', help='show the stages with their inputs and outputs')
+
+    run = commands.add_parser('run', help='run stages whose inputs changed')
+    run.add_argument('--stage', action='append', dest='stages', metavar='NAME',
+                     help='stage to run (with its upstream stages), repeatable; default: all default stages')
+    run.add_argument('--force', action='store_true', help='run even if nothing changed')
+    run.add_argument('--dry-run', action='store_true', help='only show what would run')
+    run.add_argument('-p', '--param', action='append', type=_parse_param, default=[], metavar='STAGE.KEY=VALUE',
+                     help='override a stage parameter, e.g. train_response_time.sample_frac=0.1')
+    run.add_argument('--profile', action='append', default=[], metavar='STEP',
+                     help='run this stage or step (e.g. rollup/load_dataset) under cProfile, repeatable')
+    run.add_argument('--memory-budget', type=float, metavar='MB',
+                     help='memory budget of grouped aggregations before they spill to disk (CPD_MEMORY_BUDGET_MB)')
+
+    serve = commands.add_parser('serve', help='answer count queries over HTTP on localhost')
+    serve.add_argument('--port', type=int, default=8765)
+    serve.add_argument('--dataset', action='append', dest='datasets', metavar='NAME',
+                       help='dataset to serve, repeatable; default: all four')
+    serve.add_argument('--result-cache', type=int, default=256, metavar='N', help='query results kept in memory')
+
+    stats = commands.add_parser('stats', help='rank the slowest steps of a run')
+    stats.add_argument('--run', default='last', help="run id, 'last' (default) or 'all'")
+    stats.add_argument('--top', type=int, default=15)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    for option, env in (('data_dir', 'CPD_DATA_DIR'), ('raw_dir', 'CPD_RAW_DIR'), ('cache_dir', 'CPD_CACHE_DIR')):
+        if getattr(args, option):
+            os.environ[env] = getattr(args, option)
+    if getattr(args, 'memory_budget', None):
+        os.environ['CPD_MEMORY_BUDGET_MB'] = str(args.memory_budget)
+    if getattr(args, 'profile', None):
+        os.environ['CPD_PROFILE'] = ','.join(args.profile)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format='%(asctime)s %(message)s')
+
+    from .runner import PipelineError, run
+    from .stages import STAGES
+
+    if args.command == 'list':
+        for st in STAGES.values():
+            flag = '' if st.default else ' (not default)'
+            print(f'{st.name}{flag}')
+            for p in st.inputs:
+                print(f'  < {p}')
+            for p in st.outputs:
+                print(f'  > {p}')
+        return 0
+
+    if args.command == 'serve':
+        from .service import QueryService, serve
+
+        serve(QueryService(args.datasets, cache_size=args.result_cache), port=args.port)
+        return 0
+
+    if args.command == 'stats':
+        from .instrument import summary
+
+        table = summary(run_id=None if args.run == 'all' else args.run, top=args.top)
+        print(table.to_string() if len(table) else 'no records')
+        return 0
+
+    params = {}
+    for name, field, value in args.param:
+        params.setdefault(name, {})[field] = value
+    try:
+        results = run(args.stages, force=args.force, dry_run=args.dry_run, params=params)
+    except PipelineError as e:
+        print(f'error: {e}', file=sys.stderr)
+        return 2
+    for row in results:
+        extra = f" {row['result']}" if row.get('result') else ''
+        if row.get('missing'):
+            extra = f" missing {', '.join(row['missing'])}"
+        print(f"{row['stage']:<28} {row['status']:<10} {row['seconds']:>8.2f}s{extra}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
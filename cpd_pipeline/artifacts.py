@@ -0,0 +1,113 @@
+"""Saved model / preprocessor artifacts and a batch scoring API.
+
+``save_artifacts`` writes a fitted model (and optional preprocessor) with
+joblib, uncompressed so their NumPy arrays can be memory mapped on load,
+together with ``meta.json``: a content hash of the training data, the
+feature schema and the label order used to code categorical columns.
+
+``Scorer`` loads an artifact directory once and scores new calls in
+vectorized batches, recording the latency of every batch.
+"""
+
+import hashlib
+import json
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import joblib
+import numpy as np
+import sklearn
+
+from .config import DATA_DIR
+from .features import FEATURE_NAMES, feature_matrix
+from .hashing import fingerprint
+
+
+def models_dir():
+    return DATA_DIR / 'models'
+
+
+def save_artifacts(name, model, X_train, y_train=None, preprocessor=None, labels=None,
+                   features='response_time', feature_names=None, root=None):
+    """Save a fitted model (and preprocessor) under ``<root>/<name>/`` and return the directory.
+
+    ``features='response_time'`` means scoring builds the input with
+    ``features.feature_matrix`` using the saved ``labels``; ``None`` means the
+    batch goes to the preprocessor (or straight to the model) as given.
+    """
+    out = Path(root or models_dir()) / name
+    out.mkdir(parents=True, exist_ok=True)
+    #compress=0 keeps the arrays as raw buffers that joblib can memory map
+    joblib.dump(model, out / 'model.joblib', compress=0)
+    if preprocessor is not None:
+        joblib.dump(preprocessor, out / 'preprocessor.joblib', compress=0)
+
+    if feature_names is None and features == 'response_time':
+        feature_names = FEATURE_NAMES
+    meta = {
+        'name': name,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'model_class': type(model).__name__,
+        'sklearn_version': sklearn.__version__,
+        'data_hash': fingerprint(X_train, y_train),
+        'train_rows': int(X_train.shape[0]),
+        'features': features,
+        'feature_names': list(feature_names) if feature_names is not None else None,
+        'labels': {col: [str(v) for v in values] for col, values in (labels or {}).items()},
+        'has_preprocessor': preprocessor is not None,
+    }
+    meta['schema_hash'] = hashlib.sha256(json.dumps(
+        {k: meta[k] for k in ('features', 'feature_names', 'labels')}, sort_keys=True).encode()).hexdigest()[:12]
+    (out / 'meta.json').write_text(json.dumps(meta, indent=2))
+    return out
+
+
+def load_meta(name, root=None):
+    return json.loads((Path(root or models_dir()) / name / 'meta.json').read_text())
+
+
+class Scorer:
+    """Load a saved artifact once and score batches of new rows.
+
+    With ``mmap=True`` the model's arrays are memory mapped read-only, so
+    several scoring processes share one copy through the page cache.
+    """
+
+    def __init__(self, name, root=None, mmap=True):
+        self.path = Path(root or models_dir()) / name
+        self.meta = json.loads((self.path / 'meta.json').read_text())
+        mmap_mode = 'r' if mmap else None
+        self.model = joblib.load(self.path / 'model.joblib', mmap_mode=mmap_mode)
+        self.preprocessor = None
+        if self.meta.get('has_preprocessor'):
+            self.preprocessor = joblib.load(self.path / 'preprocessor.joblib', mmap_mode=mmap_mode)
+        self.latencies = []
+
+    def prepare(self, batch):
+        if self.meta.get('features') == 'response_time':
+            X, _ = feature_matrix(batch, labels=self.meta.get('labels'))
+        else:
+            X = batch
+        if self.preprocessor is not None:
+            X = self.preprocessor.transform(X)
+        return X
+
+    def score(self, batch):
+        """Predictions for one batch (a DataFrame of calls), as a float array."""
+        start = time.perf_counter()
+        predictions = np.asarray(self.model.predict(self.prepare(batch)))
+        self.latencies.append(time.perf_counter() - start)
+        return predictions
+
+    def score_batches(self, frame, batch_size=10_000):
+        """Score a large frame in ``batch_size`` slices and return all predictions."""
+        parts = [self.score(frame.iloc[i:i + batch_size]) for i in range(0, len(frame), batch_size)]
+        return np.concatenate(parts) if parts else np.empty(0)
+
+    def latency_percentiles(self, percentiles=(50, 90, 99)):
+        """Batch latency percentiles in milliseconds."""
+        if not self.latencies:
+            return {}
+        values = np.percentile(np.asarray(self.latencies) * 1000, percentiles)
+        return {f'p{p}': round(float(v), 3) for p, v in zip(percentiles, values)}
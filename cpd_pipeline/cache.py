@@ -0,0 +1,155 @@
+"""Typed Parquet cache in front of the raw csv exports.
+
+``load_dataset(name)`` parses a raw csv once and writes a Parquet copy next to
+a small manifest holding the source file's size, mtime and sha256. Later loads
+read the Parquet file (memory mapped, only the requested columns) as long as
+the source file is unchanged.
+
+Rows that can't be parsed are kept out of the cache and written to
+``data/quarantine/<name>.parquet``. Rows failing the other validation rules
+are cached with their rule codes in ``quality_flags``. The manifest holds
+the per-rule counts.
+"""
+
+import hashlib
+import json
+import logging
+import time
+from pathlib import Path
+
+import pyarrow.parquet as pq
+
+from .config import CACHE_DIR, RAW_DIR, RAW_FILES
+from .instrument import instrumented, measure
+from .schemas import read_csv_typed, schema_hash
+from .validation import Validator, rules_hash
+
+logger = logging.getLogger(__name__)
+
+
+def raw_path(name):
+    if name not in RAW_FILES:
+        raise KeyError(f'unknown dataset {name!r}, expected one of {sorted(RAW_FILES)}')
+    return Path(RAW_DIR) / RAW_FILES[name]
+
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _manifest_path(name):
+    return Path(CACHE_DIR) / f'{name}.json'
+
+
+def _read_manifest(name):
+    path = _manifest_path(name)
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+
+def _write_manifest(name, manifest):
+    path = _manifest_path(name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(manifest, indent=2))
+
+
+def _cached_file(name, source):
+    """Return the cached parquet path if it still matches the source file, else None."""
+    manifest = _read_manifest(name)
+    if manifest is None or not (Path(CACHE_DIR) / manifest['cache_file']).exists():
+        return None
+    if manifest.get('schema') != schema_hash(name) or manifest.get('rules') != rules_hash(name):
+        return None
+    stat = source.stat()
+    if manifest['size'] == stat.st_size and manifest['mtime_ns'] == stat.st_mtime_ns:
+        return Path(CACHE_DIR) / manifest['cache_file']
+    #the file was touched, only rebuild if the contents really changed
+    if manifest['size'] == stat.st_size and manifest['sha256'] == file_sha256(source):
+        manifest['mtime_ns'] = stat.st_mtime_ns
+        _write_manifest(name, manifest)
+        return Path(CACHE_DIR) / manifest['cache_file']
+    return None
+
+
+def read_raw(name, **kwargs):
+    """Parse the raw csv of a dataset with the column types from its schema."""
+    return read_csv_typed(raw_path(name), name, **kwargs)
+
+
+def build_cache(name, validate=True):
+    """Parse the raw csv and write its typed parquet copy, returns the parquet path."""
+    source = raw_path(name)
+    stat = source.stat()
+    sha = file_sha256(source)
+    validator = Validator(name) if validate else None
+    with measure('read_csv') as record:
+        df = read_raw(name, validator=validator)
+        record['rows_out'] = len(df)
+        if validator is not None:
+            record['validation'] = validator.close()
+            if validator.quarantined or validator.flagged:
+                logger.warning('%s: %d of %d rows quarantined, %d flagged %s', name, validator.quarantined,
+                               validator.rows, validator.flagged, {k: v for k, v in validator.counts.items() if v})
+
+    cache_dir = Path(CACHE_DIR)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    cache_file = f'{name}-{sha[:16]}.parquet'
+    df.to_parquet(cache_dir / cache_file, index=False)
+
+    #remove parquet files left over from older versions of the source
+    for old in cache_dir.glob(f'{name}-*.parquet'):
+        if old.name != cache_file:
+            old.unlink()
+    _write_manifest(name, {
+        'source': str(source), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+        'sha256': sha, 'schema': schema_hash(name), 'cache_file': cache_file, 'rows': len(df),
+        'rules': rules_hash(name) if validate else None,
+        'validation': validator.stats() if validator is not None else None,
+    })
+    return cache_dir / cache_file
+
+
+def cached_path(name):
+    """Path of the up to date parquet copy of a dataset and whether it was already cached."""
+    path = _cached_file(name, raw_path(name))
+    if path is not None:
+        return path, True
+    return build_cache(name), False
+
+
+@instrumented
+def load_dataset(name, columns=None):
+    """Load a dataset from its parquet cache, parsing the raw csv only when needed."""
+    start = time.perf_counter()
+    path, hit = cached_path(name)
+    df = pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+    logger.info('loaded %s (%d rows) from %s in %.3fs', name, len(df),
+                'cache' if hit else 'csv', time.perf_counter() - start)
+    return df
+
+
+def clear_cache(name=None):
+    names = [name] if name else list(RAW_FILES)
+    for n in names:
+        for old in Path(CACHE_DIR).glob(f'{n}-*.parquet'):
+            old.unlink()
+        _manifest_path(n).unlink(missing_ok=True)
+
+
+def benchmark_load(name, columns=None):
+    """Time a cold load (csv parse and cache build) against a warm load from the cache."""
+    clear_cache(name)
+    start = time.perf_counter()
+    load_dataset(name, columns=columns)
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    load_dataset(name, columns=columns)
+    warm = time.perf_counter() - start
+    return {'dataset': name, 'cold_seconds': round(cold, 3), 'warm_seconds': round(warm, 3),
+            'speedup': round(cold / warm, 1) if warm else None}
@@ -0,0 +1,231 @@
+"""Headless rendering of the notebook's charts from pre-aggregated tables.
+
+Charts never see raw rows. Each one takes a small table (a pivot such as
+``RollupCube.pivot`` or the ``calls_summary`` counts). Before drawing:
+
+* dense series are binned to at most ``max_points`` x values (``downsample``)
+* extra series or categories are folded into ``OTHER`` (``limit_series``)
+* bar labels are only drawn when there are few bars
+
+``render_all`` draws a batch of charts in worker processes with the Agg
+backend, as PNG / SVG files for matplotlib charts and compact JSON for
+plotly figures. It keeps a manifest with a hash of every chart's table and
+options, and skips charts whose input has not changed.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .config import DATA_DIR
+from .instrument import measure
+
+CHARTS = {}
+
+HOUR_LABELS = [f"{(i % 12) + 1} {'am' if i < 12 else 'pm'}" for i in range(24)]
+
+
+def chart(name, kind, **options):
+    """Register a chart: ``kind`` is ``line``, ``scatter``, ``grouped_bar`` or ``stacked_bar``."""
+    CHARTS[name] = {'kind': kind, **options}
+
+
+#the four charts of the notebook
+chart('hourly_incidents', 'line', title='Incidents by Hour for Top 3 Neighborhoods',
+      xlabel='Hour of the Day', ylabel='Incident Count', legend='Neighborhood', hour_ticks=True)
+chart('monthly_shootings', 'scatter', title='Monthly Shootings Count in 2024',
+      xlabel='Month', ylabel='Number of Shootings')
+chart('use_of_force_types', 'grouped_bar', title='Use of Force Incidents by Incident Type in Top 5 Neighborhoods',
+      xlabel='Incident Type', ylabel='Number of Use of Force Incidents', legend='Neighborhood', figsize=(16, 10))
+chart('calls_day_type', 'stacked_bar', title='Top Incident Types by Day of the Week',
+      xlabel='Day of the Week', ylabel='Number of Incidents', legend='Incident Type', formats=('json',))
+
+
+def charts_dir():
+    return DATA_DIR / 'charts'
+
+
+def downsample(table, max_points=1000, how='mean'):
+    """Bin consecutive rows of a (wide) series table so it has at most ``max_points`` rows.
+
+    Each bin is labelled with its first index value; ``how`` is any groupby
+    aggregation (``'mean'``, ``'max'``, ``'sum'``).
+    """
+    if len(table) <= max_points:
+        return table
+    bins = np.arange(len(table)) * max_points // len(table)
+    labels = table.index[np.searchsorted(bins, np.arange(max_points))]
+    out = table.groupby(bins).agg(how)
+    out.index = labels
+    return out
+
+
+def limit_series(table, max_series=10, other='OTHER'):
+    """Keep the ``max_series`` largest columns of a wide table and sum the rest into ``other``."""
+    if table.shape[1] <= max_series:
+        return table
+    order = table.sum().sort_values(ascending=False).index
+    out = table[order[:max_series - 1]].copy()
+    out[other] = table[order[max_series - 1:]].sum(axis=1)
+    return out
+
+
+def table_hash(table, options):
+    """Hash of a table's values, index, columns and the chart's options and code."""
+    digest = hashlib.sha256()
+    frame = table.to_frame() if isinstance(table, pd.Series) else table
+    digest.update(pd.util.hash_pandas_object(frame.reset_index(), index=False).to_numpy().tobytes())
+    digest.update(repr((list(map(str, frame.columns)), str(frame.index.name))).encode())
+    digest.update(json.dumps(options, sort_keys=True, default=str).encode())
+    for func in (_prepare, _draw_matplotlib, _draw_plotly):
+        digest.update(inspect.getsource(func).encode())
+    return digest.hexdigest()
+
+
+def _prepare(table, spec):
+    if isinstance(table, pd.Series):
+        table = table.to_frame(table.name or 'count')
+    if spec['kind'] in ('line', 'scatter'):
+        table = downsample(table, spec.get('max_points', 1000))
+    if spec['kind'] != 'stacked_bar':
+        table = limit_series(table, spec.get('max_series', 10))
+    return table
+
+
+def _draw_matplotlib(table, spec, paths):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=spec.get('figsize', (12, 6)))
+    kind = spec['kind']
+    if kind == 'line':
+        #no markers once the series is dense
+        marker = 'o' if len(table) <= 60 else None
+        for col in table.columns:
+            ax.plot(table.index, table[col], marker=marker, label=str(col))
+        if spec.get('hour_ticks') and len(table) <= 24:
+            ax.set_xticks(range(24), HOUR_LABELS, rotation=45)
+    elif kind == 'scatter':
+        for col in table.columns:
+            ax.scatter([str(i) for i in table.index], table[col], alpha=0.7, s=100, label=str(col))
+        ax.tick_params(axis='x', rotation=45)
+        ax.grid(axis='y')
+    elif kind in ('grouped_bar', 'stacked_bar'):
+        table.plot(kind='bar', width=0.8, ax=ax, stacked=kind == 'stacked_bar')
+        ax.tick_params(axis='x', rotation=45)
+        plt.setp(ax.get_xticklabels(), ha='right')
+        ax.grid(axis='y', linestyle='--', alpha=0.7)
+        if table.size <= spec.get('max_labels', 60):
+            for container in ax.containers:
+                ax.bar_label(container, fontsize=8)
+    ax.set_title(spec.get('title', ''))
+    ax.set_xlabel(spec.get('xlabel', ''))
+    ax.set_ylabel(spec.get('ylabel', ''))
+    if table.shape[1] > 1 or spec.get('legend'):
+        ax.legend(title=spec.get('legend'), bbox_to_anchor=(1.05, 1), loc='upper left')
+    fig.tight_layout()
+    for path in paths:
+        fig.savefig(path, dpi=spec.get('dpi', 100))
+    plt.close(fig)
+
+
+def _draw_plotly(table, spec, path):
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+    show_text = table.size <= spec.get('max_labels', 60)
+    for col in table.columns:
+        values = table[col].to_numpy()
+        fig.add_bar(x=[str(i) for i in table.index], y=values, name=str(col),
+                    text=values if show_text else None)
+    fig.update_layout(barmode='stack' if spec['kind'] == 'stacked_bar' else 'group', title=spec.get('title'),
+                      xaxis_title=spec.get('xlabel'), yaxis_title=spec.get('ylabel'),
+                      legend_title=spec.get('legend'), margin=dict(l=40, r=40, t=40, b=40),
+                      template='none')
+    #no template, no pretty printing: the json holds only the data and layout
+    path.write_text(fig.to_json(pretty=False))
+
+
+def _draw(name, table, spec, out_dir):
+    table = _prepare(table, spec)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    formats = spec.get('formats', ('png',))
+    paths = {fmt: out_dir / f'{name}.{fmt}' for fmt in formats}
+    with measure(f'chart_{name}', rows_in=len(table)):
+        images = [p for fmt, p in paths.items() if fmt in ('png', 'svg')]
+        if images:
+            _draw_matplotlib(table, spec, images)
+        if 'json' in paths:
+            _draw_plotly(table, spec, paths['json'])
+    return [str(p) for p in paths.values()]
+
+
+def wide(table, index, columns, values='counts', order=None):
+    """Long counts table to the wide table the charts take, like ``pivot`` with zeros filled."""
+    out = table.pivot_table(index=index, columns=columns, values=values, aggfunc='sum', fill_value=0,
+                            observed=True)
+    if order is not None:
+        out = out.reindex([o for o in order if o in out.index])
+    return out
+
+
+def _manifest_path(out_dir):
+    return Path(out_dir) / 'charts.json'
+
+
+def render_all(tables, out_dir=None, workers=None, force=False, **overrides):
+    """Render ``{chart name: table}`` and return ``{name: 'rendered' | 'skipped'}``.
+
+    ``overrides`` maps chart names to option dicts merged over the registered
+    spec (for example ``calls_day_type={'formats': ('json', 'svg')}``).
+    """
+    out_dir = Path(out_dir or charts_dir())
+    manifest_path = _manifest_path(out_dir)
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+
+    jobs, status = {}, {}
+    for name, table in tables.items():
+        spec = {**CHARTS.get(name, {'kind': 'line'}), **overrides.get(name, {})}
+        digest = table_hash(table, spec)
+        old = manifest.get(name, {})
+        if not force and old.get('hash') == digest and all(Path(p).exists() for p in old.get('files', [])):
+            status[name] = 'skipped'
+        else:
+            jobs[name] = (table, spec, digest)
+
+    if jobs:
+        workers = workers or min(len(jobs), os.cpu_count() or 1)
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {name: pool.submit(_draw, name, t, s, out_dir) for name, (t, s, _) in jobs.items()}
+                files = {name: f.result() for name, f in futures.items()}
+        else:
+            files = {name: _draw(name, t, s, out_dir) for name, (t, s, _) in jobs.items()}
+        for name, (_, _, digest) in jobs.items():
+            manifest[name] = {'hash': digest, 'files': files[name]}
+            status[name] = 'rendered'
+        out_dir.mkdir(parents=True, exist_ok=True)
+        manifest_path.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    return status
+
+
+def notebook_tables(cube, day_type_counts, year=2024):
+    """The input tables of the notebook's four charts from the rollup cube and the calls summary."""
+    from .streaming import DAY_ORDER, MONTH_ORDER, top_incident_types
+
+    monthly = cube.query('shootings', 'month_name', start=f'{year}-01-01', end=f'{year + 1}-01-01')
+    top_types = top_incident_types(day_type_counts)
+    return {
+        'hourly_incidents': cube.pivot('crime_incidents', 'hour', 'neighborhood', top_columns=3),
+        'monthly_shootings': monthly.reindex(MONTH_ORDER).rename('shootings'),
+        'use_of_force_types': cube.pivot('use_of_force', 'incident_type', 'neighborhood', top_columns=5),
+        'calls_day_type': wide(top_types, 'DAY_OF_WEEK', 'INCIDENT_TYPE_ID', order=DAY_ORDER),
+    }
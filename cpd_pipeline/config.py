@@ -0,0 +1,29 @@
+import os
+from pathlib import Path
+
+#socrata open data portal for the city of cincinnati
+SOCRATA_DOMAIN = os.environ.get('CPD_SOCRATA_DOMAIN', 'https://data.cincinnati-oh.gov')
+
+#socrata dataset ids used by the notebook
+CRIME_INCIDENTS_ID = 'k59e-2pvf'
+CALLS_FOR_SERVICE_ID = 'gexm-h6bt'
+
+#local folder for downloaded and derived data
+DATA_DIR = Path(os.environ.get('CPD_DATA_DIR', 'data'))
+
+#raw csv exports saved from the open data portal
+RAW_DIR = Path(os.environ.get('CPD_RAW_DIR', DATA_DIR / 'raw'))
+
+#typed parquet copies of the raw csv files
+CACHE_DIR = Path(os.environ.get('CPD_CACHE_DIR', DATA_DIR / 'cache'))
+
+#memory budget of the grouped aggregations, past it their partial tables spill to disk
+MEMORY_BUDGET_MB = float(os.environ.get('CPD_MEMORY_BUDGET_MB', 512))
+
+#file name of each raw csv export inside RAW_DIR
+RAW_FILES = {
+    'crime_incidents': 'PDI__Police_Data_Initiative__Crime_Incidents.csv',
+    'shootings': 'CPD_Reported_Shootings_20241026.csv',
+    'use_of_force': 'PDI__Police_Data_Initiative__Use_of_Force_20241026.csv',
+    'calls': 'PDI__Police_Data_Initiative__Police_Calls_for_Service.csv',
+}
@@ -0,0 +1,158 @@
+"""Bounded-cardinality, sparse preprocessing for the shootings data.
+
+The notebook's ``preprocessor`` one-hot encodes ``StreetBlock`` and
+``DateTimeOccured``, which are close to unique per row, so the matrix gets
+almost as many columns as rows. ``build_shootings_preprocessor`` instead:
+
+* one-hot encodes the low cardinality labels with a cap
+  (``max_categories``/``min_frequency``), rare values share an infrequent column
+* hashes ``StreetBlock`` into a fixed number of columns, or target encodes it
+* splits ``DateTimeOccured`` into the parts the numeric columns don't already
+  hold (month, day, day of week)
+
+and keeps the output a float32 CSR sparse matrix end to end.
+"""
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.compose import ColumnTransformer
+from sklearn.feature_extraction import FeatureHasher
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer, OneHotEncoder, StandardScaler, TargetEncoder
+
+from .memo import memoize
+
+NUMERICAL_FEATURES = ['LATITUDE_X', 'LONGITUDE_X', 'Age', 'YearOccurred', 'DateOccurred', 'TimeOccurred']
+CATEGORICAL_FEATURES = ['District', 'SNA_NEIGHBORHOOD', 'Race', 'Sex', 'Type', 'COMMUNITY_COUNCIL_NEIGHBORHOOD']
+HIGH_CARDINALITY_FEATURES = ['StreetBlock']
+DATETIME_FEATURES = ['DateTimeOccured']
+DATETIME_PARTS = ('month', 'day', 'dayofweek')
+
+
+def _as_float32(X):
+    """float32 array of the numeric columns, NaN for missing values.
+
+    Typed frames (``apply_schema``) hold ``DateOccurred`` as datetime64 and
+    nullable ``Int16`` columns, which ``np.asarray`` can't cast. Dates become
+    YYYYMMDD numbers, the same values the raw csv holds.
+    """
+    if not isinstance(X, pd.DataFrame):
+        return np.asarray(X, dtype=np.float32)
+    columns = []
+    for _, col in X.items():
+        if pd.api.types.is_datetime64_any_dtype(col):
+            col = col.dt.year * 10000 + col.dt.month * 100 + col.dt.day
+        columns.append(col.to_numpy(dtype=np.float64, na_value=np.nan))
+    return np.column_stack(columns).astype(np.float32) if columns else np.empty((len(X), 0), dtype=np.float32)
+
+
+class DateTimeParts(BaseEstimator, TransformerMixin):
+    """Turn timestamp columns into numeric parts; unparseable values become NaN."""
+
+    PARTS = ('year', 'month', 'day', 'hour', 'dayofweek')
+
+    def __init__(self, format=None, parts=PARTS):
+        self.format = format
+        self.parts = parts
+
+    def fit(self, X, y=None):
+        self.columns_ = list(X.columns) if hasattr(X, 'columns') else list(range(X.shape[1]))
+        return self
+
+    def transform(self, X):
+        X = pd.DataFrame(X)
+        parts = []
+        for col in X.columns:
+            ts = pd.to_datetime(X[col], format=self.format, errors='coerce')
+            parts.extend(getattr(ts.dt, part).to_numpy(dtype=np.float32, na_value=np.nan)
+                         for part in self.parts)
+        return np.column_stack(parts)
+
+    def get_feature_names_out(self, input_features=None):
+        return np.array([f'{col}_{part}' for col in self.columns_ for part in self.parts], dtype=object)
+
+
+class StringHasher(BaseEstimator, TransformerMixin):
+    """Hash each column's string value (as ``column=value``) into ``n_features`` sparse columns."""
+
+    def __init__(self, n_features=256):
+        self.n_features = n_features
+
+    def fit(self, X, y=None):
+        return self
+
+    def transform(self, X):
+        X = pd.DataFrame(X).astype('string').fillna('')
+        tokens = (X.columns.astype(str).to_numpy() + '=') + X.to_numpy(dtype=object)
+        hasher = FeatureHasher(n_features=self.n_features, input_type='string', alternate_sign=False)
+        return hasher.transform(tokens.tolist()).tocsr().astype(np.float32)
+
+    def get_feature_names_out(self, input_features=None):
+        return np.array([f'hash_{i}' for i in range(self.n_features)], dtype=object)
+
+
+def build_shootings_preprocessor(max_categories=30, min_frequency=10, high_cardinality='hash',
+                                 hash_features=256, datetime_format=None):
+    """ColumnTransformer for the shootings features that always returns a CSR matrix.
+
+    ``high_cardinality`` is ``'hash'`` (no target needed) or ``'target'``
+    (``TargetEncoder``, which needs ``y`` in ``fit``).
+    """
+    numerical = Pipeline(steps=[
+        #a float64 block would make the whole stacked matrix float64
+        ('float32', FunctionTransformer(_as_float32, feature_names_out='one-to-one')),
+        ('imputer', SimpleImputer(strategy='median')),
+        #with_mean=False keeps sparse inputs sparse
+        ('scaler', StandardScaler(with_mean=False)),
+    ])
+    categorical = Pipeline(steps=[
+        ('imputer', SimpleImputer(strategy='most_frequent')),
+        ('onehot', OneHotEncoder(handle_unknown='infrequent_if_exist', max_categories=max_categories,
+                                 min_frequency=min_frequency, sparse_output=True, dtype=np.float32)),
+    ])
+    if high_cardinality == 'hash':
+        high = StringHasher(n_features=hash_features)
+    elif high_cardinality == 'target':
+        high = Pipeline(steps=[
+            ('imputer', SimpleImputer(strategy='constant', fill_value='missing')),
+            ('target', TargetEncoder()),
+        ])
+    else:
+        raise ValueError(f"high_cardinality must be 'hash' or 'target', got {high_cardinality!r}")
+    datetime = Pipeline(steps=[
+        #year and hour are already YearOccurred and TimeOccurred
+        ('parts', DateTimeParts(format=datetime_format, parts=DATETIME_PARTS)),
+        ('imputer', SimpleImputer(strategy='median')),
+        ('scaler', StandardScaler(with_mean=False)),
+    ])
+    return ColumnTransformer(
+        transformers=[
+            ('num', numerical, NUMERICAL_FEATURES),
+            ('cat', categorical, CATEGORICAL_FEATURES),
+            ('high', high, HIGH_CARDINALITY_FEATURES),
+            ('time', datetime, DATETIME_FEATURES),
+        ],
+        #any density counts as sparse, so the output is always a sparse matrix
+        sparse_threshold=1.0,
+    )
+
+
+@memoize(depends=[build_shootings_preprocessor, DateTimeParts.transform, StringHasher.transform])
+def fit_shootings_preprocessor(X, y=None, **options):
+    """Fit ``build_shootings_preprocessor(**options)`` and return ``(preprocessor, matrix)``, memoized."""
+    preprocessor = build_shootings_preprocessor(**options)
+    return preprocessor, preprocessor.fit_transform(X, y)
+
+
+def to_csr(matrix):
+    return matrix.tocsr() if sp.issparse(matrix) else sp.csr_matrix(matrix)
+
+
+def matrix_size_mb(matrix):
+    if sp.issparse(matrix):
+        matrix = matrix.tocsr()
+        return (matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes) / 2 ** 20
+    return matrix.nbytes / 2 ** 20
@@ -0,0 +1,188 @@
+"""Vectorized response-time features for the calls for service data.
+
+Replaces the regression prep cell: timestamps are parsed with a fixed format
+straight into int64 nanosecond arrays, durations are computed with NumPy, and
+the result is a float32 feature matrix built column by column without copying
+the source DataFrame.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .instrument import instrumented
+from .schemas import SOCRATA_CSV_TIME
+
+NAT = np.iinfo(np.int64).min
+NS_PER_MINUTE = 60 * 10 ** 9
+NS_PER_HOUR = 60 * NS_PER_MINUTE
+NS_PER_DAY = 24 * NS_PER_HOUR
+
+#rows parsed at a time by the fast path
+PARSE_BLOCK = 1 << 18
+
+#days in each month of a common year, index 0 unused
+DAYS_IN_MONTH = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], dtype=np.int64)
+
+FEATURE_NAMES = ['hour', 'day_of_week', 'neighborhood_code', 'incident_type_code', 'priority']
+
+#validation flags (``validation.RULES``) that make a row's response time meaningless
+RESPONSE_FLAGS = ('arrival_before_dispatch', 'response_over_24h')
+
+
+def _days_from_civil(y, m, d):
+    #days since 1970-01-01 for proleptic gregorian dates (howard hinnant's algorithm)
+    y = y - (m <= 2)
+    era = np.floor_divide(y, 400)
+    yoe = y - era * 400
+    doy = (153 * (m + np.where(m > 2, -3, 9)) + 2) // 5 + d - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+def _parse_socrata_fixed(values):
+    """Parse 'MM/DD/YYYY HH:MM:SS AM' strings by slicing bytes, returns int64 ns (NaT for bad rows).
+
+    Only strings of exactly 22 characters are sliced, the cast to ``S22``
+    would cut longer ones short. The others are returned as not ok.
+    """
+    values = np.asarray(values, dtype=object)
+    fits = np.fromiter(map(len, values), dtype=np.int64, count=len(values)) == 22
+    raw = np.where(fits, values, '').astype('S22')
+    chars = raw.view(np.uint8).reshape(len(raw), 22)
+    b = chars.astype(np.int64) - ord('0')
+
+    def num(*cols):
+        out = np.zeros(len(raw), dtype=np.int64)
+        for c in cols:
+            out = out * 10 + b[:, c]
+        return out
+
+    month, day, year = num(0, 1), num(3, 4), num(6, 7, 8, 9)
+    hour, minute, second = num(11, 12), num(14, 15), num(17, 18)
+    pm = chars[:, 20] == ord('P')
+
+    digits = b[:, [0, 1, 3, 4, 6, 7, 8, 9, 11, 12, 14, 15, 17, 18]]
+    ok = ((digits >= 0) & (digits <= 9)).all(axis=1)
+    ok &= (chars[:, [2, 5, 10, 13, 16, 19, 21]] == np.frombuffer(b'// :: M', dtype=np.uint8)).all(axis=1)
+    ok &= pm | (chars[:, 20] == ord('A'))
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    month_days = DAYS_IN_MONTH[np.clip(month, 0, 12)] + (leap & (month == 2))
+    #a day past the end of its month would roll over into the next one
+    ok &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days)
+    ok &= (hour >= 1) & (hour <= 12) & (minute < 60) & (second < 60)
+    ok &= fits
+
+    hour24 = hour % 12 + np.where(pm, 12, 0)
+    days = _days_from_civil(year, month, day)
+    ns = days * NS_PER_DAY + hour24 * NS_PER_HOUR + minute * NS_PER_MINUTE + second * 10 ** 9
+    return np.where(ok, ns, NAT), ok
+
+
+def _parse_socrata_block(values, fmt):
+    text = values.fillna('').astype(str).to_numpy(dtype=object)
+    try:
+        ns, ok = _parse_socrata_fixed(text)
+    except UnicodeEncodeError:
+        ns, ok = np.full(len(text), NAT, dtype=np.int64), np.zeros(len(text), dtype=bool)
+    #only the rows the fast path rejected go through pandas, and only if they hold text
+    retry = ~ok & (text != '')
+    if retry.any():
+        parsed = pd.to_datetime(pd.Series(text[retry]), format=fmt, errors='coerce')
+        ns[retry] = pd.DatetimeIndex(parsed).as_unit('ns').asi8
+    return ns
+
+
+def parse_timestamps(values, fmt=SOCRATA_CSV_TIME):
+    """Parse timestamps into an int64 nanosecond array, NaT as the int64 minimum.
+
+    Already parsed datetime columns are only viewed as int64. Socrata's csv
+    format is parsed with a byte-slicing fast path; rows that don't fit it fall
+    back to ``pd.to_datetime`` with the same fixed format.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return pd.DatetimeIndex(values).as_unit('ns').asi8.copy()
+    values = pd.Series(values, copy=False)
+    if fmt == SOCRATA_CSV_TIME:
+        ns = np.empty(len(values), dtype=np.int64)
+        #in blocks, so the temporary python strings of a whole column never exist at once
+        for start in range(0, len(values), PARSE_BLOCK):
+            ns[start:start + PARSE_BLOCK] = _parse_socrata_block(values.iloc[start:start + PARSE_BLOCK], fmt)
+        return ns
+    return pd.DatetimeIndex(pd.to_datetime(values, format=fmt, errors='coerce')).as_unit('ns').asi8.copy()
+
+
+def duration_minutes(start_ns, end_ns):
+    """float32 minutes between two int64 ns arrays, NaN where either side is NaT."""
+    missing = (start_ns == NAT) | (end_ns == NAT)
+    minutes = (end_ns - start_ns).astype(np.float64) / NS_PER_MINUTE
+    minutes[missing] = np.nan
+    return minutes.astype(np.float32)
+
+
+def category_codes(values, labels=None):
+    """Integer codes and labels of a label column, -1 for missing.
+
+    With ``labels`` the codes follow that fixed order (values not in it get -1),
+    which keeps scoring data coded the same way as the training data.
+    """
+    if labels is not None:
+        return pd.Categorical(values, categories=labels).codes, pd.Index(labels)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories
+    codes, labels = pd.factorize(values, sort=True)
+    return codes, labels
+
+
+def feature_matrix(df, labels=None):
+    """float32 matrix with the columns in ``FEATURE_NAMES`` and the labels of the coded columns.
+
+    Only needs the incident's creation time (or dispatch time), neighborhood,
+    incident type and priority, so it also works for calls that have no
+    arrival yet.
+    """
+    time_col = 'CREATE_TIME_INCIDENT' if 'CREATE_TIME_INCIDENT' in df else 'DISPATCH_TIME_PRIMARY_UNIT'
+    created = parse_timestamps(df[time_col])
+
+    X = np.full((len(df), len(FEATURE_NAMES)), np.nan, dtype=np.float32)
+    valid = created != NAT
+    X[valid, 0] = (created[valid] % NS_PER_DAY) // NS_PER_HOUR
+    #1970-01-01 was a thursday, shift so monday = 0 like pandas
+    X[valid, 1] = (created[valid] // NS_PER_DAY + 3) % 7
+
+    meta = {}
+    for j, col in ((2, 'SNA_NEIGHBORHOOD'), (3, 'INCIDENT_TYPE_ID')):
+        if col in df:
+            codes, meta[col] = category_codes(df[col], (labels or {}).get(col))
+            X[:, j] = np.where(codes < 0, np.nan, codes)
+    if 'PRIORITY' in df:
+        X[:, 4] = pd.to_numeric(df['PRIORITY'], errors='coerce').to_numpy(dtype=np.float32, na_value=np.nan)
+    return X, meta
+
+
+@instrumented
+def response_time_features(df, fill='mean', labels=None):
+    """Build the response-time regression inputs from a calls frame.
+
+    Returns ``(X, y, meta)``: the ``feature_matrix`` of the calls, float32
+    response minutes from dispatch to arrival, and a dict with the label
+    arrays for the coded columns. Missing targets are filled with the mean
+    (``fill='mean'``, what the notebook did), their rows dropped
+    (``fill='drop'``) or left as NaN (``fill=None``). Pass the ``meta`` of
+    the training data as ``labels`` to code new data the same way. Rows
+    whose ``quality_flags`` hold one of ``RESPONSE_FLAGS`` are always dropped.
+    """
+    dispatch = parse_timestamps(df['DISPATCH_TIME_PRIMARY_UNIT'])
+    arrival = parse_timestamps(df['ARRIVAL_TIME_PRIMARY_UNIT'])
+    y = duration_minutes(dispatch, arrival)
+    X, meta = feature_matrix(df, labels=labels)
+    if 'quality_flags' in df:
+        flagged = (df['quality_flags'].str.contains('|'.join(RESPONSE_FLAGS), regex=True)
+                   .to_numpy(dtype=bool, na_value=False))
+        X, y = X[~flagged], y[~flagged]
+
+    missing = np.isnan(y)
+    if fill == 'mean':
+        y[missing] = np.nanmean(y) if (~missing).any() else 0.0
+    elif fill == 'drop':
+        X, y = X[~missing], y[~missing]
+    return X, y, meta
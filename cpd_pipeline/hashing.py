@@ -0,0 +1,58 @@
+"""Content hashes of data, shared by the memo keys and the saved model metadata.
+
+``fingerprint`` hashes frames and series (values, column names and dtypes),
+dense and sparse arrays, files (by path, size and mtime), containers of
+those and plain values. Equal contents give equal hashes across processes.
+"""
+
+import hashlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+def _update(digest, value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        digest.update(b'frame')
+        digest.update(pd.util.hash_pandas_object(value, index=False).to_numpy().tobytes())
+        columns = value.columns if isinstance(value, pd.DataFrame) else [value.name]
+        dtypes = value.dtypes if isinstance(value, pd.DataFrame) else [value.dtype]
+        digest.update(repr((list(columns), [str(d) for d in dtypes])).encode())
+    elif isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        digest.update(repr((value.dtype.str, value.shape)).encode())
+        digest.update(value.tobytes() if value.dtype != object else repr(value.tolist()).encode())
+    elif hasattr(value, 'tocsr') and hasattr(value, 'indptr'):
+        value = value.tocsr()
+        digest.update(repr(value.shape).encode())
+        for part in (value.data, value.indices, value.indptr):
+            digest.update(np.ascontiguousarray(part).tobytes())
+    elif isinstance(value, Path):
+        #files by size and mtime, like the runner's quick check
+        stat = value.stat()
+        digest.update(repr((str(value), stat.st_size, stat.st_mtime_ns)).encode())
+    elif isinstance(value, dict):
+        digest.update(b'dict')
+        for k in sorted(value, key=repr):
+            digest.update(repr(k).encode())
+            _update(digest, value[k])
+    elif isinstance(value, (list, tuple)):
+        digest.update(f'{type(value).__name__}{len(value)}'.encode())
+        for item in value:
+            _update(digest, item)
+    elif value is None or isinstance(value, (str, bytes, int, float, bool, np.generic)):
+        digest.update(repr(value).encode())
+    else:
+        #estimators and other objects
+        import joblib
+
+        digest.update(joblib.hash(value).encode())
+
+
+def fingerprint(*values):
+    """sha256 over the contents of frames, arrays, sparse matrices, files and plain values."""
+    digest = hashlib.sha256()
+    for value in values:
+        _update(digest, value)
+    return digest.hexdigest()
@@ -0,0 +1,236 @@
+"""Timing, memory and row-count records for pipeline steps.
+
+``measure(name)`` (context manager) and ``@instrumented`` (decorator) record
+for one step:
+
+* wall and CPU seconds
+* how much the step raised the process's peak RSS, the change of its current
+  RSS, and optionally the peak traced Python allocations
+* rows in and rows out
+
+Each record is appended as one JSON line to ``data/runs/stages.jsonl``.
+Nested steps are recorded as ``outer/inner``, so a slow stage can be broken
+down into its load, transform and fit. Steps named in ``CPD_PROFILE`` (or
+called with ``profile=True``) also run under ``cProfile``, with the stats
+written next to the log. ``summary()`` ranks the slowest steps.
+"""
+
+import contextlib
+import contextvars
+import cProfile
+import functools
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+from .config import DATA_DIR
+
+try:
+    import resource
+except ImportError:
+    #windows has no resource module, peak rss is left empty there
+    resource = None
+
+#one id per process, so the records of one run can be told apart
+RUN_ID = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{os.getpid()}"
+
+_current = contextvars.ContextVar('cpd_step', default=None)
+#peak traced bytes the current step reached before a nested step reset tracemalloc's peak
+_traced_floor = contextvars.ContextVar('cpd_traced_floor', default=0)
+
+
+def log_path():
+    return Path(os.environ.get('CPD_STAGE_LOG', DATA_DIR / 'runs' / 'stages.jsonl'))
+
+
+def profile_targets():
+    return {s.strip() for s in os.environ.get('CPD_PROFILE', '').split(',') if s.strip()}
+
+
+def peak_rss_mb():
+    """Highest RSS of the process so far, not of any one step."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #kilobytes on linux, bytes on macos
+    return round(peak / (2 ** 20 if os.uname().sysname == 'Darwin' else 2 ** 10), 1)
+
+
+def rss_mb():
+    """Current RSS of the process, None where ``/proc`` is not available."""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20, 1)
+
+
+def _growth(before, after):
+    return None if before is None or after is None else round(after - before, 1)
+
+
+def count_rows(obj):
+    """Rows of a frame / array / sparse matrix, the ``rows`` entry of a stats dict, else None."""
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        rows = obj.get('rows')
+        return int(rows) if isinstance(rows, (int, float)) else None
+    shape = getattr(obj, 'shape', None)
+    if shape:
+        return int(shape[0])
+    if isinstance(obj, tuple) and obj:
+        return count_rows(obj[0])
+    return None
+
+
+def _write(record):
+    path = log_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(json.dumps(record, default=str) + '\n')
+
+
+@contextlib.contextmanager
+def measure(name, rows_in=None, trace_memory=None, profile=None, log=True):
+    """Measure the enclosed block and log its record.
+
+    Yields the record dict; set ``record['rows_out']`` (or ``rows_in``)
+    inside the block when the counts are only known there.
+    """
+    parent = _current.get()
+    full_name = f'{parent}/{name}' if parent else name
+    if trace_memory is None:
+        trace_memory = os.environ.get('CPD_TRACE_MEMORY') == '1'
+    if profile is None:
+        profile = name in profile_targets() or full_name in profile_targets()
+
+    record = {'run_id': RUN_ID, 'step': full_name, 'started': datetime.now(timezone.utc).isoformat(),
+              'rows_in': rows_in, 'rows_out': None}
+    #the outermost traced step owns tracemalloc. nested ones reset its peak and hand the
+    #peak they replaced (and their own) back to the parent through _traced_floor
+    own_trace = trace_memory and not tracemalloc.is_tracing()
+    traced = trace_memory and (own_trace or tracemalloc.is_tracing())
+    if own_trace:
+        tracemalloc.start()
+        earlier = 0
+    elif traced:
+        earlier = max(_traced_floor.get(), tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    floor_token = _traced_floor.set(0) if traced else None
+    profiler = None
+    if profile:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            #another profiler is already active
+            profiler = None
+
+    token = _current.set(full_name)
+    #the process peak only says which step set it, so each step records what it added
+    peak_before, rss_before = peak_rss_mb(), rss_mb()
+    wall, cpu = time.perf_counter(), time.process_time()
+    status = 'ok'
+    try:
+        yield record
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        record['wall_seconds'] = round(time.perf_counter() - wall, 4)
+        record['cpu_seconds'] = round(time.process_time() - cpu, 4)
+        _current.reset(token)
+        record['peak_rss_mb'] = peak_rss_mb()
+        record['peak_rss_growth_mb'] = _growth(peak_before, record['peak_rss_mb'])
+        record['rss_mb'] = rss_mb()
+        record['rss_delta_mb'] = _growth(rss_before, record['rss_mb'])
+        record['traced_peak_mb'] = None
+        if traced:
+            peak = max(_traced_floor.get(), tracemalloc.get_traced_memory()[1]) if tracemalloc.is_tracing() else 0
+            _traced_floor.reset(floor_token)
+            record['traced_peak_mb'] = round(peak / 2 ** 20, 2)
+            if own_trace:
+                tracemalloc.stop()
+            else:
+                _traced_floor.set(max(earlier, peak))
+        if profiler is not None:
+            profiler.disable()
+            out = log_path().parent / 'profiles' / f"{full_name.replace('/', '.')}-{RUN_ID}.prof"
+            out.parent.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(out)
+            record['profile'] = str(out)
+        record['status'] = status
+        if log:
+            _write(record)
+
+
+def instrumented(func=None, *, name=None, rows_in=count_rows, trace_memory=None):
+    """Decorator version of ``measure``.
+
+    Rows in are counted from the first positional argument and rows out from
+    the return value, with ``count_rows``.
+    """
+    if func is None:
+        return functools.partial(instrumented, name=name, rows_in=rows_in, trace_memory=trace_memory)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        first = args[0] if args else None
+        with measure(name or func.__name__, rows_in=rows_in(first) if rows_in else None,
+                     trace_memory=trace_memory) as record:
+            result = func(*args, **kwargs)
+            record['rows_out'] = count_rows(result)
+        return result
+    return wrapper
+
+
+def read_log(path=None, run_id=None):
+    """The logged records as a DataFrame, optionally of one run (``'last'`` for the latest)."""
+    import pandas as pd
+
+    path = Path(path or log_path())
+    if not path.exists():
+        return pd.DataFrame()
+    df = pd.read_json(path, lines=True, dtype={'run_id': str})
+    if run_id == 'last' and len(df):
+        run_id = df['run_id'].iloc[-1]
+    if run_id:
+        df = df[df['run_id'] == run_id]
+    return df.reset_index(drop=True)
+
+
+def summary(path=None, run_id='last', top=15):
+    """Steps ranked by total wall time, with CPU time, the memory each step added and rows.
+
+    ``peak_rss_growth_mb`` is how far a step raised the process's peak RSS,
+    ``rss_delta_mb`` how much more memory the process held after it.
+    """
+    df = read_log(path, run_id)
+    if df.empty:
+        return df
+    #logs written before the per-step columns existed only have the process peak
+    memory = {col: (col, 'max') for col in ('peak_rss_growth_mb', 'rss_delta_mb') if col in df} or \
+        {'peak_rss_mb': ('peak_rss_mb', 'max')}
+    table = df.groupby('step').agg(calls=('wall_seconds', 'size'), wall_seconds=('wall_seconds', 'sum'),
+                                   cpu_seconds=('cpu_seconds', 'sum'), **memory,
+                                   traced_peak_mb=('traced_peak_mb', 'max'),
+                                   rows_in=('rows_in', lambda s: s.sum(min_count=1)),
+                                   rows_out=('rows_out', lambda s: s.sum(min_count=1)))
+    #spill volume of the budgeted aggregations, only in runs that had one
+    if 'spilled_mb' in df:
+        table['memory_budget_mb'] = df.groupby('step')['memory_budget_mb'].max()
+        table['spilled_mb'] = df.groupby('step')['spilled_mb'].sum(min_count=1)
+    total = df.loc[~df['step'].str.contains('/'), 'wall_seconds'].sum() or df['wall_seconds'].sum()
+    table['share'] = (table['wall_seconds'] / total).round(3)
+    return table.sort_values('wall_seconds', ascending=False).head(top)
+
+
+def print_profile(path, limit=20, sort='cumulative'):
+    """Print the top functions of a saved cProfile file."""
+    pstats.Stats(str(path)).sort_stats(sort).print_stats(limit)
@@ -0,0 +1,180 @@
+"""Windowed joins between datasets by neighborhood and time.
+
+Questions like "calls in the hour before a shooting in the same neighborhood"
+are answered without a cartesian merge:
+
+1. every dataset becomes an ``EventIndex``: normalized neighborhood codes and
+   event times, sorted by (neighborhood, time) and packed into one int64 key
+2. for each left event, the matching right events are one contiguous slice of
+   that sorted key, found with two ``searchsorted`` calls
+3. counts come straight from the slice bounds; pair output is produced in
+   chunks of at most ``chunk_rows`` rows, with a hard ``max_rows`` cap
+
+``asof_join`` wraps ``pd.merge_asof`` for the nearest earlier / later event.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from .rollup import DIMENSIONS
+
+#spellings that differ between the cpd and sna neighborhood columns
+NEIGHBORHOOD_ALIASES = {
+    'CUF': 'CLIFTON HEIGHTS-UNIVERSITY HEIGHTS-FAIRVIEW',
+    'CLIFTON HEIGHTS UNIVERSITY HEIGHTS FAIRVIEW': 'CLIFTON HEIGHTS-UNIVERSITY HEIGHTS-FAIRVIEW',
+    'OTR': 'OVER-THE-RHINE',
+    'OVER THE RHINE': 'OVER-THE-RHINE',
+    'MT AIRY': 'MOUNT AIRY',
+    'MT ADAMS': 'MOUNT ADAMS',
+    'MT AUBURN': 'MOUNT AUBURN',
+    'MT LOOKOUT': 'MOUNT LOOKOUT',
+    'MT WASHINGTON': 'MOUNT WASHINGTON',
+    'N AVONDALE': 'NORTH AVONDALE',
+    'N FAIRMOUNT': 'NORTH FAIRMOUNT',
+    'S FAIRMOUNT': 'SOUTH FAIRMOUNT',
+    'E PRICE HILL': 'EAST PRICE HILL',
+    'W PRICE HILL': 'WEST PRICE HILL',
+    'E WALNUT HILLS': 'EAST WALNUT HILLS',
+    'E END': 'EAST END',
+    'W END': 'WEST END',
+    'CBD': 'DOWNTOWN',
+    'CBD-RIVERFRONT': 'DOWNTOWN',
+    'CBD/RIVERFRONT': 'DOWNTOWN',
+}
+
+
+def _normalize_one(name):
+    name = re.sub(r'\s+', ' ', str(name).upper().replace('.', ' ').replace('_', ' ')).strip()
+    name = re.sub(r'\s*([-/])\s*', r'\1', name)
+    if name in NEIGHBORHOOD_ALIASES:
+        return NEIGHBORHOOD_ALIASES[name]
+    #compare with the aliases ignoring punctuation, e.g. "OVER THE-RHINE"
+    plain = re.sub(r'[-/]', ' ', name)
+    return NEIGHBORHOOD_ALIASES.get(plain, name)
+
+
+def normalize_neighborhood(values):
+    """Normalize neighborhood labels of any dataset to one spelling.
+
+    The string work is done once per distinct label, not once per row.
+    """
+    values = pd.Series(values, copy=False)
+    codes, uniques = pd.factorize(values)
+    mapped = np.array([_normalize_one(u) for u in uniques] + [None], dtype=object)
+    #code -1 (missing) picks the trailing None
+    return pd.Series(mapped[codes], index=values.index, dtype='string')
+
+
+def event_frame(df, dataset, time_col=None, neighborhood_col=None, time_format=None):
+    """Reduce a raw dataset to normalized ``neighborhood`` and ``time`` columns."""
+    default_time, default_neigh, _ = DIMENSIONS[dataset]
+    times = df[time_col or default_time]
+    if not pd.api.types.is_datetime64_any_dtype(times):
+        times = pd.to_datetime(times, format=time_format, errors='coerce')
+    return pd.DataFrame({'neighborhood': normalize_neighborhood(df[neighborhood_col or default_neigh]),
+                         'time': times})
+
+
+class EventIndex:
+    """Events sorted by (neighborhood, time) with one packed int64 key per event.
+
+    The key is ``code * SPAN + seconds``, so a (neighborhood, time range)
+    lookup is a ``searchsorted`` on a single sorted array. ``positions`` maps
+    sorted order back to the rows of the source frame.
+    """
+
+    #seconds per neighborhood block, larger than any time range plus window (~300 years)
+    SPAN = 10 ** 10
+    #shift seconds so all realistic timestamps (after 1900) are positive
+    EPOCH = int(np.datetime64('1900-01-01', 's').astype(np.int64))
+
+    def __init__(self, events, vocabulary):
+        events = events.dropna(subset=['neighborhood', 'time'])
+        self.vocabulary = vocabulary
+        codes = pd.Categorical(events['neighborhood'], categories=vocabulary).codes.astype(np.int64)
+        seconds = events['time'].to_numpy(dtype='datetime64[s]').astype(np.int64) - self.EPOCH
+        keep = codes >= 0
+        keys = codes[keep] * self.SPAN + seconds[keep]
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        #labels of the source frame's rows, in key order
+        self.positions = events.index.to_numpy()[np.flatnonzero(keep)[order]]
+
+    def __len__(self):
+        return len(self.keys)
+
+
+def build_indexes(*events):
+    """Build ``EventIndex`` objects for several event frames over one shared neighborhood vocabulary."""
+    vocabulary = pd.Index(sorted(set().union(*(set(e['neighborhood'].dropna().unique()) for e in events))))
+    return [EventIndex(e, vocabulary) for e in events]
+
+
+def _window_bounds(left, right, before, after):
+    before_s = int(pd.Timedelta(before).total_seconds())
+    after_s = int(pd.Timedelta(after).total_seconds())
+    lo = np.searchsorted(right.keys, left.keys - before_s, side='left')
+    hi = np.searchsorted(right.keys, left.keys + after_s, side='right')
+    return lo, hi
+
+
+def window_counts(left, right, before='1h', after='0h'):
+    """For each left event, the number of right events in the same neighborhood within
+    ``[time - before, time + after]``. Returns a Series indexed by the left frame's rows."""
+    lo, hi = _window_bounds(left, right, before, after)
+    return pd.Series(hi - lo, index=left.positions, name='count').sort_index()
+
+
+def iter_window_join(left, right, before='1h', after='0h', chunk_rows=1_000_000):
+    """Yield (left_row, right_row, seconds) pair frames of at most about ``chunk_rows`` rows."""
+    lo, hi = _window_bounds(left, right, before, after)
+    counts = hi - lo
+    #ends[i] is the number of pairs of the first i left events
+    ends = np.concatenate([[0], np.cumsum(counts)])
+    start = 0
+    while start < len(counts):
+        #take as many left events as fit in the chunk budget (at least one)
+        fit = int(np.searchsorted(ends, ends[start] + chunk_rows, side='right')) - 1
+        stop = max(fit, start + 1)
+        c = counts[start:stop]
+        n = int(ends[stop] - ends[start])
+        if n:
+            left_rep = np.repeat(np.arange(start, stop), c)
+            offsets = np.arange(n) - np.repeat(ends[start:stop] - ends[start], c)
+            right_pos = lo[left_rep] + offsets
+            yield pd.DataFrame({
+                'left_row': left.positions[left_rep],
+                'right_row': right.positions[right_pos],
+                'seconds': right.keys[right_pos] - left.keys[left_rep],
+            })
+        start = stop
+
+
+def window_join(left, right, before='1h', after='0h', max_rows=5_000_000):
+    """All matching pairs as one frame; raises if there would be more than ``max_rows``."""
+    lo, hi = _window_bounds(left, right, before, after)
+    total = int((hi - lo).sum())
+    if total > max_rows:
+        raise ValueError(f'window join would produce {total:,} rows (max_rows={max_rows:,}); '
+                         'narrow the window, use window_counts or iter_window_join')
+    chunks = list(iter_window_join(left, right, before, after, chunk_rows=max(total, 1)))
+    if not chunks:
+        return pd.DataFrame({'left_row': pd.Series(dtype=np.int64), 'right_row': pd.Series(dtype=np.int64),
+                             'seconds': pd.Series(dtype=np.int64)})
+    return pd.concat(chunks, ignore_index=True)
+
+
+def asof_join(left_events, right_events, direction='backward', tolerance='1h'):
+    """Nearest right event in the same neighborhood for each left event (``pd.merge_asof``).
+
+    Adds ``right_row`` and ``right_time`` columns to the left event frame.
+    """
+    left = left_events.dropna(subset=['neighborhood', 'time']).reset_index(names='left_row')
+    right = right_events.dropna(subset=['neighborhood', 'time']).reset_index(names='right_row')
+    right = right.rename(columns={'time': 'right_time'})
+    left = left.sort_values('time')
+    right = right.sort_values('right_time')
+    return pd.merge_asof(left, right, left_on='time', right_on='right_time', by='neighborhood',
+                         direction=direction, tolerance=pd.Timedelta(tolerance))
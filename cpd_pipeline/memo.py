@@ -0,0 +1,205 @@
+"""Content-addressed memoization of expensive steps on disk.
+
+``@memoize`` stores a function's result under ``data/memo/<function>/``. The
+key is a hash of the function's source, the sources of the helpers it names
+in ``depends``, and the contents of its arguments (frames, arrays, files and
+plain values). Re-running with the same data and code loads the stored result
+instead of recomputing it. A change to either gives a new key.
+
+    @memoize(depends=[make_model, fit_and_measure])
+    def train_response_time_models(X, y, kinds=('linear', 'hgb', 'forest')): ...
+
+Hashing the arguments reads all of their bytes, so memoize steps that cost
+much more than that (model fits), not vectorized transforms.
+
+DataFrames are stored as Parquet and everything else with joblib
+(uncompressed, so arrays can be memory mapped). The store is capped at
+``CPD_MEMO_MAX_MB`` (2 GB by default): the least recently used entries are
+removed first. Hits, misses and evictions are counted per function
+(``memo_stats``) and every call is logged as a ``memo_<function>`` step.
+``CPD_MEMO=0`` turns memoization off.
+"""
+
+import functools
+import hashlib
+import inspect
+import logging
+import os
+import uuid
+from pathlib import Path
+
+import pandas as pd
+
+from .config import DATA_DIR
+from .hashing import fingerprint
+from .instrument import measure
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = {}
+
+
+def memo_dir():
+    return Path(os.environ.get('CPD_MEMO_DIR', DATA_DIR / 'memo'))
+
+
+def max_bytes():
+    return int(float(os.environ.get('CPD_MEMO_MAX_MB', 2048)) * 2 ** 20)
+
+
+def enabled():
+    return os.environ.get('CPD_MEMO', '1') != '0'
+
+
+def code_hash(func, depends=()):
+    digest = hashlib.sha256()
+    for f in (func, *depends):
+        f = inspect.unwrap(f)
+        digest.update(f'{f.__module__}.{f.__qualname__}'.encode())
+        try:
+            digest.update(inspect.getsource(f).encode())
+        except (OSError, TypeError):
+            #no source file (e.g. defined in a console), fall back to the bytecode
+            digest.update(f.__code__.co_code + repr(f.__code__.co_consts).encode())
+    return digest.hexdigest()
+
+
+def _entries(name=None):
+    return [p for p in memo_dir().glob(f'{name}/*' if name else '*/*') if p.suffix in ('.parquet', '.joblib')]
+
+
+def evict(limit=None):
+    """Remove the least recently used entries until the store is under ``limit`` bytes."""
+    limit = max_bytes() if limit is None else limit
+    entries = [(p, p.stat()) for p in _entries()]
+    total = sum(s.st_size for _, s in entries)
+    removed = 0
+    for path, stat in sorted(entries, key=lambda e: e[1].st_mtime_ns):
+        if total <= limit:
+            break
+        path.unlink(missing_ok=True)
+        total -= stat.st_size
+        removed += 1
+        COUNTERS.setdefault(path.parent.name, _counter())['evictions'] += 1
+    return removed
+
+
+def _counter():
+    return {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def _store(path, result):
+    """Write a result atomically, as Parquet when it is a frame Parquet can hold, else joblib."""
+    import joblib
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f'.{uuid.uuid4().hex}.tmp')
+    try:
+        if isinstance(result, pd.DataFrame) and all(isinstance(c, str) for c in result.columns):
+            try:
+                result.to_parquet(tmp)
+                path = path.with_suffix('.parquet')
+            except (ValueError, TypeError, ImportError):
+                joblib.dump(result, tmp, compress=0)
+        else:
+            joblib.dump(result, tmp, compress=0)
+        tmp.replace(path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _load(path, mmap_mode):
+    if path.suffix == '.parquet':
+        return pd.read_parquet(path)
+    import joblib
+
+    return joblib.load(path, mmap_mode=mmap_mode)
+
+
+def memoize(func=None, *, name=None, depends=(), ignore=(), mmap_mode=None):
+    """Cache the results of ``func`` on disk, keyed by its code and argument contents.
+
+    ``depends`` lists helper functions whose code changes should invalidate the
+    cache too; ``ignore`` names arguments that don't change the result (e.g.
+    ``verbose``). The wrapper has ``invalidate(*args, **kwargs)``, ``clear()``
+    and ``key(*args, **kwargs)``.
+    """
+    if func is None:
+        return functools.partial(memoize, name=name, depends=depends, ignore=ignore, mmap_mode=mmap_mode)
+    name = name or func.__name__
+    signature = inspect.signature(func)
+    code = code_hash(func, depends)
+    COUNTERS.setdefault(name, _counter())
+
+    def key(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = {k: v for k, v in bound.arguments.items() if k not in ignore}
+        return fingerprint(code, arguments)[:32]
+
+    def entry(*args, **kwargs):
+        digest = key(*args, **kwargs)
+        folder = memo_dir() / name
+        for suffix in ('.parquet', '.joblib'):
+            if (folder / f'{digest}{suffix}').exists():
+                return folder / f'{digest}{suffix}'
+        return folder / f'{digest}.joblib'
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not enabled():
+            return func(*args, **kwargs)
+        with measure(f'memo_{name}') as record:
+            path = entry(*args, **kwargs)
+            if path.exists():
+                try:
+                    result = _load(path, mmap_mode)
+                except Exception as e:
+                    logger.warning('memo entry %s unreadable (%s), recomputing', path, e)
+                else:
+                    #touching the file keeps it at the recent end of the lru order
+                    os.utime(path)
+                    COUNTERS[name]['hits'] += 1
+                    record['memo'] = 'hit'
+                    return result
+            COUNTERS[name]['misses'] += 1
+            record['memo'] = 'miss'
+            result = func(*args, **kwargs)
+            try:
+                _store(path.with_suffix('.joblib'), result)
+            except Exception as e:
+                logger.warning('could not memoize %s (%s)', name, e)
+            evict()
+            return result
+
+    def invalidate(*args, **kwargs):
+        path = entry(*args, **kwargs)
+        existed = path.exists()
+        path.unlink(missing_ok=True)
+        return existed
+
+    wrapper.key = key
+    wrapper.invalidate = invalidate
+    wrapper.clear = lambda: clear_memo(name)
+    return wrapper
+
+
+def clear_memo(name=None):
+    """Remove the stored results of one memoized function, or of all of them."""
+    entries = _entries(name)
+    for path in entries:
+        path.unlink(missing_ok=True)
+    return len(entries)
+
+
+def memo_stats():
+    """Hits, misses and evictions of this process and the stored entries, per function."""
+    rows = {n: {**c, 'entries': 0, 'stored_mb': 0.0} for n, c in COUNTERS.items()}
+    for path in _entries():
+        row = rows.setdefault(path.parent.name, {**_counter(), 'entries': 0, 'stored_mb': 0.0})
+        row['entries'] += 1
+        row['stored_mb'] += path.stat().st_size / 2 ** 20
+    table = pd.DataFrame.from_dict(rows, orient='index', columns=['hits', 'misses', 'evictions', 'entries',
+                                                                   'stored_mb'])
+    table['stored_mb'] = table['stored_mb'].round(2)
+    return table.rename_axis('function')
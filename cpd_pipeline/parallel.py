@@ -0,0 +1,175 @@
+"""Multi-core loading and aggregation with a process pool.
+
+Two kinds of parallelism are used:
+
+* the independent datasets are loaded and summarised in separate processes
+* the large calls csv is split into byte ranges that start and end on line
+  boundaries, and each range is parsed, validated and aggregated by its own
+  process. Each range writes its own quarantine part file. The per-range
+  ``CallsAggregator`` partials and validation counts are merged in the parent.
+
+Splitting on newlines assumes no quoted field contains a line break, which
+holds for the city's csv exports.
+"""
+
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from .cache import load_dataset, raw_path
+from .instrument import instrumented
+from .schemas import read_csv_typed
+from .streaming import CALLS_COLUMNS, CallsAggregator
+from .validation import Validator, clear_quarantine, merge_stats
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def byte_ranges(path, parts):
+    """Split a csv into ``parts`` (start, end) byte ranges aligned on line starts.
+
+    The first range starts after the header line.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        f.readline()
+        data_start = f.tell()
+        bounds = [data_start]
+        step = max((size - data_start) // parts, 1)
+        for i in range(1, parts):
+            f.seek(max(data_start + i * step, bounds[-1]))
+            #move forward to the start of the next full line
+            f.readline()
+            pos = f.tell()
+            if pos >= size:
+                break
+            bounds.append(pos)
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+class _RangeReader(io.RawIOBase):
+    """Read-only file object that stops at ``end``."""
+
+    def __init__(self, path, start, end):
+        self._f = open(path, 'rb')
+        self._f.seek(start)
+        self._remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._remaining <= 0:
+            return 0
+        n = self._f.readinto(memoryview(buffer)[:min(len(buffer), self._remaining)])
+        self._remaining -= n
+        return n
+
+    def close(self):
+        self._f.close()
+        super().close()
+
+
+def aggregate_calls_range(path, start, end, chunksize=500_000, part=0, validate=True):
+    """Parse one byte range of the calls csv and return its partial aggregates and validation stats.
+
+    Unparseable rows go to the quarantine file of ``part``.
+    """
+    header = list(pd.read_csv(path, nrows=0).columns)
+    agg = CallsAggregator()
+    validator = Validator('calls', part=part) if validate else None
+    #the columns of the rules too, like streaming.iter_chunks
+    wanted = CALLS_COLUMNS + (validator.columns if validator is not None else [])
+    usecols = [c for c in dict.fromkeys(wanted) if c in header]
+    with io.BufferedReader(_RangeReader(path, start, end), buffer_size=1 << 20) as f:
+        for chunk in read_csv_typed(f, 'calls', validator=validator, header=None, names=header, usecols=usecols,
+                                    chunksize=chunksize):
+            agg.update(chunk)
+    return agg, validator.close() if validator is not None else None
+
+
+def _submit_ranges(pool, path, parts, chunksize, validate):
+    if validate:
+        #part files of an earlier run with more parts would be read with this run's
+        clear_quarantine('calls')
+    return [pool.submit(aggregate_calls_range, path, start, end, chunksize, part, validate)
+            for part, (start, end) in enumerate(byte_ranges(path, parts))]
+
+
+def _merge_ranges(futures):
+    total, stats = CallsAggregator(), []
+    for future in futures:
+        agg, part_stats = future.result()
+        total.merge(agg)
+        stats.append(part_stats)
+    result = total.result()
+    validation = merge_stats(stats)
+    if validation is not None:
+        result['validation'] = validation
+    return result
+
+
+@instrumented
+def aggregate_calls_parallel(path=None, workers=None, parts=None, chunksize=500_000, pool=None, validate=True):
+    """Aggregate the calls csv with one process per byte range."""
+    path = path or raw_path('calls')
+    workers = workers or default_workers()
+    if pool is None:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return aggregate_calls_parallel(path, workers, parts, chunksize, pool, validate)
+    return _merge_ranges(_submit_ranges(pool, path, parts or workers, chunksize, validate))
+
+
+def summarize_crime_incidents():
+    df = load_dataset('crime_incidents', columns=['DATE_REPORTED', 'CPD_NEIGHBORHOOD'])
+    df['incident_hour'] = df['DATE_REPORTED'].dt.hour
+    counts = df.groupby(['incident_hour', 'CPD_NEIGHBORHOOD'], observed=True).size()
+    return {'rows': len(df), 'hour_neighborhood_counts': counts.reset_index(name='counts')}
+
+
+def summarize_shootings():
+    df = load_dataset('shootings', columns=['DateOccurred', 'SNA_NEIGHBORHOOD'])
+    occurred = df['DateOccurred']
+    monthly = (occurred.groupby([occurred.dt.year.rename('year'), occurred.dt.month_name().rename('month')])
+               .size().reset_index(name='counts'))
+    return {'rows': len(df), 'monthly_counts': monthly}
+
+
+def summarize_use_of_force():
+    df = load_dataset('use_of_force', columns=['INCIDENT_DESCRIPTION', 'SNA_NEIGHBORHOOD'])
+    counts = df.groupby(['INCIDENT_DESCRIPTION', 'SNA_NEIGHBORHOOD'], observed=True).size()
+    return {'rows': len(df), 'description_neighborhood_counts': counts.reset_index(name='counts')}
+
+
+#summary function for each dataset that is small enough to load whole
+SUMMARIES = {
+    'crime_incidents': summarize_crime_incidents,
+    'shootings': summarize_shootings,
+    'use_of_force': summarize_use_of_force,
+}
+
+
+def run_all(workers=None, datasets=None, chunksize=500_000):
+    """Load and aggregate all datasets at the same time on one process pool.
+
+    The small datasets each get one task; the calls csv is split into byte
+    ranges that share the same pool. Returns ``{dataset: tables}``.
+    """
+    workers = workers or default_workers()
+    datasets = datasets or [*SUMMARIES, 'calls']
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {name: pool.submit(SUMMARIES[name]) for name in datasets if name in SUMMARIES}
+        calls_futures = []
+        if 'calls' in datasets:
+            calls_futures = _submit_ranges(pool, raw_path('calls'), workers, chunksize, validate=True)
+        for name, future in futures.items():
+            results[name] = future.result()
+        if calls_futures:
+            results['calls'] = _merge_ranges(calls_futures)
+    return results
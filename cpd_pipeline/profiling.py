@@ -0,0 +1,169 @@
+"""Fast, non-mutating replacement for the notebook's ``analyze_dataframe``.
+
+``profile_dataframe`` returns a plain dict report instead of printing, and
+never changes the frame it is given. Duplicates are counted by hashing every
+row once with ``pd.util.hash_pandas_object``; dropping them is a separate,
+explicit call to ``drop_duplicate_rows``.
+
+With ``approximate=True`` the statistics are computed on a reservoir sample
+of rows and distinct counts come from a HyperLogLog sketch over the column
+hashes, so the cost no longer grows with the distinct values of each column.
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+from .instrument import instrumented
+
+QUANTILES = [0.25, 0.5, 0.75]
+
+
+def row_hashes(df):
+    """One uint64 hash per row, used for duplicate detection."""
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def drop_duplicate_rows(df):
+    """Return a copy of ``df`` without duplicate rows, the caller's frame is untouched."""
+    return df[~pd.Series(row_hashes(df)).duplicated().to_numpy()].reset_index(drop=True)
+
+
+def reservoir_sample(chunks, size, seed=0):
+    """Uniform sample of ``size`` rows from an iterable of DataFrame chunks (algorithm R)."""
+    rng = np.random.default_rng(seed)
+    sample = None
+    seen = 0
+    for chunk in chunks:
+        n = len(chunk)
+        if sample is None:
+            sample = chunk.iloc[:0]
+        if len(sample) < size:
+            take = min(size - len(sample), n)
+            sample = pd.concat([sample, chunk.iloc[:take]], ignore_index=True)
+            chunk = chunk.iloc[take:]
+            seen += take
+            n -= take
+        if n == 0:
+            continue
+        #row number i (0 based over the stream) replaces slot j if j < size, j ~ U[0, i]
+        positions = seen + np.arange(n)
+        slots = (rng.random(n) * (positions + 1)).astype(np.int64)
+        keep = np.flatnonzero(slots < size)
+        if len(keep):
+            #later rows win when the same slot is drawn twice
+            slot_rows = pd.Series(keep, index=slots[keep]).groupby(level=0).last()
+            sample.iloc[slot_rows.index.to_numpy()] = chunk.iloc[slot_rows.to_numpy()].to_numpy()
+        seen += n
+    return sample if sample is not None else pd.DataFrame()
+
+
+class HyperLogLog:
+    """HyperLogLog distinct count estimate over 64 bit hashes (2 ** p registers)."""
+
+    def __init__(self, p=14):
+        self.p = p
+        self.m = 1 << p
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    def add_hashes(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = (hashes << np.uint64(self.p)) | np.uint64((1 << self.p) - 1)
+        #rank = position of the leftmost 1 bit in the remaining bits
+        rank = (64 - np.floor(np.log2(rest.astype(np.float64))).astype(np.int64)).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(2.0 ** -self.registers.astype(np.float64))
+        zeros = np.count_nonzero(self.registers == 0)
+        if raw <= 2.5 * m and zeros:
+            #small range correction (linear counting)
+            return int(round(m * np.log(m / zeros)))
+        return int(round(raw))
+
+
+def _column_stats(s, quantiles):
+    stats = {}
+    if pd.api.types.is_bool_dtype(s):
+        return stats
+    if pd.api.types.is_numeric_dtype(s) or pd.api.types.is_datetime64_any_dtype(s):
+        valid = s.dropna()
+        if len(valid):
+            qs = valid.quantile([0.0, *quantiles, 1.0]).tolist()
+            stats['min'], stats['max'] = qs[0], qs[-1]
+            stats['quantiles'] = dict(zip([str(q) for q in quantiles], qs[1:-1]))
+            if pd.api.types.is_numeric_dtype(s):
+                stats['mean'] = float(valid.mean())
+    return stats
+
+
+@instrumented
+def profile_dataframe(df, name=None, approximate=False, sample_size=100_000, quantiles=QUANTILES,
+                      seed=0):
+    """Profile a frame and return a report dict.
+
+    The report has the shape, per-column dtype / null count / distinct count /
+    min / max / quantiles, and the number of duplicate rows. In approximate
+    mode, distinct counts use HyperLogLog on every row and the remaining
+    statistics use a reservoir sample of ``sample_size`` rows.
+    """
+    n_rows = len(df)
+    sampled = approximate and n_rows > sample_size
+    if sampled:
+        step = max(sample_size, 250_000)
+        stats_df = reservoir_sample((df.iloc[i:i + step] for i in range(0, n_rows, step)),
+                                    sample_size, seed=seed)
+    else:
+        stats_df = df
+
+    #null counts for all columns in one vectorized pass
+    nulls = df.isna().sum()
+    hashes = row_hashes(df)
+    columns = {}
+    for col in df.columns:
+        s = df[col]
+        if approximate:
+            distinct = HyperLogLog().add_hashes(pd.util.hash_array(s.dropna().to_numpy())).estimate()
+        else:
+            distinct = int(s.nunique(dropna=True))
+        columns[str(col)] = {
+            'dtype': str(s.dtype),
+            'nulls': int(nulls[col]),
+            'null_pct': round(100 * float(nulls[col]) / n_rows, 3) if n_rows else 0.0,
+            'distinct': distinct,
+            **_column_stats(stats_df[col], quantiles),
+        }
+
+    return {
+        'name': name,
+        'rows': n_rows,
+        'columns_count': df.shape[1],
+        'memory_mb': round(float(df.memory_usage(deep=True).sum()) / 2 ** 20, 2),
+        'duplicate_rows': int(pd.Series(hashes).duplicated().sum()),
+        'approximate': bool(approximate),
+        'sampled_rows': len(stats_df),
+        'columns': columns,
+    }
+
+
+def report_to_json(report, **kwargs):
+    return json.dumps(report, default=str, **kwargs)
+
+
+def analyze_dataframe(df, name, **kwargs):
+    """Print a short summary like the notebook's helper, without modifying ``df``."""
+    report = profile_dataframe(df, name, **kwargs)
+    print(f"shape of {name}: ({report['rows']}, {report['columns_count']})")
+    print(f"number of duplicate records in {name}: {report['duplicate_rows']}")
+    table = pd.DataFrame(report['columns']).T
+    print(f"summary of {name}:\n{table}\n")
+    return report
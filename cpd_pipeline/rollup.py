@@ -0,0 +1,194 @@
+"""Materialized rollup cube of incident counts for the dashboard charts.
+
+Every dataset is reduced to counts by (dataset, date, hour, day of week,
+neighborhood, incident type) and stored in one Parquet file. The charts query
+the cube (top-N neighborhoods, hour x neighborhood pivots, monthly counts, ...)
+instead of grouping the raw tables again. New rows are folded in with
+``RollupCube.update``, which only adds their counts to the stored cells.
+
+For the datasets that are synced incrementally, the cube also keeps a hash
+of every record key it has counted (``<cube>-keys/<dataset>.parquet``).
+``update`` skips rows whose key was already counted, so the overlapping
+batches of a ``>=`` watermark sync are counted once. A record that changes
+after it was counted keeps its first counts until the dataset is rebuilt.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .config import DATA_DIR
+from .instrument import instrumented
+
+KEYS = ['dataset', 'date', 'hour', 'day_of_week', 'neighborhood', 'incident_type']
+
+#time, neighborhood and incident type column of each dataset
+DIMENSIONS = {
+    'crime_incidents': ('DATE_REPORTED', 'CPD_NEIGHBORHOOD', 'OFFENSE'),
+    'shootings': ('DateOccurred', 'SNA_NEIGHBORHOOD', 'Type'),
+    'use_of_force': ('INCIDENT_DATE', 'SNA_NEIGHBORHOOD', 'INCIDENT_DESCRIPTION'),
+    'calls': ('CREATE_TIME_INCIDENT', 'SNA_NEIGHBORHOOD', 'INCIDENT_TYPE_ID'),
+}
+
+#record key of the incrementally synced datasets, matched ignoring case (the api uses lowercase names)
+RECORD_KEYS = {
+    'crime_incidents': 'INSTANCEID',
+    'calls': 'EVENT_NUMBER',
+}
+
+#columns that can be derived from the stored date at query time
+DERIVED = {
+    'year': lambda d: d.dt.year,
+    'month': lambda d: d.dt.month,
+    'month_name': lambda d: d.dt.month_name(),
+    'day_name': lambda d: d.dt.day_name(),
+}
+
+
+@instrumented
+def rollup_frame(df, dataset, time_col=None, neighborhood_col=None, type_col=None):
+    """Reduce a raw frame of one dataset to cube rows."""
+    default_time, default_neigh, default_type = DIMENSIONS[dataset]
+    ts = pd.to_datetime(df[time_col or default_time], errors='coerce')
+    neigh_col = neighborhood_col or default_neigh
+    kind_col = type_col or default_type
+    cells = pd.DataFrame({
+        'date': ts.dt.normalize(),
+        'hour': ts.dt.hour.astype('Int8'),
+        'day_of_week': ts.dt.dayofweek.astype('Int8'),
+        'neighborhood': df[neigh_col].astype('string') if neigh_col in df else pd.NA,
+        'incident_type': df[kind_col].astype('string') if kind_col in df else pd.NA,
+    })
+    #rows with a missing date or neighborhood still count towards the other dimensions
+    counts = cells.groupby(KEYS[1:], dropna=False, observed=True).size().reset_index(name='count')
+    counts.insert(0, 'dataset', dataset)
+    return counts
+
+
+def key_column(df, dataset):
+    """The column of ``df`` holding the dataset's record key, or None."""
+    key = RECORD_KEYS.get(dataset)
+    matches = [c for c in df.columns if key is not None and str(c).upper() == key]
+    return matches[0] if matches else None
+
+
+def _key_hashes(values):
+    return pd.util.hash_pandas_object(values.astype('string'), index=False).to_numpy()
+
+
+def _compact(cube):
+    for col in ('dataset', 'neighborhood', 'incident_type'):
+        cube[col] = cube[col].astype('category')
+    cube['count'] = cube['count'].astype('int64')
+    return cube
+
+
+class RollupCube:
+    """Counts cube stored as a Parquet file, loaded lazily and queried in memory."""
+
+    def __init__(self, path=None):
+        self.path = Path(path or DATA_DIR / 'rollup' / 'cube.parquet')
+        self._cube = None
+        self._keys = {}
+
+    @property
+    def cube(self):
+        if self._cube is None:
+            if self.path.exists():
+                self._cube = pd.read_parquet(self.path)
+            else:
+                self._cube = _compact(pd.DataFrame({k: pd.Series(dtype='object') for k in [*KEYS, 'count']}))
+        return self._cube
+
+    def _keys_path(self, dataset):
+        return self.path.with_name(f'{self.path.stem}-keys') / f'{dataset}.parquet'
+
+    def counted_keys(self, dataset):
+        """Sorted hashes of the record keys of ``dataset`` already in the cube."""
+        if dataset not in self._keys:
+            path = self._keys_path(dataset)
+            self._keys[dataset] = (pd.read_parquet(path)['key_hash'].to_numpy() if path.exists()
+                                   else np.empty(0, dtype=np.uint64))
+        return self._keys[dataset]
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        #keys first, a crash in between then only makes the next update skip rows it already counted
+        for dataset, hashes in self._keys.items():
+            path = self._keys_path(dataset)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix('.tmp')
+            pd.DataFrame({'key_hash': hashes}).to_parquet(tmp, index=False)
+            tmp.replace(path)
+        tmp = self.path.with_suffix('.tmp')
+        self.cube.to_parquet(tmp, index=False)
+        tmp.replace(self.path)
+
+    def update(self, dataset, df, save=True, **columns):
+        """Add the counts of the rows of ``dataset`` that are not in the cube yet, and save it.
+
+        Rows whose record key was already counted are skipped, so ``df`` may
+        overlap earlier batches. Datasets without a record key (or frames
+        without the key column) must only be given new rows. Returns the
+        number of rows counted.
+        """
+        key_col = key_column(df, dataset)
+        if key_col is not None:
+            hashes = _key_hashes(df[key_col])
+            has_key = df[key_col].notna().to_numpy()
+            #rows without a key can't be matched and are always counted
+            fresh = ~(has_key & np.isin(hashes, self.counted_keys(dataset)))
+            fresh &= ~(has_key & pd.Series(hashes).duplicated(keep='last').to_numpy())
+            df = df[fresh]
+            self._keys[dataset] = np.union1d(self.counted_keys(dataset), hashes[fresh & has_key])
+        new = rollup_frame(df, dataset, **columns)
+        merged = pd.concat([self.cube.astype({'dataset': 'string', 'neighborhood': 'string',
+                                              'incident_type': 'string'}), new], ignore_index=True)
+        self._cube = _compact(merged.groupby(KEYS, dropna=False, observed=True, sort=False)['count']
+                              .sum().reset_index())
+        if save:
+            self.save()
+        return len(df)
+
+    def rebuild(self, dataset, df, save=True, **columns):
+        """Replace every cell (and counted key) of ``dataset`` with counts of ``df``."""
+        self._cube = self.cube[self.cube['dataset'] != dataset].reset_index(drop=True)
+        self._keys[dataset] = np.empty(0, dtype=np.uint64)
+        return self.update(dataset, df, save=save, **columns)
+
+    def query(self, dataset, by, start=None, end=None, where=None):
+        """Sum the counts of ``dataset`` grouped by ``by``.
+
+        ``by`` may name cube columns or derived ones (year, month, month_name,
+        day_name). ``start``/``end`` filter the date (end exclusive) and
+        ``where`` is a dict of column -> value or list of values.
+        """
+        cube = self.cube
+        mask = cube['dataset'] == dataset
+        if start is not None:
+            mask &= cube['date'] >= pd.Timestamp(start)
+        if end is not None:
+            mask &= cube['date'] < pd.Timestamp(end)
+        for col, value in (where or {}).items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            mask &= cube[col].isin(values)
+        cells = cube[mask]
+        by = [by] if isinstance(by, str) else list(by)
+        keys = [DERIVED[b](cells['date']).rename(b) if b in DERIVED else cells[b] for b in by]
+        return cells.groupby(keys, observed=True)['count'].sum()
+
+    def top_n(self, dataset, by, n, **filters):
+        return self.query(dataset, by, **filters).nlargest(n)
+
+    def pivot(self, dataset, index, columns, top_columns=None, **filters):
+        """Counts table with ``index`` rows and ``columns`` columns, like ``groupby().size().unstack()``.
+
+        ``top_columns`` keeps only the n most frequent values of ``columns``.
+        """
+        where = dict(filters.pop('where', None) or {})
+        if top_columns:
+            top = self.top_n(dataset, columns, top_columns, where=where or None, **filters).index
+            where[columns] = list(top)
+        counts = self.query(dataset, [index, columns], where=where or None, **filters)
+        return counts.unstack(fill_value=0)
@@ -0,0 +1,211 @@
+"""Make-style runner for the stages in ``stages.py``.
+
+Stages run in dependency order. Before a stage runs, the runner computes a
+fingerprint of its inputs (size and mtime, with a sha256 check when those
+changed), its parameters and the source of its function plus the package
+modules it imports, directly or through other modules. If the fingerprint
+matches the one saved after the last successful run and every output still
+exists, the stage is skipped. Fingerprints live in ``data/runs/state.json``.
+"""
+
+import ast
+import hashlib
+import importlib.util
+import inspect
+import json
+import logging
+import textwrap
+import time
+from pathlib import Path
+
+from .config import DATA_DIR
+from .instrument import count_rows, measure
+from .stages import STAGES
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineError(RuntimeError):
+    pass
+
+
+def state_path():
+    return DATA_DIR / 'runs' / 'state.json'
+
+
+def load_state():
+    path = state_path()
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def save_state(state):
+    path = state_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(state, indent=2, sort_keys=True))
+    tmp.replace(path)
+
+
+def _sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def producers():
+    """Map every output path to the stage that writes it."""
+    return {out: st for st in STAGES.values() for out in st.outputs}
+
+
+def upstream(stage):
+    made_by = producers()
+    return [made_by[p] for p in stage.inputs if p in made_by and made_by[p] is not stage]
+
+
+def plan(targets=None):
+    """The stages needed for ``targets`` (names, default: every default stage) in run order."""
+    if targets:
+        unknown = [t for t in targets if t not in STAGES]
+        if unknown:
+            raise PipelineError(f'unknown stage(s) {unknown}, expected some of {sorted(STAGES)}')
+        roots = [STAGES[t] for t in targets]
+    else:
+        roots = [st for st in STAGES.values() if st.default]
+
+    order, seen = [], set()
+
+    def visit(st, path=()):
+        if st.name in path:
+            raise PipelineError(f'dependency cycle: {" -> ".join([*path, st.name])}')
+        if st.name in seen:
+            return
+        for dep in upstream(st):
+            visit(dep, (*path, st.name))
+        seen.add(st.name)
+        order.append(st)
+
+    for st in roots:
+        visit(st)
+    return order
+
+
+def _relative_imports(tree, package):
+    #absolute names of the modules imported with relative imports anywhere in the tree
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and node.level:
+            base = package.rsplit('.', node.level - 1)[0]
+            if node.module:
+                yield f'{base}.{node.module}'
+            else:
+                yield from (f'{base}.{alias.name}' for alias in node.names)
+
+
+def code_sources(func):
+    """Source of ``func`` and of every package module it depends on, keyed by name.
+
+    The stages import their modules inside the function body, so the imports
+    are read from the function's source and then followed through each
+    imported module.
+    """
+    sources = {func.__qualname__: inspect.getsource(func)}
+    pending = list(_relative_imports(ast.parse(textwrap.dedent(sources[func.__qualname__])),
+                                     func.__module__.rpartition('.')[0]))
+    while pending:
+        name = pending.pop()
+        if name in sources:
+            continue
+        spec = importlib.util.find_spec(name)
+        if spec is None or not spec.has_location:
+            #``from . import name`` of something that is not a module
+            continue
+        sources[name] = Path(spec.origin).read_text()
+        package = name if spec.submodule_search_locations is not None else name.rpartition('.')[0]
+        pending.extend(_relative_imports(ast.parse(sources[name]), package))
+    return sources
+
+
+def fingerprint(stage, params, previous=None):
+    """Fingerprint of a stage's inputs, parameters and code.
+
+    ``previous`` is the last saved fingerprint; inputs whose size and mtime
+    are unchanged reuse its sha256 instead of reading the file again.
+    """
+    old_inputs = (previous or {}).get('inputs', {})
+    inputs = {}
+    for path in stage.inputs:
+        stat = path.stat()
+        old = old_inputs.get(str(path), {})
+        if old.get('size') == stat.st_size and old.get('mtime_ns') == stat.st_mtime_ns:
+            sha = old['sha256']
+        else:
+            sha = _sha256(path)
+        inputs[str(path)] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha}
+    digest = hashlib.sha256()
+    for name, source in sorted(code_sources(stage.func).items()):
+        digest.update(f'{name}\0{source}\0'.encode())
+    code = digest.hexdigest()[:16]
+    return {'inputs': inputs, 'params': json.loads(json.dumps(params, default=str)), 'code': code}
+
+
+def _same(a, b):
+    #mtimes may differ after a touch, the contents decide
+    if a is None or b is None:
+        return False
+    strip = lambda fp: {**fp, 'inputs': {k: v['sha256'] for k, v in fp['inputs'].items()}}
+    return strip(a) == strip(b)
+
+
+def run(targets=None, force=False, dry_run=False, params=None):
+    """Run the planned stages and return one status dict per stage.
+
+    ``params`` maps stage names to parameter overrides. Stages without their
+    raw inputs are reported as ``missing`` (and so are the stages depending on
+    them) unless they were requested by name, which raises ``PipelineError``.
+    """
+    params = params or {}
+    state = load_state()
+    results, blocked = [], set()
+    for st in plan(targets):
+        stage_params = {**st.params, **params.get(st.name, {})}
+        row = {'stage': st.name, 'status': None, 'seconds': 0.0}
+        #in a dry run, inputs an upstream stage would write are not missing
+        planned = {p for r in results if r['status'] == 'would run' for p in STAGES[r['stage']].outputs}
+        missing = [str(p) for p in st.inputs if not p.exists() and p not in planned]
+        if missing or any(dep.name in blocked for dep in upstream(st)):
+            if targets and st.name in targets and missing and not dry_run:
+                raise PipelineError(f'{st.name}: missing input(s) {missing}')
+            row['status'] = 'missing'
+            row['missing'] = missing
+            blocked.add(st.name)
+            results.append(row)
+            continue
+
+        #an upstream stage that reran (or would rerun) changes this stage's inputs
+        stale_upstream = any(r['status'] in ('ran', 'would run') and r['stage'] in {d.name for d in upstream(st)}
+                             for r in results)
+        previous = state.get(st.name)
+        current = fingerprint(st, stage_params, previous) if not stale_upstream else None
+        fresh = (not force and not st.always and not stale_upstream and _same(current, previous)
+                 and all(p.exists() for p in st.outputs))
+        if fresh:
+            row['status'] = 'skipped'
+            if current != previous:
+                #touched but unchanged, remember the new mtimes to avoid hashing again
+                state[st.name] = current
+                save_state(state)
+        elif dry_run:
+            row['status'] = 'would run'
+        else:
+            start = time.perf_counter()
+            logger.info('running %s', st.name)
+            with measure(st.name) as record:
+                row['result'] = st.run(**params.get(st.name, {}))
+                record['rows_out'] = count_rows(row['result'])
+            row['seconds'] = round(time.perf_counter() - start, 3)
+            row['status'] = 'ran'
+            state[st.name] = fingerprint(st, stage_params, previous)
+            save_state(state)
+        results.append(row)
+    return results
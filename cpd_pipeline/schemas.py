@@ -0,0 +1,167 @@
+"""Per-dataset column types for the raw csv exports.
+
+Each schema maps a column to one of:
+
+* ``'category'`` for low cardinality labels (neighborhoods, incident types, ...)
+* ``'string'`` for identifiers and free text
+* a nullable integer type such as ``'Int16'``
+* ``'float32'`` for coordinates and measures
+* ``'datetime:<format>'`` for timestamps, parsed with that fixed format
+
+Timestamps are read as text and parsed right after each chunk is read with
+``features.parse_timestamps``, the byte-slicing parser for Socrata's format.
+That is several times faster than ``read_csv(parse_dates=..., date_format=...)``,
+which uses no less memory and leaves a whole column as text when one value
+doesn't match.
+
+Columns that are not in a schema are left to pandas to infer.
+"""
+
+import hashlib
+import json
+
+import pandas as pd
+
+#format socrata uses for timestamps in its csv exports
+SOCRATA_CSV_TIME = '%m/%d/%Y %I:%M:%S %p'
+
+SCHEMAS = {
+    'crime_incidents': {
+        'INSTANCEID': 'string',
+        'INCIDENT_NO': 'string',
+        'DATE_REPORTED': f'datetime:{SOCRATA_CSV_TIME}',
+        'DATE_FROM': f'datetime:{SOCRATA_CSV_TIME}',
+        'DATE_TO': f'datetime:{SOCRATA_CSV_TIME}',
+        'OFFENSE': 'category',
+        'UCR_GROUP': 'category',
+        'DST': 'category',
+        'BEAT': 'category',
+        'CPD_NEIGHBORHOOD': 'category',
+        'SNA_NEIGHBORHOOD': 'category',
+        'LATITUDE_X': 'float32',
+        'LONGITUDE_X': 'float32',
+    },
+    'shootings': {
+        'ShootID': 'Int32',
+        'DateOccurred': 'datetime:%Y%m%d',
+        #HHMM as a number, e.g. 1430
+        'TimeOccurred': 'Int16',
+        'YearOccurred': 'Int16',
+        'Age': 'Int16',
+        'District': 'category',
+        'StreetBlock': 'string',
+        'SNA_NEIGHBORHOOD': 'category',
+        'COMMUNITY_COUNCIL_NEIGHBORHOOD': 'category',
+        'Race': 'category',
+        'Sex': 'category',
+        'Type': 'category',
+        'DateTimeOccured': 'string',
+        'LATITUDE_X': 'float32',
+        'LONGITUDE_X': 'float32',
+    },
+    'use_of_force': {
+        'INCIDENT_DATE': f'datetime:{SOCRATA_CSV_TIME}',
+        'INCIDENT_DESCRIPTION': 'category',
+        'SNA_NEIGHBORHOOD': 'category',
+        'CPD_NEIGHBORHOOD': 'category',
+        'DISTRICT': 'category',
+        'SEX': 'category',
+        'RACE': 'category',
+        'LATITUDE_X': 'float32',
+        'LONGITUDE_X': 'float32',
+    },
+    'calls': {
+        'EVENT_NUMBER': 'string',
+        'ADDRESS_X': 'string',
+        'AGENCY': 'category',
+        'CREATE_TIME_INCIDENT': f'datetime:{SOCRATA_CSV_TIME}',
+        'DISPATCH_TIME_PRIMARY_UNIT': f'datetime:{SOCRATA_CSV_TIME}',
+        'ARRIVAL_TIME_PRIMARY_UNIT': f'datetime:{SOCRATA_CSV_TIME}',
+        'CLOSED_TIME_INCIDENT': f'datetime:{SOCRATA_CSV_TIME}',
+        'DISPOSITION_TEXT': 'category',
+        'INCIDENT_TYPE_ID': 'category',
+        'INCIDENT_TYPE_DESC': 'category',
+        'PRIORITY': 'Int8',
+        'PRIORITY_COLOR': 'category',
+        'BEAT': 'category',
+        'DISTRICT': 'category',
+        'CPD_NEIGHBORHOOD': 'category',
+        'COMMUNITY_COUNCIL_NEIGHBORHOOD': 'category',
+        'SNA_NEIGHBORHOOD': 'category',
+        'LATITUDE_X': 'float32',
+        'LONGITUDE_X': 'float32',
+    },
+}
+
+
+def schema_hash(name):
+    """Short hash of a schema, used to invalidate caches built with an older schema."""
+    payload = json.dumps(SCHEMAS.get(name, {}), sort_keys=True).encode()
+    return hashlib.sha256(payload).hexdigest()[:12]
+
+
+def datetime_columns(name):
+    return {col: t.split(':', 1)[1] for col, t in SCHEMAS.get(name, {}).items()
+            if t.startswith('datetime:')}
+
+
+def csv_dtypes(name, columns):
+    """dtype argument for read_csv, restricted to the columns present in the file."""
+    dtypes = {}
+    for col, t in SCHEMAS.get(name, {}).items():
+        if col not in columns:
+            continue
+        if t in ('category', 'float32', 'string'):
+            dtypes[col] = t
+        else:
+            #timestamps and nullable ints are read as text and converted in apply_schema
+            dtypes[col] = 'string'
+    return dtypes
+
+
+def apply_schema(df, name):
+    """Convert the columns of a frame to its schema types, in place, and return it."""
+    for col, t in SCHEMAS.get(name, {}).items():
+        if col not in df.columns:
+            continue
+        if t.startswith('datetime:'):
+            if not pd.api.types.is_datetime64_any_dtype(df[col]):
+                from .features import parse_timestamps
+
+                df[col] = parse_timestamps(df[col], t.split(':', 1)[1]).view('datetime64[ns]')
+        elif t.startswith('Int'):
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(t)
+        elif str(df[col].dtype) != t:
+            df[col] = df[col].astype(t)
+    return df
+
+
+def read_csv_typed(path, name, validator=None, **kwargs):
+    """read_csv with the dataset's schema applied during the read.
+
+    With a ``validation.Validator``, every chunk is checked on its raw text
+    first and only the parseable rows are typed and returned. ``path`` may be
+    an open file without a header line when ``names`` is given.
+    """
+    header = kwargs['names'] if kwargs.get('names') is not None else pd.read_csv(path, nrows=0).columns
+    kwargs.setdefault('low_memory', False)
+    chunksize = kwargs.get('chunksize')
+    reader = pd.read_csv(path, dtype=csv_dtypes(name, header), **kwargs)
+    check = validator.check if validator is not None else (lambda chunk: chunk)
+    if chunksize:
+        return (apply_schema(check(chunk), name) for chunk in reader)
+    return apply_schema(check(reader), name)
+
+
+def frame_memory_mb(df):
+    return float(df.memory_usage(deep=True).sum()) / 2 ** 20
+
+
+def memory_report(path, name):
+    """Compare the memory of an untyped read_csv with the typed read of the same file."""
+    untyped = pd.read_csv(path, low_memory=False)
+    before = frame_memory_mb(untyped)
+    del untyped
+    after = frame_memory_mb(read_csv_typed(path, name))
+    return {'dataset': name, 'before_mb': round(before, 1), 'after_mb': round(after, 1),
+            'ratio': round(before / after, 1) if after else None}
@@ -0,0 +1,324 @@
+"""Local query service over the cached datasets.
+
+``QueryService`` converts the columns it needs from each dataset's Parquet
+cache into an Arrow IPC file under ``data/service/``. It does this once, and
+again only when the cache, its schema or rules, or ``FIELDS`` change. The service memory maps that file and
+answers count queries with Arrow compute kernels. Every thread shares the
+same read-only tables, and the kernels release the GIL, so concurrent
+readers don't copy data or wait on each other. Results are kept in a small
+LRU cache.
+
+    service = QueryService()
+    service.query('calls', neighborhood='WESTWOOD', start='2024-09-01', end='2024-10-01',
+                  group_by=['day_of_week', 'incident_type'], top=10)
+
+Filters and groups use the same field names for every dataset:
+``neighborhood`` (``SNA_NEIGHBORHOOD``), ``incident_type``
+(``INCIDENT_TYPE_ID`` for calls), ``district`` and ``time``. Groups can
+also be the time parts ``hour``, ``day_of_week`` (monday = 0), ``date``,
+``month`` and ``year``. ``serve`` exposes the service as JSON over HTTP on
+localhost.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from .config import DATA_DIR, RAW_FILES
+from .schemas import schema_hash
+from .validation import rules_hash
+
+logger = logging.getLogger(__name__)
+
+#column of every query field in each dataset
+FIELDS = {
+    'crime_incidents': {'time': 'DATE_REPORTED', 'neighborhood': 'SNA_NEIGHBORHOOD', 'incident_type': 'OFFENSE',
+                        'district': 'DST'},
+    'shootings': {'time': 'DateOccurred', 'neighborhood': 'SNA_NEIGHBORHOOD', 'incident_type': 'Type',
+                  'district': 'District'},
+    'use_of_force': {'time': 'INCIDENT_DATE', 'neighborhood': 'SNA_NEIGHBORHOOD',
+                     'incident_type': 'INCIDENT_DESCRIPTION', 'district': 'DISTRICT'},
+    'calls': {'time': 'CREATE_TIME_INCIDENT', 'neighborhood': 'SNA_NEIGHBORHOOD', 'incident_type': 'INCIDENT_TYPE_ID',
+              'district': 'DISTRICT'},
+}
+
+#time parts a query can group by
+TIME_PARTS = {
+    'hour': pc.hour,
+    'day_of_week': pc.day_of_week,
+    'date': lambda ts: pc.floor_temporal(ts, unit='day'),
+    'month': pc.month,
+    'year': pc.year,
+}
+
+
+def service_dir():
+    return DATA_DIR / 'service'
+
+
+def _values(value):
+    if value is None:
+        return None
+    values = value.split(',') if isinstance(value, str) else list(value)
+    return tuple(sorted(str(v).strip().upper() for v in values))
+
+
+def _isin(column, values):
+    """Case-insensitive membership mask of a string or dictionary column."""
+    value_set = pa.array(values, type=pa.string())
+    if pa.types.is_dictionary(column.type):
+        #match the few distinct labels, then compare the integer indices of every row
+        masks = []
+        for chunk in column.chunks:
+            codes = pc.indices_nonzero(pc.is_in(pc.utf8_upper(pc.cast(chunk.dictionary, pa.string())),
+                                                value_set=value_set))
+            masks.append(pc.is_in(chunk.indices, value_set=pc.cast(codes, chunk.indices.type)))
+        return pa.chunked_array(masks, type=pa.bool_())
+    return pc.is_in(pc.utf8_upper(pc.cast(column, pa.string())), value_set=value_set)
+
+
+def _timestamp(value):
+    return None if value is None else pd.Timestamp(value).isoformat()
+
+
+class ResultCache:
+    """Thread-safe LRU cache of query results."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {'entries': len(self._items), 'maxsize': self.maxsize, 'hits': self.hits,
+                    'misses': self.misses, 'hit_rate': round(self.hits / total, 3) if total else None}
+
+
+def arrow_hash(name):
+    """Short hash of what an Arrow copy depends on besides the source file: schema, rules and ``FIELDS``."""
+    payload = json.dumps([schema_hash(name), rules_hash(name), FIELDS[name]], sort_keys=True).encode()
+    return hashlib.sha256(payload).hexdigest()[:12]
+
+
+def arrow_file(name):
+    """The Arrow IPC copy of a dataset's query columns, written from its Parquet cache when missing."""
+    import pyarrow.parquet as pq
+
+    from .cache import cached_path
+
+    parquet, _ = cached_path(name)
+    #the parquet name only follows the source file, a new schema or rule set rebuilds it under the same name
+    path = service_dir() / f'{parquet.stem}-{arrow_hash(name)}.arrow'
+    if not path.exists():
+        schema = pq.read_schema(parquet)
+        columns = [c for c in FIELDS[name].values() if c in schema.names]
+        #one chunk with one dictionary per column, so the kernels see contiguous arrays
+        table = pq.read_table(parquet, columns=columns).unify_dictionaries().combine_chunks()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix('.tmp')
+        with pa.OSFile(str(tmp), 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        tmp.replace(path)
+        for old in service_dir().glob(f'{name}-*.arrow'):
+            if old != path:
+                old.unlink()
+    return path
+
+
+class QueryService:
+    """Filter / group / top-N counts over memory-mapped Arrow copies of the datasets."""
+
+    def __init__(self, datasets=None, cache_size=256):
+        self.datasets = list(datasets or RAW_FILES)
+        self.cache = ResultCache(cache_size)
+        self.tables = {}
+        self._lock = threading.Lock()
+        self.version = 0
+        self.reload()
+
+    def reload(self):
+        """Map the current Arrow files and drop the cached results."""
+        tables = {}
+        for name in self.datasets:
+            source = pa.memory_map(str(arrow_file(name)))
+            tables[name] = pa.ipc.open_file(source).read_all()
+        with self._lock:
+            self.tables = tables
+            self.version += 1
+            self.cache.clear()
+        logger.info('query service loaded %s', {n: t.num_rows for n, t in tables.items()})
+        return {n: t.num_rows for n, t in tables.items()}
+
+    def _column(self, table, dataset, field):
+        column = FIELDS[dataset].get(field)
+        if column is None or column not in table.column_names:
+            raise KeyError(f'{dataset} has no {field!r} column')
+        return table[column]
+
+    def _mask(self, table, dataset, filters, start, end):
+        mask = None
+        for field, values in filters:
+            column = self._column(table, dataset, field)
+            cond = _isin(column, values)
+            mask = cond if mask is None else pc.and_(mask, cond)
+        if start is not None or end is not None:
+            ts = self._column(table, dataset, 'time')
+            for bound, compare in ((start, pc.greater_equal), (end, pc.less)):
+                if bound is not None:
+                    cond = compare(ts, pa.scalar(pd.Timestamp(bound)).cast(ts.type))
+                    mask = cond if mask is None else pc.and_(mask, cond)
+        return mask
+
+    def query(self, dataset, neighborhood=None, incident_type=None, district=None, start=None, end=None,
+              group_by=(), top=None):
+        """Row counts of ``dataset`` matching the filters, by the ``group_by`` fields.
+
+        ``neighborhood``, ``incident_type`` and ``district`` take one value,
+        a list or a comma separated string (case-insensitive); ``start`` is
+        inclusive and ``end`` exclusive. Returns a frame of the group fields
+        and ``count``, largest first, cut to ``top`` rows.
+        """
+        if dataset not in self.tables:
+            raise KeyError(f'unknown dataset {dataset!r}, expected one of {sorted(self.tables)}')
+        group_by = [group_by] if isinstance(group_by, str) else list(group_by)
+        top = None if top is None else int(top)
+        filters = tuple((field, values) for field, values in (('neighborhood', _values(neighborhood)),
+                                                              ('incident_type', _values(incident_type)),
+                                                              ('district', _values(district)))
+                        if values is not None)
+        key = (self.version, dataset, filters, _timestamp(start), _timestamp(end), tuple(group_by), top)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached.copy()
+
+        table = self.tables[dataset]
+        mask = self._mask(table, dataset, filters, start, end)
+        if mask is not None:
+            table = table.filter(mask)
+        if group_by:
+            keys = {}
+            for field in group_by:
+                if field in TIME_PARTS:
+                    keys[field] = TIME_PARTS[field](self._column(table, dataset, 'time'))
+                elif field in FIELDS[dataset]:
+                    keys[field] = self._column(table, dataset, field)
+                else:
+                    raise KeyError(f'cannot group by {field!r}, expected one of '
+                                   f'{sorted([*FIELDS[dataset], *TIME_PARTS])}')
+            grouped = pa.table(keys).group_by(list(keys)).aggregate([([], 'count_all')])
+            result = grouped.rename_columns([*keys, 'count']).to_pandas()
+            for field in group_by:
+                if isinstance(result[field].dtype, pd.CategoricalDtype):
+                    result[field] = result[field].astype('string')
+            result = result.sort_values(['count', *group_by], ascending=[False, *[True] * len(group_by)],
+                                        na_position='last', kind='stable', ignore_index=True)
+        else:
+            result = pd.DataFrame({'count': [table.num_rows]})
+        if top is not None:
+            result = result.head(top)
+        result = result[[*group_by, 'count']]
+        self.cache.put(key, result)
+        return result.copy()
+
+    def stats(self):
+        return {'datasets': {n: t.num_rows for n, t in self.tables.items()}, 'cache': self.cache.stats()}
+
+
+QUERY_PARAMS = ('neighborhood', 'incident_type', 'district', 'start', 'end', 'group_by', 'top')
+
+
+def make_server(service, host='127.0.0.1', port=8765):
+    """HTTP server answering ``GET /query/<dataset>?...``, ``/stats`` and ``POST /reload`` with JSON."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, payload):
+            body = json.dumps(payload, default=str).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = [p for p in url.path.split('/') if p]
+            if parts == ['stats']:
+                self._send(200, service.stats())
+                return
+            if len(parts) != 2 or parts[0] != 'query':
+                self._send(404, {'error': 'expected /query/<dataset> or /stats'})
+                return
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            unknown = set(params) - set(QUERY_PARAMS)
+            if unknown:
+                self._send(400, {'error': f'unknown parameters {sorted(unknown)}'})
+                return
+            if 'group_by' in params:
+                params['group_by'] = [g for g in params['group_by'].split(',') if g]
+            start = time.perf_counter()
+            try:
+                result = service.query(parts[1], **params)
+            except (KeyError, ValueError, pa.ArrowException) as e:
+                self._send(400, {'error': str(e).strip('"\'')})
+                return
+            rows = json.loads(result.to_json(orient='records', date_format='iso'))
+            self._send(200, {'rows': rows, 'seconds': round(time.perf_counter() - start, 6)})
+
+        def do_POST(self):
+            if urlparse(self.path).path.strip('/') != 'reload':
+                self._send(404, {'error': 'expected /reload'})
+                return
+            self._send(200, {'datasets': service.reload()})
+
+        def log_message(self, fmt, *args):
+            logger.debug(fmt, *args)
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def serve(service=None, host='127.0.0.1', port=8765):
+    """Serve queries on localhost until interrupted."""
+    service = service or QueryService()
+    server = make_server(service, host, port)
+    logger.warning('query service on http://%s:%d', *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
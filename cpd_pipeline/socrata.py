@@ -0,0 +1,127 @@
+"""Paginated, concurrent client for the Socrata (SODA) JSON endpoints."""
+
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from .config import SOCRATA_DOMAIN
+from .instrument import instrumented
+
+#status codes that are worth retrying (rate limit and server side errors)
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class SocrataError(RuntimeError):
+    pass
+
+
+class SocrataClient:
+    """Fetch one Socrata dataset page by page with a pooled session.
+
+    Pages are requested with ``$limit``/``$offset`` in a stable ``$order`` and
+    up to ``max_workers`` pages are in flight at once. Each page is turned into
+    its own DataFrame chunk, so callers can stream rows without holding the
+    whole JSON response in memory.
+    """
+
+    def __init__(self, dataset_id, domain=SOCRATA_DOMAIN, page_size=50000, max_workers=4,
+                 max_retries=5, backoff=0.5, timeout=60, app_token=None, session=None):
+        self.dataset_id = dataset_id
+        self.domain = domain.rstrip('/')
+        self.page_size = page_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = session or self._make_session(max_workers)
+        self.session.headers['Accept'] = 'application/json'
+        if app_token:
+            self.session.headers['X-App-Token'] = app_token
+
+    @staticmethod
+    def _make_session(pool_size):
+        #one connection pool shared by all worker threads
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1))
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    @property
+    def resource_url(self):
+        return f'{self.domain}/resource/{self.dataset_id}.json'
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, params):
+        """GET the resource with SoQL params, retrying with exponential backoff."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.get(self.resource_url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise SocrataError(f'request to {self.resource_url} failed: {e}') from e
+            else:
+                if response.status_code == 200:
+                    return response.json()
+                if response.status_code not in RETRY_STATUS or attempt == self.max_retries:
+                    raise SocrataError(f'request to {self.resource_url} failed with status '
+                                       f'code {response.status_code}: {response.text[:200]}')
+            time.sleep(self.backoff * 2 ** attempt)
+
+    def count(self, where=None):
+        params = {'$select': 'count(*) AS count'}
+        if where:
+            params['$where'] = where
+        rows = self.get(params)
+        return int(rows[0]['count']) if rows else 0
+
+    def _page_params(self, offset, total, where, select, order):
+        params = {'$limit': min(self.page_size, total - offset), '$offset': offset, '$order': order}
+        if where:
+            params['$where'] = where
+        if select:
+            params['$select'] = select
+        return params
+
+    def iter_pages(self, where=None, select=None, order=':id', limit=None):
+        """Yield the raw rows of each page, in offset order."""
+        total = self.count(where)
+        if limit is not None:
+            total = min(total, limit)
+        offsets = range(0, total, self.page_size)
+
+        #keep a bounded window of pages in flight so memory stays flat
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            pending = deque()
+            for offset in offsets:
+                pending.append(pool.submit(self.get, self._page_params(offset, total, where, select, order)))
+                if len(pending) >= self.max_workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def iter_frames(self, where=None, select=None, order=':id', limit=None):
+        """Yield one DataFrame chunk per page."""
+        for rows in self.iter_pages(where=where, select=select, order=order, limit=limit):
+            if rows:
+                yield pd.DataFrame.from_records(rows)
+
+    @instrumented(name='socrata_fetch')
+    def fetch_frame(self, where=None, select=None, order=':id', limit=None):
+        """Fetch every matching row into a single DataFrame."""
+        chunks = list(self.iter_frames(where=where, select=select, order=order, limit=limit))
+        if not chunks:
+            return pd.DataFrame()
+        return pd.concat(chunks, ignore_index=True)
@@ -0,0 +1,273 @@
+"""Aggregation queries pushed down to the Socrata SoQL endpoint.
+
+Instead of downloading raw rows and running ``value_counts`` / ``groupby``
+locally, an ``AggregateQuery`` becomes a single SoQL request with
+``$select``, ``$where``, ``$group``, ``$order`` and ``$limit``. The server
+returns only the aggregated rows. The same query can run locally over a
+cached frame (``run_local``), and ``run`` falls back to that when the API
+cannot be reached. Both paths return the same columns, dtypes and row order.
+
+    top = AggregateQuery('crime_incidents').count_by('cpd_neighborhood').top(3)
+    hourly = (AggregateQuery('crime_incidents')
+              .count_by('cpd_neighborhood', incident_hour=hour('date_reported'))
+              .isin('cpd_neighborhood', top.run()['cpd_neighborhood']))
+"""
+
+import logging
+from collections import namedtuple
+
+import pandas as pd
+import requests
+
+from .config import CALLS_FOR_SERVICE_ID, CRIME_INCIDENTS_ID
+
+logger = logging.getLogger(__name__)
+
+#socrata dataset id of each dataset name that has an api
+DATASET_IDS = {
+    'crime_incidents': CRIME_INCIDENTS_ID,
+    'calls': CALLS_FOR_SERVICE_ID,
+}
+
+Derived = namedtuple('Derived', ['kind', 'column'])
+
+#soql expression of each derived column; day of week counts from sunday = 0 like date_extract_dow
+SOQL_DERIVED = {
+    'hour': 'date_extract_hh({})',
+    'day_of_week': 'date_extract_dow({})',
+    'month': 'date_extract_m({})',
+    'year': 'date_extract_y({})',
+    'date': 'date_trunc_ymd({})',
+}
+
+
+def hour(column):
+    return Derived('hour', column)
+
+
+def day_of_week(column):
+    return Derived('day_of_week', column)
+
+
+def month(column):
+    return Derived('month', column)
+
+
+def year(column):
+    return Derived('year', column)
+
+
+def date(column):
+    return Derived('date', column)
+
+
+def quote(value):
+    """A SoQL string literal."""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def floating_timestamp(value):
+    return pd.Timestamp(value).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+class AggregateQuery:
+    """Row counts of a dataset grouped by columns and derived time parts.
+
+    Builder methods return the query itself, so calls can be chained.
+    Column names are the API's lowercase field names; locally they are
+    matched to the csv columns ignoring case.
+    """
+
+    def __init__(self, dataset):
+        if dataset not in DATASET_IDS:
+            raise KeyError(f'no api for dataset {dataset!r}, expected one of {sorted(DATASET_IDS)}')
+        self.dataset = dataset
+        self.groups = {}
+        self.ranges = []
+        self.filters = []
+        self.limit = None
+
+    def __repr__(self):
+        return f'AggregateQuery({self.dataset!r}, {self.params()})'
+
+    def count_by(self, *columns, **derived):
+        """Group by plain columns and by ``alias=hour('column')`` style derived columns."""
+        for col in columns:
+            self.groups[col] = col
+        for alias, spec in derived.items():
+            if not isinstance(spec, Derived) or spec.kind not in SOQL_DERIVED:
+                raise ValueError(f'{alias}: expected hour(), day_of_week(), month(), year() or date()')
+            self.groups[alias] = spec
+        return self
+
+    def between(self, column, start=None, end=None):
+        """Keep rows with ``start <= column < end``; either bound may be None."""
+        self.ranges.append((column, start, end))
+        return self
+
+    def isin(self, column, values):
+        self.filters.append((column, [str(v) for v in values]))
+        return self
+
+    def top(self, n):
+        """Only the ``n`` largest groups, ties broken by the group keys."""
+        self.limit = int(n)
+        return self
+
+    #soql
+
+    def _expression(self, spec):
+        return SOQL_DERIVED[spec.kind].format(spec.column) if isinstance(spec, Derived) else spec
+
+    def where(self):
+        clauses = []
+        for column, start, end in self.ranges:
+            if start is not None:
+                clauses.append(f'{column} >= {quote(floating_timestamp(start))}')
+            if end is not None:
+                clauses.append(f'{column} < {quote(floating_timestamp(end))}')
+        for column, values in self.filters:
+            clauses.append(f"{column} IN ({', '.join(quote(v) for v in values)})" if values else 'false')
+        return ' AND '.join(clauses) or None
+
+    def params(self):
+        """The SoQL query parameters of this query."""
+        expressions = [self._expression(spec) for spec in self.groups.values()]
+        select = [expr if expr == alias else f'{expr} AS {alias}'
+                  for alias, expr in zip(self.groups, expressions)]
+        params = {'$select': ', '.join([*select, 'count(*) AS count'])}
+        if expressions:
+            params['$group'] = ', '.join(expressions)
+        where = self.where()
+        if where:
+            params['$where'] = where
+        keys = ', '.join(expressions)
+        if self.limit is not None:
+            params['$order'] = 'count DESC' + (f', {keys}' if keys else '')
+            params['$limit'] = self.limit
+        elif keys:
+            params['$order'] = keys
+        return params
+
+    def run_remote(self, client=None, page_size=50000):
+        """Run the query on the server and return the aggregated rows."""
+        from .socrata import SocrataClient
+
+        own = client is None
+        client = client or SocrataClient(DATASET_IDS[self.dataset])
+        try:
+            params = self.params()
+            if self.limit is not None:
+                rows = client.get(params)
+            else:
+                #grouped results can be longer than one page, page through them in key order
+                rows, offset = [], 0
+                while True:
+                    page = client.get({**params, '$limit': page_size, '$offset': offset})
+                    rows.extend(page)
+                    if len(page) < page_size:
+                        break
+                    offset += page_size
+        finally:
+            if own:
+                client.close()
+        return self._finish(pd.DataFrame.from_records(rows, columns=[*self.groups, 'count']))
+
+    #local
+
+    @staticmethod
+    def _local_column(df, name):
+        if name in df:
+            return df[name]
+        matches = [c for c in df.columns if str(c).lower() == name.lower()]
+        if not matches:
+            raise KeyError(f'column {name!r} not found in the local data')
+        return df[matches[0]]
+
+    @staticmethod
+    def _timestamps(values):
+        if pd.api.types.is_datetime64_any_dtype(values):
+            return values
+        return pd.to_datetime(values, errors='coerce')
+
+    def local_columns(self):
+        """The csv columns the local path needs, in upper case like the exports."""
+        names = [spec.column if isinstance(spec, Derived) else spec for spec in self.groups.values()]
+        names += [c for c, _, _ in self.ranges] + [c for c, _ in self.filters]
+        return list(dict.fromkeys(n.upper() for n in names))
+
+    def run_local(self, df=None):
+        """Run the query over a frame, by default the cached copy of the csv export."""
+        if df is None:
+            from .cache import load_dataset
+
+            df = load_dataset(self.dataset, columns=self.local_columns())
+        keep = pd.Series(True, index=df.index)
+        for column, start, end in self.ranges:
+            ts = self._timestamps(self._local_column(df, column))
+            if start is not None:
+                keep &= ts >= pd.Timestamp(start)
+            if end is not None:
+                keep &= ts < pd.Timestamp(end)
+        for column, values in self.filters:
+            keep &= self._local_column(df, column).astype('string').isin(values).fillna(False)
+        df = df[keep.to_numpy()]
+
+        keys = {}
+        for alias, spec in self.groups.items():
+            if not isinstance(spec, Derived):
+                keys[alias] = self._local_column(df, spec).astype('string')
+                continue
+            ts = self._timestamps(self._local_column(df, spec.column))
+            keys[alias] = {
+                'hour': lambda: ts.dt.hour,
+                'day_of_week': lambda: (ts.dt.dayofweek + 1) % 7,
+                'month': lambda: ts.dt.month,
+                'year': lambda: ts.dt.year,
+                'date': lambda: ts.dt.normalize(),
+            }[spec.kind]()
+        if keys:
+            frame = pd.DataFrame(keys).reset_index(drop=True)
+            counts = frame.groupby(list(keys), dropna=False, observed=True, sort=False).size()
+            result = counts.reset_index(name='count')
+        else:
+            result = pd.DataFrame({'count': [len(df)]})
+        return self._finish(result)
+
+    def _finish(self, result):
+        """Same dtypes and row order for both paths."""
+        for alias, spec in self.groups.items():
+            kind = spec.kind if isinstance(spec, Derived) else None
+            if kind == 'date':
+                #parsed iso strings come back in microseconds, local timestamps in nanoseconds
+                result[alias] = pd.to_datetime(result[alias], errors='coerce').dt.tz_localize(None).dt.as_unit('ns')
+            elif kind:
+                result[alias] = pd.to_numeric(result[alias], errors='coerce').astype('Int64')
+            else:
+                result[alias] = result[alias].astype('string')
+        result['count'] = pd.to_numeric(result['count']).astype('int64')
+        keys = list(self.groups)
+        if self.limit is not None:
+            result = result.sort_values(['count', *keys], ascending=[False, *[True] * len(keys)],
+                                        na_position='first', kind='stable').head(self.limit)
+        elif keys:
+            result = result.sort_values(keys, na_position='first', kind='stable')
+        return result[[*keys, 'count']].reset_index(drop=True)
+
+    def run(self, client=None, df=None, fallback=True):
+        """Run on the server, or locally when the API fails and ``fallback`` is set.
+
+        ``result.attrs['source']`` says which path answered.
+        """
+        from .socrata import SocrataError
+
+        try:
+            result = self.run_remote(client)
+            result.attrs['source'] = 'remote'
+        except (SocrataError, requests.RequestException) as e:
+            if not fallback:
+                raise
+            logger.warning('soql query failed (%s), running it on the local data', e)
+            result = self.run_local(df)
+            result.attrs['source'] = 'local'
+        return result
@@ -0,0 +1,168 @@
+"""Uniform grid index over ``LATITUDE_X`` / ``LONGITUDE_X`` for hotspot queries.
+
+Points are projected to meters with an equirectangular projection centred on
+Cincinnati (accurate to well under 1% across the city) and bucketed into
+square cells. Points are kept sorted by cell id, so each cell is one slice of
+the arrays. Radius and k-nearest queries only look at the cells that can hold
+an answer. Density counts come straight from the cell slices.
+
+``add`` appends new points to a small unsorted buffer. The buffer is merged
+into the sorted arrays once it passes ``rebuild_fraction`` of the index, so
+incremental updates stay cheap.
+"""
+
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_M = 6_371_000.0
+#downtown cincinnati, origin of the projection
+ORIGIN_LAT, ORIGIN_LON = 39.1031, -84.5120
+
+
+def project(lat, lon, origin_lat=ORIGIN_LAT, origin_lon=ORIGIN_LON):
+    """Latitude / longitude in degrees to (x, y) meters from the origin."""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    x = np.radians(lon - origin_lon) * EARTH_RADIUS_M * np.cos(np.radians(origin_lat))
+    y = np.radians(lat - origin_lat) * EARTH_RADIUS_M
+    return x, y
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+class GridIndex:
+    """Grid bucket index of points with optional timestamps.
+
+    ``cell_size`` is the cell edge in meters; it should be close to the
+    typical query radius.
+    """
+
+    def __init__(self, cell_size=250.0, rebuild_fraction=0.05):
+        self.cell_size = float(cell_size)
+        self.rebuild_fraction = rebuild_fraction
+        self._x = np.empty(0)
+        self._y = np.empty(0)
+        self._t = np.empty(0, dtype='datetime64[ns]')
+        self._ids = np.empty(0, dtype=np.int64)
+        self._cells = np.empty(0, dtype=np.int64)
+        self._cell_keys = np.empty(0, dtype=np.int64)
+        self._cell_starts = np.empty(0, dtype=np.int64)
+        self._pending = []
+        self._next_id = 0
+
+    @classmethod
+    def from_frame(cls, df, lat='LATITUDE_X', lon='LONGITUDE_X', time=None, **kwargs):
+        """Index the rows of a frame; point ids are the frame's positional row numbers."""
+        index = cls(**kwargs)
+        index.add(df[lat].to_numpy(), df[lon].to_numpy(), None if time is None else df[time].to_numpy())
+        return index
+
+    def __len__(self):
+        return len(self._x) + sum(len(p[0]) for p in self._pending)
+
+    def _cell_of(self, x, y):
+        #pack (column, row) into one int64 key, offset so negative coordinates work
+        cx = np.floor(x / self.cell_size).astype(np.int64) + (1 << 20)
+        cy = np.floor(y / self.cell_size).astype(np.int64) + (1 << 20)
+        return (cx << 21) | cy
+
+    def add(self, lat, lon, times=None):
+        """Add points, returns their ids. Points with missing coordinates are skipped."""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        ids = self._next_id + np.arange(len(lat), dtype=np.int64)
+        self._next_id += len(lat)
+        keep = ~(np.isnan(lat) | np.isnan(lon))
+        x, y = project(lat[keep], lon[keep])
+        t = (np.full(keep.sum(), np.datetime64('NaT'), dtype='datetime64[ns]') if times is None
+             else pd.to_datetime(np.asarray(times)[keep]).to_numpy(dtype='datetime64[ns]'))
+        self._pending.append((x, y, t, ids[keep]))
+        if sum(len(p[0]) for p in self._pending) > self.rebuild_fraction * max(len(self._x), 1):
+            self._merge_pending()
+        return ids
+
+    def _merge_pending(self):
+        if not self._pending:
+            return
+        parts = [(self._x, self._y, self._t, self._ids), *self._pending]
+        self._pending = []
+        x, y, t, ids = (np.concatenate(cols) for cols in zip(*parts))
+        cells = self._cell_of(x, y)
+        order = np.argsort(cells, kind='stable')
+        self._x, self._y, self._t, self._ids, self._cells = x[order], y[order], t[order], ids[order], cells[order]
+        self._cell_keys, self._cell_starts = np.unique(self._cells, return_index=True)
+
+    def _candidates(self, x, y, radius):
+        """Positions (into the sorted arrays) of points in the cells overlapping the query circle."""
+        self._merge_pending()
+        reach = int(np.ceil(radius / self.cell_size))
+        cx, cy = np.floor(x / self.cell_size), np.floor(y / self.cell_size)
+        dx, dy = np.meshgrid(np.arange(-reach, reach + 1), np.arange(-reach, reach + 1))
+        keys = self._cell_of((cx + dx.ravel() + 0.5) * self.cell_size, (cy + dy.ravel() + 0.5) * self.cell_size)
+        if not len(self._cell_keys):
+            return np.empty(0, dtype=np.int64)
+        found = np.searchsorted(self._cell_keys, keys)
+        inside = found < len(self._cell_keys)
+        found = found[inside][self._cell_keys[found[inside]] == keys[inside]]
+        if not len(found):
+            return np.empty(0, dtype=np.int64)
+        ends = np.append(self._cell_starts[1:], len(self._cells))
+        return np.concatenate([np.arange(self._cell_starts[i], ends[i]) for i in found])
+
+    def radius(self, lat, lon, radius_m, start=None, end=None):
+        """Ids and distances (meters) of points within ``radius_m``, optionally within a time window."""
+        x, y = project(lat, lon)
+        pos = self._candidates(float(x), float(y), radius_m)
+        dist = np.hypot(self._x[pos] - x, self._y[pos] - y)
+        keep = dist <= radius_m
+        if start is not None:
+            keep &= self._t[pos] >= np.datetime64(pd.Timestamp(start), 'ns')
+        if end is not None:
+            keep &= self._t[pos] < np.datetime64(pd.Timestamp(end), 'ns')
+        order = np.argsort(dist[keep], kind='stable')
+        return self._ids[pos[keep]][order], dist[keep][order]
+
+    def nearest(self, lat, lon, k=5):
+        """Ids and distances (meters) of the ``k`` nearest points."""
+        self._merge_pending()
+        k = min(k, len(self._x))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        x, y = project(lat, lon)
+        radius = self.cell_size
+        while True:
+            pos = self._candidates(float(x), float(y), radius)
+            if len(pos) >= k or len(pos) == len(self._x):
+                dist = np.hypot(self._x[pos] - x, self._y[pos] - y)
+                order = np.argsort(dist, kind='stable')[:k]
+                #the k-th distance must be inside the searched square, otherwise a closer point may sit outside it
+                if dist[order[-1]] <= radius or len(pos) == len(self._x):
+                    return self._ids[pos[order]], dist[order]
+            radius *= 2
+
+    def density(self, start=None, end=None):
+        """Point counts per grid cell as a frame with cell centre lat/lon, sorted by count."""
+        self._merge_pending()
+        keep = np.ones(len(self._x), dtype=bool)
+        if start is not None:
+            keep &= self._t >= np.datetime64(pd.Timestamp(start), 'ns')
+        if end is not None:
+            keep &= self._t < np.datetime64(pd.Timestamp(end), 'ns')
+        keys, counts = np.unique(self._cells[keep], return_counts=True)
+        cx = (keys >> 21) - (1 << 20)
+        cy = (keys & ((1 << 21) - 1)) - (1 << 20)
+        lat = ORIGIN_LAT + np.degrees((cy + 0.5) * self.cell_size / EARTH_RADIUS_M)
+        lon = ORIGIN_LON + np.degrees((cx + 0.5) * self.cell_size / (EARTH_RADIUS_M * np.cos(np.radians(ORIGIN_LAT))))
+        out = pd.DataFrame({'cell': keys, 'lat': lat, 'lon': lon, 'count': counts})
+        return out.sort_values('count', ascending=False, ignore_index=True)
+
+
+def brute_force_radius(lat_points, lon_points, lat, lon, radius_m):
+    """Reference answer: haversine distance to every point."""
+    dist = haversine_m(np.asarray(lat_points, dtype=np.float64), np.asarray(lon_points, dtype=np.float64), lat, lon)
+    ids = np.flatnonzero(dist <= radius_m)
+    return ids[np.argsort(dist[ids], kind='stable')], np.sort(dist[ids])
@@ -0,0 +1,246 @@
+"""Grouped counts under a memory budget, spilling hash partitions to disk.
+
+``GroupCounter`` reduces each chunk to counts (and sums of value columns)
+by its keys and keeps the partial tables in memory. When they grow past the
+budget, it first merges them. If the merged table is still more than half
+the budget, the key combinations don't fit in memory. The table is then
+split by a hash of the keys into ``partitions`` Parquet files under
+``data/spill/`` and memory is freed. At the end each partition is merged
+on its own, so only one partition's groups are in memory at a time. A key
+always hashes to the same partition, so the merged partitions never
+overlap. A skewed partition that doesn't fit in the budget either is merged
+by a nested counter, which splits it again on the next digits of the same
+hash, so the final merge stays within the budget too.
+
+The budget comes from ``CPD_MEMORY_BUDGET_MB`` (or ``run --memory-budget``).
+The budget, peak table size and spilled bytes are added to the
+``grouped_counts`` record of the stage log.
+"""
+
+import shutil
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .config import DATA_DIR, MEMORY_BUDGET_MB
+from .instrument import measure
+
+MB = 2 ** 20
+
+#time parts a key can take from a timestamp column, written 'COLUMN:part'
+TIME_PARTS = {
+    'date': lambda ts: ts.dt.normalize(),
+    'hour': lambda ts: ts.dt.hour.astype('Int8'),
+    'day_of_week': lambda ts: ts.dt.dayofweek.astype('Int8'),
+    'month': lambda ts: ts.dt.month.astype('Int8'),
+    'year': lambda ts: ts.dt.year.astype('Int16'),
+}
+
+
+def spill_dir():
+    return DATA_DIR / 'spill'
+
+
+def key_frame(chunk, keys):
+    """The key columns of a chunk; ``'CREATE_TIME_INCIDENT:hour'`` derives a time part."""
+    out = {}
+    for key in keys:
+        col, _, part = key.partition(':')
+        values = chunk[col]
+        if part:
+            if part not in TIME_PARTS:
+                raise ValueError(f'{key}: unknown time part, expected one of {sorted(TIME_PARTS)}')
+            if not pd.api.types.is_datetime64_any_dtype(values):
+                values = pd.to_datetime(values, errors='coerce')
+            values = TIME_PARTS[part](values)
+        out[key] = values
+    return pd.DataFrame(out, index=chunk.index)
+
+
+def _frame_bytes(frame):
+    return int(frame.memory_usage(deep=True, index=True).sum())
+
+
+def _combine(parts):
+    if len(parts) == 1:
+        return parts[0]
+    merged = pd.concat(parts)
+    return merged.groupby(level=list(range(merged.index.nlevels)), dropna=False, sort=False).sum()
+
+
+class GroupCounter:
+    """Row counts and value sums by key, within a memory budget.
+
+    ``update`` takes frames holding the key and value columns, ``result``
+    returns one flat frame of the keys, value sums and ``counts``, sorted by
+    key. ``iter_result`` yields it one partition at a time, so a result
+    larger than memory can be written out as it is merged.
+    """
+
+    def __init__(self, keys, values=(), budget_mb=None, partitions=16, directory=None, level=0):
+        self.keys = list(keys)
+        self.values = list(values)
+        self.budget = int((budget_mb or MEMORY_BUDGET_MB) * MB)
+        self.partitions = partitions
+        self.directory = Path(directory or spill_dir()) / uuid.uuid4().hex[:12]
+        #nested counters of skewed partitions split on the next base-``partitions`` digit of the hash
+        self.level = level
+        self._parts = []
+        self._bytes = 0
+        self.peak_bytes = 0
+        self.spills = 0
+        self.spilled_bytes = 0
+        self.repartitions = 0
+        self.rows = 0
+        self.groups = None
+
+    def _reduce(self, frame):
+        grouped = frame.groupby(self.keys, dropna=False, observed=True, sort=False)
+        part = grouped[self.values].sum() if self.values else pd.DataFrame(index=grouped.size().index)
+        part['counts'] = grouped.size().astype('int64')
+        #labels as plain strings, so partial tables of every chunk concatenate and hash alike
+        part = part.reset_index()
+        for key in self.keys:
+            if isinstance(part[key].dtype, pd.CategoricalDtype) or part[key].dtype == object:
+                part[key] = part[key].astype('string')
+        return part.set_index(self.keys)
+
+    def update(self, frame):
+        self.rows += len(frame)
+        return self._add(self._reduce(frame))
+
+    def _add(self, part):
+        #part is a table of partial counts (and sums) indexed by the keys
+        self._parts.append(part)
+        self._bytes += _frame_bytes(part)
+        self.peak_bytes = max(self.peak_bytes, self._bytes)
+        if self._bytes > self.budget:
+            table = _combine(self._parts)
+            self._parts, self._bytes = [table], _frame_bytes(table)
+            #merged and still large: the groups don't fit, move them to disk
+            if self._bytes > self.budget // 2 and self._can_split():
+                self._spill()
+        return self
+
+    def _can_split(self):
+        #past the last digit of the 64 bit hash every key lands in the same partition
+        return self.partitions ** (self.level + 1) <= 2 ** 64
+
+    def _spill(self):
+        if not self._parts:
+            return
+        table = _combine(self._parts).reset_index()
+        self._parts, self._bytes = [], 0
+        hashes = pd.util.hash_pandas_object(table[self.keys], index=False).to_numpy()
+        partition = (hashes // np.uint64(self.partitions ** self.level)) % np.uint64(self.partitions)
+        order = np.argsort(partition, kind='stable')
+        bounds = np.searchsorted(partition[order], np.arange(self.partitions + 1))
+        for p in range(self.partitions):
+            rows = order[bounds[p]:bounds[p + 1]]
+            if not len(rows):
+                continue
+            path = self.directory / f'{p:03d}' / f'{self.spills:05d}.parquet'
+            path.parent.mkdir(parents=True, exist_ok=True)
+            table.iloc[rows].to_parquet(path, index=False)
+            self.spilled_bytes += path.stat().st_size
+        self.spills += 1
+
+    def iter_result(self):
+        """Yield the merged table, one hash partition at a time once anything was spilled."""
+        try:
+            if not self.spills:
+                if self._parts:
+                    yield self._finish(_combine(self._parts).reset_index())
+                return
+            self._spill()
+            for p in range(self.partitions):
+                files = sorted((self.directory / f'{p:03d}').glob('*.parquet'))
+                if not files:
+                    continue
+                #merged by a nested counter, which splits the partition again if it is over budget
+                nested = GroupCounter(self.keys, self.values, budget_mb=self.budget / MB,
+                                      partitions=self.partitions, directory=self.directory / f'{p:03d}',
+                                      level=self.level + 1)
+                for f in files:
+                    nested._add(pd.read_parquet(f).set_index(self.keys))
+                    f.unlink()
+                yield from nested.iter_result()
+                self._absorb(nested)
+        finally:
+            self.cleanup()
+
+    def _absorb(self, nested):
+        self.groups = (self.groups or 0) + (nested.groups or 0)
+        self.peak_bytes = max(self.peak_bytes, nested.peak_bytes)
+        self.spills += nested.spills
+        self.spilled_bytes += nested.spilled_bytes
+        self.repartitions += nested.repartitions + (1 if nested.spills else 0)
+
+    def _finish(self, table):
+        self.groups = (self.groups or 0) + len(table)
+        return table.sort_values(self.keys, na_position='first', ignore_index=True)
+
+    def result(self):
+        parts = list(self.iter_result())
+        if not parts:
+            return pd.DataFrame(columns=[*self.keys, *self.values, 'counts'])
+        table = parts[0] if len(parts) == 1 else pd.concat(parts, ignore_index=True)
+        return table.sort_values(self.keys, na_position='first', ignore_index=True)
+
+    def cleanup(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def stats(self):
+        return {'memory_budget_mb': round(self.budget / MB, 1), 'peak_table_mb': round(self.peak_bytes / MB, 2),
+                'spills': self.spills, 'spilled_mb': round(self.spilled_bytes / MB, 2),
+                'partitions': self.partitions if self.spills else 0, 'repartitions': self.repartitions,
+                'groups': self.groups}
+
+
+def grouped_counts(path, name, keys, values=(), budget_mb=None, chunksize=500_000, out=None, partitions=16,
+                   validate=True):
+    """Stream a csv / parquet file and count its rows by ``keys`` within the memory budget.
+
+    Returns the counts frame, or with ``out`` writes it to that Parquet file
+    partition by partition and returns the path. The chunks of a csv are
+    validated on the way, the rule counts go to the stage log record.
+    """
+    from .streaming import iter_chunks
+    from .validation import validator_for
+
+    columns = list(dict.fromkeys([k.partition(':')[0] for k in keys] + list(values)))
+    counter = GroupCounter(keys, values, budget_mb=budget_mb, partitions=partitions)
+    validator = validator_for(path, name, validate)
+    with measure('grouped_counts') as record:
+        for chunk in iter_chunks(path, name, columns=columns, chunksize=chunksize, validator=validator):
+            frame = key_frame(chunk, keys)
+            for col in values:
+                frame[col] = chunk[col]
+            counter.update(frame)
+        record['rows_in'] = counter.rows
+        if validator is not None:
+            record['validation'] = validator.close()
+        if out is None:
+            result = counter.result()
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            out = Path(out)
+            out.parent.mkdir(parents=True, exist_ok=True)
+            writer = None
+            try:
+                for part in counter.iter_result():
+                    table = pa.Table.from_pandas(part, preserve_index=False)
+                    if writer is None:
+                        writer = pq.ParquetWriter(out, table.schema)
+                    writer.write_table(table.cast(writer.schema))
+            finally:
+                if writer is not None:
+                    writer.close()
+            result = out
+        record['rows_out'] = counter.groups
+        record.update(counter.stats())
+    return result
@@ -0,0 +1,172 @@
+"""Pipeline stages, declared with the files they read and write.
+
+Each stage is a plain function registered with ``@stage``. Its inputs and
+outputs are paths under the configured data folders, so the runner can order
+the stages (a stage depends on whichever stage writes one of its inputs) and
+skip the ones whose inputs, parameters and code have not changed.
+
+This module only imports the standard library and ``config``. pandas,
+sklearn and the plotting libraries are imported inside the stage bodies, so
+``python -m cpd_pipeline list`` starts instantly.
+"""
+
+import json
+from pathlib import Path
+
+from .config import CACHE_DIR, DATA_DIR, RAW_DIR, RAW_FILES
+
+STAGES = {}
+
+
+class Stage:
+    """A named step with input / output paths and default parameters."""
+
+    def __init__(self, name, func, inputs=(), outputs=(), params=None, default=True, always=False):
+        self.name = name
+        self.func = func
+        self.inputs = [Path(p) for p in inputs]
+        self.outputs = [Path(p) for p in outputs]
+        self.params = dict(params or {})
+        #default stages run when no --stage is given, always stages never skip (e.g. api downloads)
+        self.default = default
+        self.always = always
+
+    def __repr__(self):
+        return f'Stage({self.name!r})'
+
+    def run(self, **params):
+        return self.func(self, **{**self.params, **params})
+
+
+def stage(name, inputs=(), outputs=(), params=None, default=True, always=False):
+    """Register the decorated function as a pipeline stage."""
+    def register(func):
+        STAGES[name] = Stage(name, func, inputs, outputs, params, default, always)
+        return func
+    return register
+
+
+def reports_dir():
+    return DATA_DIR / 'reports'
+
+
+def manifest(name):
+    #the cache manifest changes whenever the typed parquet copy is rebuilt
+    return CACHE_DIR / f'{name}.json'
+
+
+def _write_json(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data, indent=2, default=str))
+
+
+def _write_parquet(path, df):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(path, index=False)
+
+
+#download: always hits the api, not part of the default run. each writes its own store folder
+for _name in ('crime_incidents', 'calls_for_service'):
+    @stage(f'sync_{_name}', outputs=[DATA_DIR / 'store' / _name], default=False, always=True)
+    def _sync(st, full=False, _name=_name):
+        from .sync import sync_dataset
+
+        return sync_dataset(_name, full=full)
+
+
+#typed parquet cache of every raw csv export
+for _name in RAW_FILES:
+    @stage(f'cache_{_name}', inputs=[RAW_DIR / RAW_FILES[_name]], outputs=[manifest(_name)])
+    def _cache(st, _name=_name):
+        from .cache import build_cache
+
+        path = build_cache(_name)
+        #per-rule quarantine counts, as build_cache wrote them to the manifest
+        return {'parquet': str(path), 'validation': json.loads(st.outputs[0].read_text())['validation']}
+
+
+#profile report of every dataset
+for _name in RAW_FILES:
+    @stage(f'profile_{_name}', inputs=[manifest(_name)], outputs=[reports_dir() / f'profile_{_name}.json'],
+           params={'approximate': True, 'sample_size': 100_000})
+    def _profile(st, approximate, sample_size, _name=_name):
+        from .cache import load_dataset
+        from .profiling import profile_dataframe
+
+        report = profile_dataframe(load_dataset(_name), _name, approximate=approximate, sample_size=sample_size)
+        _write_json(st.outputs[0], report)
+        return {'rows': report['rows']}
+
+
+@stage('calls_summary', inputs=[manifest('calls')],
+       outputs=[reports_dir() / f'calls_{t}.parquet' for t in ('day_type', 'hour_neighborhood', 'response_time')])
+def calls_summary(st):
+    from .streaming import aggregate_calls
+
+    #streams the cached parquet chunk by chunk instead of loading the whole table
+    tables = aggregate_calls(CACHE_DIR / json.loads(st.inputs[0].read_text())['cache_file'])
+    for path, key in zip(st.outputs, ('day_type_counts', 'hour_neighborhood_counts', 'response_time')):
+        _write_parquet(path, tables[key])
+    return {'rows': tables['rows']}
+
+
+#finer calls counts than the charts need, the key combinations may not fit in memory
+@stage('calls_wide_counts', inputs=[manifest('calls')], outputs=[reports_dir() / 'calls_wide_counts.parquet'],
+       params={'keys': ['CREATE_TIME_INCIDENT:date', 'CREATE_TIME_INCIDENT:hour', 'SNA_NEIGHBORHOOD',
+                        'INCIDENT_TYPE_ID'], 'memory_budget_mb': None},
+       default=False)
+def calls_wide_counts(st, keys, memory_budget_mb):
+    from .spill import grouped_counts
+
+    cached = CACHE_DIR / json.loads(st.inputs[0].read_text())['cache_file']
+    grouped_counts(cached, 'calls', keys, budget_mb=memory_budget_mb, out=st.outputs[0])
+    return {'parquet': str(st.outputs[0])}
+
+
+@stage('rollup', inputs=[manifest(n) for n in RAW_FILES], outputs=[DATA_DIR / 'rollup' / 'cube.parquet'])
+def rollup(st):
+    from .cache import load_dataset
+    from .rollup import DIMENSIONS, RECORD_KEYS, RollupCube
+
+    cube = RollupCube(st.outputs[0])
+    for name, columns in DIMENSIONS.items():
+        #the record keys too, so later incremental updates can skip rows counted here
+        keys = [RECORD_KEYS[name]] if name in RECORD_KEYS else []
+        cube.rebuild(name, load_dataset(name, columns=[*columns, *keys]), save=False)
+    cube.save()
+    return {'cells': len(cube.cube)}
+
+
+@stage('train_response_time', inputs=[manifest('calls')],
+       outputs=[DATA_DIR / 'models' / 'response_time' / 'meta.json', reports_dir() / 'training.csv'],
+       params={'kinds': ['linear', 'hgb', 'forest'], 'sample_frac': None, 'fill': 'drop'})
+def train_response_time(st, kinds, sample_frac, fill):
+    from .artifacts import save_artifacts
+    from .cache import load_dataset
+    from .features import response_time_features
+    from .training import train_response_time_models
+
+    #quality_flags lets response_time_features drop the impossible response times
+    calls = load_dataset('calls', columns=['CREATE_TIME_INCIDENT', 'DISPATCH_TIME_PRIMARY_UNIT',
+                                           'ARRIVAL_TIME_PRIMARY_UNIT', 'SNA_NEIGHBORHOOD',
+                                           'INCIDENT_TYPE_ID', 'PRIORITY', 'quality_flags'])
+    X, y, labels = response_time_features(calls, fill=fill)
+    models, results = train_response_time_models(X, y, kinds=kinds, sample_frac=sample_frac,
+                                                 strata=X[:, 3])
+    best = results['mae'].idxmin()
+    save_artifacts('response_time', models[best], X, y, labels=labels, root=st.outputs[0].parent.parent)
+    st.outputs[1].parent.mkdir(parents=True, exist_ok=True)
+    results.to_csv(st.outputs[1])
+    return {'rows': len(y), 'best': best}
+
+
+@stage('charts', inputs=[DATA_DIR / 'rollup' / 'cube.parquet', reports_dir() / 'calls_day_type.parquet'],
+       outputs=[DATA_DIR / 'charts' / 'charts.json'], params={'year': 2024, 'workers': None})
+def charts(st, year, workers):
+    import pandas as pd
+
+    from .charts import notebook_tables, render_all
+    from .rollup import RollupCube
+
+    tables = notebook_tables(RollupCube(st.inputs[0]), pd.read_parquet(st.inputs[1]), year=year)
+    return render_all(tables, out_dir=st.outputs[0].parent, workers=workers)
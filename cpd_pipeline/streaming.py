@@ -0,0 +1,188 @@
+"""Chunked aggregation of the calls for service file with bounded memory.
+
+The calls export is read in chunks (``read_csv(chunksize=...)`` for csv,
+a PyArrow dataset scanner for Parquet). Each chunk is reduced to small partial
+aggregates, which are merged as we go, so peak memory depends on the chunk
+size and the number of groups, not on the size of the file.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .instrument import instrumented
+from .schemas import apply_schema, read_csv_typed
+from .validation import validator_for
+
+DAY_ORDER = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+MONTH_ORDER = ['January', 'February', 'March', 'April', 'May', 'June',
+               'July', 'August', 'September', 'October', 'November', 'December']
+
+#columns the calls aggregates need, nothing else is read
+CALLS_COLUMNS = ['CREATE_TIME_INCIDENT', 'DISPATCH_TIME_PRIMARY_UNIT', 'ARRIVAL_TIME_PRIMARY_UNIT',
+                 'INCIDENT_TYPE_ID', 'SNA_NEIGHBORHOOD']
+
+
+def iter_chunks(path, name, columns=None, chunksize=500_000, validator=None):
+    """Yield typed DataFrame chunks of a csv or parquet file, optionally validated first.
+
+    With a validator, the columns its rules read are loaded too and dropped
+    again after the check, so the chunks only hold ``columns`` (and
+    ``quality_flags``).
+    """
+    path = Path(path)
+    if path.suffix == '.parquet':
+        import pyarrow.dataset as ds
+
+        dataset = ds.dataset(path, format='parquet')
+        available = dataset.schema.names
+    else:
+        available = pd.read_csv(path, nrows=0).columns
+    extra = []
+    if columns is not None:
+        columns = [c for c in columns if c in available]
+        if validator is not None:
+            extra = [c for c in validator.columns if c in available and c not in columns]
+        columns = columns + extra
+
+    if path.suffix == '.parquet':
+        batches = dataset.to_batches(columns=columns, batch_size=chunksize)
+        chunks = (apply_schema(validator.check(b.to_pandas()) if validator is not None else b.to_pandas(), name)
+                  for b in batches)
+    else:
+        chunks = read_csv_typed(path, name, validator=validator, usecols=columns, chunksize=chunksize)
+    for chunk in chunks:
+        yield chunk.drop(columns=extra) if extra else chunk
+
+
+def _add(total, part):
+    if total is None:
+        return part
+    return total.add(part, fill_value=0)
+
+
+class CallsAggregator:
+    """Running partial aggregates over chunks of the calls data.
+
+    ``update`` folds one chunk in, ``merge`` folds in another aggregator (for
+    example one built by a worker process) and ``result`` returns the tables
+    the charts and the response time analysis use.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.day_type = None
+        self.hour_neighborhood = None
+        self.response_sum = None
+        self.response_count = None
+
+    def update(self, chunk):
+        self.rows += len(chunk)
+        created = pd.to_datetime(chunk['CREATE_TIME_INCIDENT'])
+        incident_type = chunk['INCIDENT_TYPE_ID'].astype('string')
+        neighborhood = chunk['SNA_NEIGHBORHOOD'].astype('string')
+
+        #counts by day of week (0 = monday) and incident type, rows without a valid time are skipped
+        valid = created.notna()
+        part = pd.DataFrame({'day': created[valid].dt.dayofweek.astype('int8'), 'type': incident_type[valid]})
+        self.day_type = _add(self.day_type, part.groupby(['day', 'type']).size())
+
+        #counts by hour of day and neighborhood
+        part = pd.DataFrame({'hour': created[valid].dt.hour.astype('int8'), 'neighborhood': neighborhood[valid]})
+        self.hour_neighborhood = _add(self.hour_neighborhood, part.groupby(['hour', 'neighborhood']).size())
+
+        #response time sums and counts by incident type, in minutes
+        dispatch = pd.to_datetime(chunk['DISPATCH_TIME_PRIMARY_UNIT'])
+        arrival = pd.to_datetime(chunk['ARRIVAL_TIME_PRIMARY_UNIT'])
+        minutes = (arrival - dispatch).dt.total_seconds() / 60
+        part = pd.DataFrame({'type': incident_type, 'minutes': minutes}).dropna()
+        grouped = part.groupby('type')['minutes']
+        self.response_sum = _add(self.response_sum, grouped.sum())
+        self.response_count = _add(self.response_count, grouped.size())
+        return self
+
+    def merge(self, other):
+        self.rows += other.rows
+        for attr in ('day_type', 'hour_neighborhood', 'response_sum', 'response_count'):
+            theirs = getattr(other, attr)
+            if theirs is not None:
+                setattr(self, attr, _add(getattr(self, attr), theirs))
+        return self
+
+    def result(self):
+        """Return the merged tables as DataFrames."""
+        day_type = _counts_frame(self.day_type, ['day', 'INCIDENT_TYPE_ID'])
+        day_type.insert(0, 'DAY_OF_WEEK', np.asarray(DAY_ORDER, dtype=object)[day_type.pop('day').to_numpy()])
+        day_type = day_type.sort_values(['DAY_OF_WEEK', 'INCIDENT_TYPE_ID'], ignore_index=True)
+
+        hour_neighborhood = _counts_frame(self.hour_neighborhood, ['incident_hour', 'SNA_NEIGHBORHOOD'])
+
+        if self.response_sum is None:
+            response = pd.DataFrame(columns=['INCIDENT_TYPE_ID', 'total_minutes', 'count', 'mean_minutes'])
+        else:
+            response = pd.DataFrame({'total_minutes': self.response_sum,
+                                     'count': self.response_count.astype('int64')})
+            response['mean_minutes'] = response['total_minutes'] / response['count']
+            response = response.rename_axis('INCIDENT_TYPE_ID').reset_index()
+        return {'rows': self.rows, 'day_type_counts': day_type,
+                'hour_neighborhood_counts': hour_neighborhood, 'response_time': response}
+
+
+def _counts_frame(counts, names):
+    if counts is None:
+        return pd.DataFrame(columns=[*names, 'counts'])
+    counts = counts.astype('int64')
+    counts.index = counts.index.set_names(names)
+    return counts.reset_index(name='counts').sort_values(names, ignore_index=True)
+
+
+@instrumented
+def aggregate_calls(path, chunksize=500_000, validate=True):
+    """Stream a calls csv/parquet file and return the aggregate tables.
+
+    The chunks of a csv are validated on the way, like the cache does, and
+    the rule counts are returned under ``'validation'``.
+    """
+    agg = CallsAggregator()
+    validator = validator_for(path, 'calls', validate)
+    for chunk in iter_chunks(path, 'calls', columns=CALLS_COLUMNS, chunksize=chunksize, validator=validator):
+        agg.update(chunk)
+    result = agg.result()
+    if validator is not None:
+        result['validation'] = validator.close()
+    return result
+
+
+def aggregate_calls_in_memory(df):
+    """The same tables computed the way the notebook does, on a fully loaded frame."""
+    df = df.copy()
+    df['CREATE_TIME_INCIDENT'] = pd.to_datetime(df['CREATE_TIME_INCIDENT'], errors='coerce')
+    df['DAY_OF_WEEK'] = df['CREATE_TIME_INCIDENT'].dt.day_name()
+    df['incident_hour'] = df['CREATE_TIME_INCIDENT'].dt.hour
+    df['INCIDENT_TYPE_ID'] = df['INCIDENT_TYPE_ID'].astype('string')
+    df['SNA_NEIGHBORHOOD'] = df['SNA_NEIGHBORHOOD'].astype('string')
+
+    day_type = df.groupby(['DAY_OF_WEEK', 'INCIDENT_TYPE_ID']).size().reset_index(name='counts')
+    hour_neighborhood = df.groupby(['incident_hour', 'SNA_NEIGHBORHOOD']).size().reset_index(name='counts')
+    hour_neighborhood['incident_hour'] = hour_neighborhood['incident_hour'].astype('int8')
+
+    arrival = pd.to_datetime(df['ARRIVAL_TIME_PRIMARY_UNIT'], errors='coerce')
+    dispatch = pd.to_datetime(df['DISPATCH_TIME_PRIMARY_UNIT'], errors='coerce')
+    df['response_time'] = (arrival - dispatch).dt.total_seconds() / 60
+    grouped = df.dropna(subset=['response_time']).groupby('INCIDENT_TYPE_ID')['response_time']
+    response = pd.DataFrame({'total_minutes': grouped.sum(), 'count': grouped.size()})
+    response['mean_minutes'] = response['total_minutes'] / response['count']
+    return {'rows': len(df),
+            'day_type_counts': day_type.sort_values(['DAY_OF_WEEK', 'INCIDENT_TYPE_ID'], ignore_index=True),
+            'hour_neighborhood_counts': hour_neighborhood.sort_values(['incident_hour', 'SNA_NEIGHBORHOOD'],
+                                                                      ignore_index=True),
+            'response_time': response.reset_index()}
+
+
+def top_incident_types(day_type_counts, n=5):
+    """Filter the day/type table to the top incident types, like the plotly chart cell."""
+    top = day_type_counts['INCIDENT_TYPE_ID'].value_counts().nlargest(n).index
+    filtered = day_type_counts[day_type_counts['INCIDENT_TYPE_ID'].isin(top)].copy()
+    filtered['DAY_OF_WEEK'] = pd.Categorical(filtered['DAY_OF_WEEK'], categories=DAY_ORDER, ordered=True)
+    return filtered
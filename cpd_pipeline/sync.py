@@ -0,0 +1,195 @@
+"""Incremental sync of the city datasets into a local Parquet store.
+
+Every dataset keeps a high-water mark (the largest value seen in its
+watermark column). Later runs only ask Socrata for rows at or after that
+mark with a ``$where`` filter. Rows whose record key is not in the store
+yet, and re-fetched rows whose content changed upstream, are appended as a
+new Parquet part file; ``load_store`` keeps the last version of each key.
+"""
+
+import json
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from .config import CALLS_FOR_SERVICE_ID, CRIME_INCIDENTS_ID, DATA_DIR
+from .instrument import instrumented
+from .socrata import SocrataClient
+
+#datasets that can be synced, with their watermark column and record key
+SYNC_DATASETS = {
+    'crime_incidents': {'id': CRIME_INCIDENTS_ID, 'watermark': 'date_reported', 'key': 'instanceid'},
+    'calls_for_service': {'id': CALLS_FOR_SERVICE_ID, 'watermark': 'create_time_incident', 'key': 'event_number'},
+}
+
+
+def store_dir(name, root=None):
+    return (root or DATA_DIR) / 'store' / name
+
+
+def _state_path(root=None):
+    return (root or DATA_DIR) / 'store' / 'watermarks.json'
+
+
+def load_watermarks(root=None):
+    path = _state_path(root)
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def save_watermark(name, value, root=None):
+    path = _state_path(root)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    state = load_watermarks(root)
+    state[name] = value
+    #write to a temp file first so a crash never leaves a half written state
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(state, indent=2, sort_keys=True))
+    tmp.replace(path)
+
+
+def _part_files(name, root=None):
+    return sorted(store_dir(name, root).glob('part-*.parquet'))
+
+
+def stored_keys(name, root=None):
+    """Return the record keys already in the store, reading only the key column."""
+    key = SYNC_DATASETS[name]['key']
+    parts = _part_files(name, root)
+    if not parts:
+        return pd.Index([])
+    keys = [pq.read_table(p, columns=[key]).column(key).to_pandas() for p in parts]
+    return pd.Index(pd.concat(keys, ignore_index=True).astype(str).unique())
+
+
+def row_hashes(df):
+    """uint64 hash of every row's non-null fields, whatever the column order or the columns present.
+
+    Socrata leaves null fields out of the json, so a chunk may lack a column
+    its stored copy has as null; both hash the same.
+    """
+    total = np.zeros(len(df), dtype=np.uint64)
+    for col in df.columns:
+        values = df[col]
+        hashed = pd.util.hash_array((f'{col}=' + values.astype(str)).to_numpy(dtype=object))
+        total += np.where(values.notna().to_numpy(), hashed, np.uint64(0))
+    return total
+
+
+def stored_rows(name, keys, root=None):
+    """The last stored version of the rows with the given record keys."""
+    key = SYNC_DATASETS[name]['key']
+    value_set = pa.array(sorted(set(keys)), type=pa.string())
+    frames = []
+    for part in _part_files(name, root):
+        table = pq.read_table(part)
+        table = table.filter(pc.is_in(pc.cast(table[key], pa.string()), value_set=value_set))
+        if table.num_rows:
+            frames.append(table.to_pandas())
+    if not frames:
+        return pd.DataFrame(columns=[key])
+    return pd.concat(frames, ignore_index=True).drop_duplicates(subset=key, keep='last')
+
+
+def _changed(name, refetched, root=None):
+    #re-fetched rows of stored keys, kept only when their content differs from the stored version
+    key = SYNC_DATASETS[name]['key']
+    refetched = refetched.drop_duplicates(subset=key, keep='last')
+    stored = stored_rows(name, refetched[key].astype(str), root)
+    old = pd.Series(row_hashes(stored), index=stored[key].astype(str).to_numpy())
+    old = old.reindex(refetched[key].astype(str), fill_value=np.uint64(0)).to_numpy(dtype=np.uint64)
+    return refetched[old != row_hashes(refetched)]
+
+
+@instrumented
+def sync_dataset(name, client=None, root=None, full=False):
+    """Pull rows newer than the saved watermark and append them to the store.
+
+    Rows with a new record key are appended, and so are re-fetched rows of
+    stored keys whose content changed. Returns a dict with the number of
+    rows fetched and appended, how many of those were updates, the new
+    watermark and the elapsed seconds.
+    """
+    spec = SYNC_DATASETS[name]
+    wm_col, key = spec['watermark'], spec['key']
+    start = time.perf_counter()
+    client = client or SocrataClient(spec['id'])
+
+    watermark = None if full else load_watermarks(root).get(name)
+    #>= so rows that share the last timestamp are not missed, duplicates are dropped below
+    where = f"{wm_col} >= '{watermark}'" if watermark else None
+
+    existing = pd.Index([]) if full else stored_keys(name, root)
+    fetched, fresh_chunks, refetched = 0, [], []
+    for chunk in client.iter_frames(where=where, order=f'{wm_col}, :id'):
+        fetched += len(chunk)
+        chunk = chunk.drop_duplicates(subset=key, keep='last')
+        known = chunk[key].astype(str).isin(existing)
+        fresh_chunks.append(chunk[~known])
+        #rows at the watermark come back every run, only the ones revised upstream are kept
+        if known.any():
+            refetched.append(chunk[known])
+
+    updated = _changed(name, pd.concat(refetched, ignore_index=True), root) if refetched else None
+    if updated is not None and len(updated):
+        fresh_chunks.append(updated)
+    fresh = pd.concat(fresh_chunks, ignore_index=True) if fresh_chunks else pd.DataFrame()
+    if len(fresh):
+        fresh = fresh.drop_duplicates(subset=key, keep='last')
+        out_dir = store_dir(name, root)
+        if full:
+            for part in _part_files(name, root):
+                part.unlink()
+        out_dir.mkdir(parents=True, exist_ok=True)
+        part_no = len(_part_files(name, root))
+        fresh.to_parquet(out_dir / f'part-{part_no:05d}.parquet', index=False)
+        new_mark = fresh[wm_col].dropna().max() if wm_col in fresh else None
+        if isinstance(new_mark, str) and (watermark is None or new_mark > watermark):
+            watermark = new_mark
+            save_watermark(name, watermark, root)
+
+    return {
+        'dataset': name,
+        'fetched': fetched,
+        'appended': len(fresh),
+        'updated': 0 if updated is None else len(updated),
+        'watermark': watermark,
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+def load_store(name, columns=None, root=None):
+    """Read the synced store back as one DataFrame, de-duplicated on the record key."""
+    key = SYNC_DATASETS[name]['key']
+    parts = _part_files(name, root)
+    if not parts:
+        return pd.DataFrame(columns=columns)
+    if columns is not None and key not in columns:
+        columns = [key, *columns]
+    #socrata leaves null fields out of the json, so part files can have different columns
+    frames = []
+    for part in parts:
+        names = pq.read_schema(part).names
+        cols = None if columns is None else [c for c in columns if c in names]
+        frames.append(pq.read_table(part, columns=cols).to_pandas())
+    df = pd.concat(frames, ignore_index=True)
+    return df.drop_duplicates(subset=key, keep='last').reset_index(drop=True)
+
+
+def compact_store(name, root=None):
+    """Rewrite all part files of a dataset into a single de-duplicated part."""
+    df = load_store(name, root=root)
+    parts = _part_files(name, root)
+    if len(parts) <= 1:
+        return len(df)
+    tmp = store_dir(name, root) / 'compact.tmp'
+    df.to_parquet(tmp, index=False)
+    for part in parts:
+        part.unlink()
+    tmp.replace(store_dir(name, root) / 'part-00000.parquet')
+    return len(df)
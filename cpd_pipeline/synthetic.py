@@ -0,0 +1,133 @@
+"""Synthetic data shaped like the city's exports, for offline benchmarks."""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .schemas import SOCRATA_CSV_TIME
+
+NEIGHBORHOODS = ['WESTWOOD', 'WEST PRICE HILL', 'EAST PRICE HILL', 'OVER-THE-RHINE', 'AVONDALE',
+                 'CUF', 'COLLEGE HILL', 'MADISONVILLE', 'WALNUT HILLS', 'EVANSTON', 'NORTHSIDE',
+                 'BOND HILL', 'ROSELAWN', 'CLIFTON', 'DOWNTOWN', 'HYDE PARK', 'OAKLEY', 'MT. AIRY',
+                 'WINTON HILLS', 'LOWER PRICE HILL', 'CAMP WASHINGTON', 'SOUTH FAIRMOUNT']
+INCIDENT_TYPES = ['DIRPAT', 'TRAF', 'DISTURB', 'INV', 'ACCINJ', 'THEFT', 'ALARM', 'SHOTS',
+                  'MENTAL', 'DOMVIOL', 'ASSLT', 'BURG', 'SUSPP', 'NOISE', 'WELFARE', 'PARK']
+
+
+def _latitudes(rng, n):
+    #clipped to the city, so generated rows pass the validation bounds
+    return rng.normal(39.13, 0.04, n).clip(39.05, 39.22).round(6)
+
+
+def _longitudes(rng, n):
+    return rng.normal(-84.52, 0.05, n).clip(-84.71, -84.37).round(6)
+
+
+def _skewed_choice(rng, values, n):
+    #zipf-like weights so a few neighborhoods / types dominate, like the real data
+    weights = 1 / np.arange(1, len(values) + 1)
+    return rng.choice(np.asarray(values, dtype=object), size=n, p=weights / weights.sum())
+
+
+def make_calls(n, seed=0, start='2020-01-01', days=1800, missing_rate=0.03, first_id=0):
+    """Calls for service rows with the raw csv's columns and timestamp format."""
+    rng = np.random.default_rng(seed)
+    created = pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days * 86400, n), unit='s')
+    dispatch = created + pd.to_timedelta(rng.exponential(240, n).astype(np.int64), unit='s')
+    arrival = dispatch + pd.to_timedelta(rng.gamma(2.0, 240, n).astype(np.int64), unit='s')
+
+    dispatch_text = pd.Series(dispatch.strftime(SOCRATA_CSV_TIME))
+    arrival_text = pd.Series(arrival.strftime(SOCRATA_CSV_TIME))
+    #some calls are never dispatched or never reach the scene
+    dispatch_text[rng.random(n) < missing_rate] = None
+    arrival_text[rng.random(n) < missing_rate] = None
+
+    return pd.DataFrame({
+        'EVENT_NUMBER': np.char.add('CPD', np.arange(first_id, first_id + n).astype(str)),
+        'CREATE_TIME_INCIDENT': created.strftime(SOCRATA_CSV_TIME),
+        'DISPATCH_TIME_PRIMARY_UNIT': dispatch_text,
+        'ARRIVAL_TIME_PRIMARY_UNIT': arrival_text,
+        'INCIDENT_TYPE_ID': _skewed_choice(rng, INCIDENT_TYPES, n),
+        'PRIORITY': rng.integers(1, 6, n),
+        'DISTRICT': rng.integers(1, 6, n).astype(str),
+        'SNA_NEIGHBORHOOD': _skewed_choice(rng, NEIGHBORHOODS, n),
+        'LATITUDE_X': _latitudes(rng, n),
+        'LONGITUDE_X': _longitudes(rng, n),
+    })
+
+
+def make_shootings(n, seed=0, start='2015-01-01', days=3600, first_id=0):
+    """Shootings rows with the columns the notebook's preprocessing uses."""
+    rng = np.random.default_rng(seed)
+    occurred = pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days * 86400, n), unit='s')
+    blocks = np.char.add(np.char.add(rng.integers(1, 80, n).astype(str), 'XX '),
+                         rng.choice(np.array(['VINE ST', 'MCMICKEN AV', 'HARRISON AV', 'READING RD',
+                                              'GLENWAY AV', 'WARSAW AV', 'QUEEN CITY AV', 'LIBERTY ST',
+                                              'MONTANA AV', 'BURNET AV', 'RACE ST', 'ELM ST']), n))
+    return pd.DataFrame({
+        'ShootID': np.arange(first_id + 1, first_id + n + 1),
+        'DateOccurred': occurred.strftime('%Y%m%d').astype(int),
+        'TimeOccurred': occurred.strftime('%H%M').astype(int),
+        'YearOccurred': occurred.year,
+        'DateTimeOccured': occurred.strftime('%Y/%m/%d %H:%M:%S'),
+        'District': rng.integers(1, 6, n).astype(str),
+        'StreetBlock': blocks,
+        'SNA_NEIGHBORHOOD': _skewed_choice(rng, NEIGHBORHOODS, n),
+        'COMMUNITY_COUNCIL_NEIGHBORHOOD': _skewed_choice(rng, NEIGHBORHOODS, n),
+        'Race': rng.choice(np.array(['BLACK', 'WHITE', 'HISPANIC', 'UNKNOWN'], dtype=object), n,
+                           p=[0.75, 0.15, 0.05, 0.05]),
+        'Sex': rng.choice(np.array(['MALE', 'FEMALE'], dtype=object), n, p=[0.85, 0.15]),
+        'Age': rng.integers(12, 70, n),
+        'Type': rng.choice(np.array(['NONFATAL', 'FATAL'], dtype=object), n, p=[0.8, 0.2]),
+        'LATITUDE_X': _latitudes(rng, n),
+        'LONGITUDE_X': _longitudes(rng, n),
+    })
+
+
+USE_OF_FORCE_TYPES = ['TAKEDOWN', 'TASER - DEPLOYMENT', 'CHEMICAL IRRITANT', 'PRONE RESTRAINT',
+                      'TASER - DISPLAY', 'INJURY TO PRISONER', 'PURSUIT', 'CANINE', 'BEANBAG']
+
+
+def make_use_of_force(n, seed=0, start='2015-01-01', days=3600, first_id=0):
+    """Use of force rows with the columns in the dataset's schema."""
+    rng = np.random.default_rng(seed)
+    occurred = pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days * 86400, n), unit='s')
+    neighborhood = _skewed_choice(rng, NEIGHBORHOODS, n)
+    return pd.DataFrame({
+        'INCIDENT_NO': np.char.add('UOF', np.arange(first_id, first_id + n).astype(str)),
+        'INCIDENT_DATE': occurred.strftime(SOCRATA_CSV_TIME),
+        'INCIDENT_DESCRIPTION': _skewed_choice(rng, USE_OF_FORCE_TYPES, n),
+        'SNA_NEIGHBORHOOD': neighborhood,
+        'CPD_NEIGHBORHOOD': neighborhood,
+        'DISTRICT': rng.integers(1, 6, n).astype(str),
+        'SEX': rng.choice(np.array(['MALE', 'FEMALE'], dtype=object), n, p=[0.8, 0.2]),
+        'RACE': rng.choice(np.array(['BLACK', 'WHITE', 'HISPANIC', 'UNKNOWN'], dtype=object), n,
+                           p=[0.7, 0.22, 0.04, 0.04]),
+        'LATITUDE_X': _latitudes(rng, n),
+        'LONGITUDE_X': _longitudes(rng, n),
+    })
+
+
+GENERATORS = {
+    'calls': make_calls,
+    'shootings': make_shootings,
+    'use_of_force': make_use_of_force,
+}
+
+
+def write_synthetic(name, n, path, seed=0, chunk_rows=1_000_000):
+    """Write ``n`` synthetic rows of a dataset to a csv file, ``chunk_rows`` at a time.
+
+    Memory stays bounded by the chunk size, so 50M row files can be written
+    on a laptop. Every chunk gets its own seed and ids continue across chunks.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w', newline='') as f:
+        for i, first in enumerate(range(0, n, chunk_rows)):
+            chunk = GENERATORS[name](min(chunk_rows, n - first), seed=seed + i, first_id=first)
+            chunk.to_csv(f, index=False, header=i == 0)
+    tmp.replace(path)
+    return path
@@ -0,0 +1,121 @@
+"""Time-series cross-validation and hyperparameter search for the response-time models.
+
+Rows are ordered by time and split with ``TimeSeriesSplit``, so every fold
+trains on the past and validates on the following period. Each candidate is a
+``Pipeline`` of the notebook's ``numeric_pipeline`` (mean imputer + scaler)
+and a regressor. The pipeline gets a joblib ``memory`` cache, so the
+preprocessing fitted on a fold is reused by every candidate instead of being
+refitted. Folds and candidates run in parallel with joblib (``n_jobs``), and
+``method='halving'`` uses successive halving to try more candidates in the
+same budget.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.stats import loguniform, randint, uniform
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.impute import SimpleImputer
+from sklearn.model_selection import (GridSearchCV, HalvingRandomSearchCV, RandomizedSearchCV,
+                                     TimeSeriesSplit, cross_validate)
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from .config import DATA_DIR
+from .training import make_model
+
+#search spaces per model kind; lists for grid search, distributions for random/halving search
+PARAM_SPACES = {
+    'linear': {
+        'model__fit_intercept': [True, False],
+        'model__positive': [False, True],
+    },
+    'forest': {
+        'model__n_estimators': randint(50, 300),
+        'model__max_depth': [None, 8, 12, 16, 24],
+        'model__min_samples_leaf': randint(1, 50),
+        'model__max_features': [1.0, 0.5, 'sqrt'],
+        'model__max_samples': uniform(0.05, 0.45),
+    },
+    'hgb': {
+        'model__learning_rate': loguniform(0.01, 0.3),
+        'model__max_leaf_nodes': randint(15, 127),
+        'model__min_samples_leaf': randint(10, 200),
+        'model__l2_regularization': loguniform(1e-4, 10),
+    },
+}
+
+
+def build_pipeline(kind, cache_dir=None, **model_params):
+    """The notebook's numeric_pipeline followed by a regressor, with a transformer cache."""
+    if kind == 'forest':
+        #the search already runs candidates in parallel, one core per forest avoids oversubscription
+        model_params.setdefault('n_jobs', 1)
+    return Pipeline([
+        ('imputer', SimpleImputer(strategy='mean')),
+        ('scaler', StandardScaler()),
+        ('model', make_model(kind, **model_params)),
+    ], memory=str(cache_dir) if cache_dir else None)
+
+
+def time_order(X, y, timestamps):
+    """Sort rows by time so TimeSeriesSplit folds follow the calendar."""
+    order = np.argsort(np.asarray(timestamps), kind='stable')
+    X = X.iloc[order] if hasattr(X, 'iloc') else X[order]
+    return X, np.asarray(y)[order]
+
+
+def search(kind, X, y, timestamps=None, method='halving', n_splits=5, n_candidates=20, n_jobs=-1,
+           cache_dir=None, scoring='neg_mean_absolute_error', random_state=42, **search_params):
+    """Run a time-series CV search for one model kind and return ``(search, results)``.
+
+    ``method`` is ``'grid'``, ``'random'`` or ``'halving'``. ``timestamps``
+    (for example the parsed ``CREATE_TIME_INCIDENT``) orders the rows before
+    splitting; without it the rows are assumed to be in time order already.
+    ``results`` is the ``cv_results_`` table sorted by rank.
+    """
+    if timestamps is not None:
+        X, y = time_order(X, y, timestamps)
+    cache_dir = Path(cache_dir or DATA_DIR / 'cache' / 'pipeline')
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    pipeline = build_pipeline(kind, cache_dir=cache_dir)
+    cv = TimeSeriesSplit(n_splits=n_splits)
+    space = PARAM_SPACES[kind]
+
+    if method == 'grid':
+        grid = {k: v if isinstance(v, list) else list(v.rvs(size=3, random_state=random_state))
+                for k, v in space.items()}
+        searcher = GridSearchCV(pipeline, grid, cv=cv, scoring=scoring, n_jobs=n_jobs, **search_params)
+    elif method == 'random':
+        searcher = RandomizedSearchCV(pipeline, space, n_iter=n_candidates, cv=cv, scoring=scoring,
+                                      n_jobs=n_jobs, random_state=random_state, **search_params)
+    elif method == 'halving':
+        #start with as many rows as still lets the last round use all of them
+        search_params.setdefault('min_resources', 'exhaust')
+        searcher = HalvingRandomSearchCV(pipeline, space, n_candidates=n_candidates, cv=cv, scoring=scoring,
+                                         n_jobs=n_jobs, random_state=random_state, **search_params)
+    else:
+        raise ValueError(f"method must be 'grid', 'random' or 'halving', got {method!r}")
+
+    searcher.fit(X, y)
+    results = pd.DataFrame(searcher.cv_results_).sort_values('rank_test_score')
+    keep = [c for c in results.columns if c.startswith('param_') or c in (
+        'iter', 'n_resources', 'mean_test_score', 'std_test_score', 'mean_fit_time', 'rank_test_score')]
+    return searcher, results[keep].reset_index(drop=True)
+
+
+def cross_validate_models(X, y, kinds=('linear', 'hgb', 'forest'), timestamps=None, n_splits=5, n_jobs=-1,
+                          cache_dir=None, scoring='neg_mean_absolute_error'):
+    """Time-series CV scores of each model kind with default parameters."""
+    if timestamps is not None:
+        X, y = time_order(X, y, timestamps)
+    cache_dir = Path(cache_dir or DATA_DIR / 'cache' / 'pipeline')
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    rows = []
+    for kind in kinds:
+        scores = cross_validate(build_pipeline(kind, cache_dir=cache_dir), X, y,
+                                cv=TimeSeriesSplit(n_splits=n_splits), scoring=scoring, n_jobs=n_jobs)
+        rows.append({'model': kind, 'mean_test_score': scores['test_score'].mean(),
+                     'std_test_score': scores['test_score'].std(), 'mean_fit_time': scores['fit_time'].mean()})
+    return pd.DataFrame(rows).set_index('model')
@@ -0,0 +1,314 @@
+"""Declarative, vectorized data-quality rules with a quarantine file.
+
+Rules run on every raw chunk while it is read, before the schema is applied,
+so unparseable timestamps can be told apart from missing ones instead of
+silently becoming NaT. The timestamps parsed by the rules are kept as the
+typed columns, so each one is parsed only once.
+
+Only rows that can't be parsed (the ``timestamp`` rule) leave the frame.
+They go to ``data/quarantine/<dataset>.parquet`` with their original text
+and a ``_reasons`` column of rule codes. Rows failing the other rules are
+kept, with the codes in a ``quality_flags`` column (``<NA>`` for clean
+rows), so each consumer decides what to drop. The count of every rule is
+kept in ``Validator.stats()``.
+
+Rule kinds:
+
+* ``timestamp``: text in a datetime column that does not parse with its schema format
+* ``order``: second timestamp earlier than the first (arrival before dispatch)
+* ``max_gap``: minutes between two timestamps above a limit
+* ``bounds``: latitude / longitude outside a box
+* ``range``: number outside [low, high]
+* ``known``: label not in a set, compared after ``joins.normalize_neighborhood``
+"""
+
+import hashlib
+import json
+import time
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .config import DATA_DIR
+from .features import NAT, parse_timestamps
+from .schemas import datetime_columns
+
+Rule = namedtuple('Rule', ['code', 'kind', 'columns', 'params'])
+
+#rule kinds whose failing rows can't be typed and are quarantined, the others are flagged
+QUARANTINE_KINDS = frozenset(['timestamp'])
+
+FLAGS_COLUMN = 'quality_flags'
+
+#box around the city with a small margin: (lat min, lat max, lon min, lon max)
+CINCINNATI_BOUNDS = (39.02, 39.32, -84.83, -84.25)
+
+#statistical neighborhood approximations, spelled like normalize_neighborhood returns them
+NEIGHBORHOODS = frozenset([
+    'AVONDALE', 'BOND HILL', 'CALIFORNIA', 'CAMP WASHINGTON', 'CARTHAGE', 'CLIFTON',
+    'CLIFTON HEIGHTS-UNIVERSITY HEIGHTS-FAIRVIEW', 'COLLEGE HILL', 'COLUMBIA TUSCULUM', 'CORRYVILLE',
+    'DOWNTOWN', 'EAST END', 'EAST PRICE HILL', 'EAST WALNUT HILLS', 'EAST WESTWOOD', 'ENGLISH WOODS',
+    'EVANSTON', 'HARTWELL', 'HYDE PARK', 'KENNEDY HEIGHTS', 'LINWOOD', 'LOWER PRICE HILL', 'MADISONVILLE',
+    'MILLVALE', 'MOUNT ADAMS', 'MOUNT AIRY', 'MOUNT AUBURN', 'MOUNT LOOKOUT', 'MOUNT WASHINGTON',
+    'NORTH AVONDALE', 'NORTH AVONDALE-PADDOCK HILLS', 'NORTH FAIRMOUNT', 'NORTH FAIRMOUNT-ENGLISH WOODS',
+    'NORTHSIDE', 'OAKLEY', 'OVER-THE-RHINE', 'PADDOCK HILLS', 'PENDLETON', 'PLEASANT RIDGE', 'QUEENSGATE',
+    'RIVERSIDE', 'ROSELAWN', 'SAYLER PARK', 'SEDAMSVILLE', 'SOUTH CUMMINSVILLE', 'SOUTH FAIRMOUNT',
+    'SPRING GROVE VILLAGE', 'VILLAGES AT ROLL HILL', 'WALNUT HILLS', 'WEST END', 'WEST PRICE HILL',
+    'WESTWOOD', 'WINTON HILLS',
+])
+
+RULES = {
+    'crime_incidents': [
+        Rule('bad_timestamp', 'timestamp', None, None),
+        Rule('reported_before_occurred', 'order', ('DATE_FROM', 'DATE_REPORTED'), None),
+        Rule('outside_cincinnati', 'bounds', ('LATITUDE_X', 'LONGITUDE_X'), CINCINNATI_BOUNDS),
+        Rule('unknown_neighborhood', 'known', ('SNA_NEIGHBORHOOD',), NEIGHBORHOODS),
+    ],
+    'shootings': [
+        Rule('bad_timestamp', 'timestamp', None, None),
+        Rule('outside_cincinnati', 'bounds', ('LATITUDE_X', 'LONGITUDE_X'), CINCINNATI_BOUNDS),
+        Rule('unknown_neighborhood', 'known', ('SNA_NEIGHBORHOOD',), NEIGHBORHOODS),
+        Rule('bad_age', 'range', ('Age',), (0, 110)),
+    ],
+    'use_of_force': [
+        Rule('bad_timestamp', 'timestamp', None, None),
+        Rule('outside_cincinnati', 'bounds', ('LATITUDE_X', 'LONGITUDE_X'), CINCINNATI_BOUNDS),
+        Rule('unknown_neighborhood', 'known', ('SNA_NEIGHBORHOOD',), NEIGHBORHOODS),
+    ],
+    'calls': [
+        Rule('bad_timestamp', 'timestamp', None, None),
+        Rule('arrival_before_dispatch', 'order', ('DISPATCH_TIME_PRIMARY_UNIT', 'ARRIVAL_TIME_PRIMARY_UNIT'), None),
+        Rule('response_over_24h', 'max_gap', ('DISPATCH_TIME_PRIMARY_UNIT', 'ARRIVAL_TIME_PRIMARY_UNIT'), 24 * 60),
+        Rule('outside_cincinnati', 'bounds', ('LATITUDE_X', 'LONGITUDE_X'), CINCINNATI_BOUNDS),
+        Rule('unknown_neighborhood', 'known', ('SNA_NEIGHBORHOOD',), NEIGHBORHOODS),
+    ],
+}
+
+
+def rules_hash(name):
+    """Short hash of a dataset's rules, so caches built with other rules are rebuilt."""
+    rules = [[r.code, r.kind, r.columns, sorted(r.params) if isinstance(r.params, frozenset) else r.params]
+             for r in RULES.get(name, [])]
+    payload = json.dumps([sorted(QUARANTINE_KINDS), rules], default=str).encode()
+    return hashlib.sha256(payload).hexdigest()[:12]
+
+
+def quarantine_path(name, part=None):
+    """Quarantine file of a dataset, or of one part of it when it is read in parallel."""
+    if part is None:
+        return DATA_DIR / 'quarantine' / f'{name}.parquet'
+    return DATA_DIR / 'quarantine' / name / f'part-{part:05d}.parquet'
+
+
+def clear_quarantine(name):
+    """Remove the quarantine file and the part files of a dataset."""
+    quarantine_path(name).unlink(missing_ok=True)
+    for old in quarantine_path(name, 0).parent.glob('part-*.parquet'):
+        old.unlink()
+
+
+def _ns(chunk, col, parsed):
+    if col in parsed:
+        return parsed[col]
+    return parse_timestamps(chunk[col])
+
+
+def _known_mask(values, known):
+    #normalize once per distinct label, then map the result back onto the rows
+    from .joins import normalize_neighborhood
+
+    codes, uniques = pd.factorize(values)
+    ok = np.append(normalize_neighborhood(pd.Series(uniques, dtype=object)).isin(known).to_numpy(), True)
+    return ~ok[codes]
+
+
+def check_rules(chunk, name, rules=None):
+    """Evaluate the rules on a raw chunk.
+
+    Returns ``(masks, parsed)``: a boolean failure mask per rule code and the
+    int64 nanoseconds of every datetime column that was parsed from text.
+    """
+    rules = RULES.get(name, []) if rules is None else rules
+    formats = datetime_columns(name)
+    parsed, masks = {}, {}
+    for col, fmt in formats.items():
+        if col in chunk and not pd.api.types.is_datetime64_any_dtype(chunk[col]):
+            parsed[col] = parse_timestamps(chunk[col], fmt)
+
+    for rule in rules:
+        cols = rule.columns or []
+        if any(c not in chunk for c in cols):
+            continue
+        if rule.kind == 'timestamp':
+            bad = np.zeros(len(chunk), dtype=bool)
+            for col, ns in parsed.items():
+                if rule.columns and col not in rule.columns:
+                    continue
+                text = chunk[col]
+                present = text.notna().to_numpy() & (text.astype('string').str.strip() != '').fillna(False).to_numpy()
+                bad |= present & (ns == NAT)
+        elif rule.kind in ('order', 'max_gap'):
+            start, end = (_ns(chunk, c, parsed) for c in cols)
+            both = (start != NAT) & (end != NAT)
+            if rule.kind == 'order':
+                bad = both & (end < start)
+            else:
+                bad = both & ((end - start) > rule.params * 60 * 10 ** 9)
+        elif rule.kind == 'bounds':
+            lat_min, lat_max, lon_min, lon_max = rule.params
+            lat = pd.to_numeric(chunk[cols[0]], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+            lon = pd.to_numeric(chunk[cols[1]], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+            #missing coordinates are not a failure, wrong ones are
+            present = ~(np.isnan(lat) | np.isnan(lon))
+            bad = present & ((lat < lat_min) | (lat > lat_max) | (lon < lon_min) | (lon > lon_max))
+        elif rule.kind == 'range':
+            low, high = rule.params
+            values = pd.to_numeric(chunk[cols[0]], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+            bad = ~np.isnan(values) & ((values < low) | (values > high))
+        elif rule.kind == 'known':
+            bad = _known_mask(chunk[cols[0]], rule.params)
+        else:
+            raise ValueError(f'unknown rule kind {rule.kind!r}')
+        masks[rule.code] = masks[rule.code] | bad if rule.code in masks else bad
+    return masks, parsed
+
+
+class Validator:
+    """Validate the chunks of one dataset, writing unparseable rows to a quarantine Parquet file.
+
+    With ``part`` the rows go to that part's file, and row numbers count from
+    the start of the part. Without it, the dataset's old quarantine files
+    (parts included) are removed.
+    """
+
+    def __init__(self, name, path=None, rules=None, part=None):
+        self.name = name
+        self.rules = RULES.get(name, []) if rules is None else rules
+        self.path = Path(path or quarantine_path(name, part))
+        self.counts = {rule.code: 0 for rule in self.rules}
+        self._quarantine_codes = {rule.code for rule in self.rules if rule.kind in QUARANTINE_KINDS}
+        self.rows = 0
+        self.quarantined = 0
+        self.flagged = 0
+        self.seconds = 0.0
+        self._writer = None
+        if path is None and part is None:
+            clear_quarantine(name)
+        self.path.unlink(missing_ok=True)
+
+    @property
+    def columns(self):
+        """Columns the rules read, a pruned read must include them to be validated like a full one."""
+        cols = list(datetime_columns(self.name)) if any(r.kind == 'timestamp' for r in self.rules) else []
+        for rule in self.rules:
+            cols += [c for c in rule.columns or [] if c not in cols]
+        return cols
+
+    def check(self, chunk):
+        """Return the parseable rows of a raw chunk, with timestamps parsed and a ``quality_flags`` column."""
+        start = time.perf_counter()
+        masks, parsed = check_rules(chunk, self.name, self.rules)
+        bad = np.zeros(len(chunk), dtype=bool)
+        flags = np.full(len(chunk), '', dtype=object)
+        for code, mask in masks.items():
+            self.counts[code] += int(mask.sum())
+            if code in self._quarantine_codes:
+                bad |= mask
+            elif mask.any():
+                flags[mask] = flags[mask] + code + ';'
+
+        if bad.any():
+            #row numbers count from the start of the file, whatever the chunk's index is
+            self._quarantine(chunk[bad], self.rows + np.flatnonzero(bad),
+                             {code: mask[bad] for code, mask in masks.items()})
+            self.quarantined += int(bad.sum())
+        self.rows += len(chunk)
+        #keep the parsed timestamps, apply_schema skips columns that are already datetime
+        for col, ns in parsed.items():
+            chunk[col] = ns.view('datetime64[ns]')
+        flagged = (flags != '') & ~bad
+        self.flagged += int(flagged.sum())
+        flags[flagged] = [f[:-1] for f in flags[flagged]]
+        flags[~flagged] = None
+        chunk[FLAGS_COLUMN] = pd.array(flags, dtype='string')
+        chunk = chunk[~bad] if bad.any() else chunk
+        self.seconds += time.perf_counter() - start
+        return chunk
+
+    def _quarantine(self, rows, positions, masks):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        reasons = np.full(len(rows), '', dtype=object)
+        for code, mask in masks.items():
+            reasons[mask] = reasons[mask] + code + ';'
+        #original text of every column, so the schema is the same for every chunk
+        out = rows.astype('string')
+        out.insert(0, '_reasons', pd.array([r.rstrip(';') for r in reasons], dtype='string'))
+        out.insert(0, '_row', positions.astype(np.int64))
+        table = pa.Table.from_pandas(out, preserve_index=False)
+        if self._writer is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._writer = pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table.cast(self._writer.schema))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        return self.stats()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self):
+        return {'dataset': self.name, 'rows': self.rows, 'passed': self.rows - self.quarantined,
+                'quarantined': self.quarantined, 'flagged': self.flagged, 'rules': dict(self.counts),
+                'seconds': round(self.seconds, 3),
+                'quarantine_file': str(self.path) if self.quarantined else None}
+
+
+def validator_for(path, name, validate=True):
+    """A ``Validator`` for reading ``path``, None for Parquet files (validated when cached) or ``validate=False``."""
+    if not validate or Path(path).suffix == '.parquet':
+        return None
+    return Validator(name)
+
+
+def merge_stats(stats):
+    """Add up the ``Validator.stats()`` of the parts of one dataset."""
+    stats = [s for s in stats if s is not None]
+    if not stats:
+        return None
+    merged = {'dataset': stats[0]['dataset'], 'rules': {}}
+    for key in ('rows', 'passed', 'quarantined', 'flagged', 'seconds'):
+        merged[key] = sum(s[key] for s in stats)
+    merged['seconds'] = round(merged['seconds'], 3)
+    for s in stats:
+        for code, count in s['rules'].items():
+            merged['rules'][code] = merged['rules'].get(code, 0) + count
+    files = [s['quarantine_file'] for s in stats if s['quarantine_file']]
+    merged['quarantine_file'] = files[0] if len(files) == 1 else (files or None)
+    return merged
+
+
+def read_quarantine(name, path=None):
+    """The quarantined rows of a dataset, from its quarantine file or its part files."""
+    if path is not None:
+        path = Path(path)
+        return pd.read_parquet(path) if path.exists() else pd.DataFrame()
+    paths = [p for p in [quarantine_path(name)] if p.exists()]
+    paths += sorted(quarantine_path(name, 0).parent.glob('part-*.parquet'))
+    if not paths:
+        return pd.DataFrame()
+    frames = []
+    for p in paths:
+        frame = pd.read_parquet(p)
+        frame.insert(0, '_file', p.name)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,24 @@
+"""Shared test setup.
+
+The package reads its data folders from the environment when it is imported,
+so they are pointed at a temporary folder before any test imports it.
+"""
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+DATA_DIR = Path(tempfile.mkdtemp(prefix='cpd-tests-'))
+atexit.register(shutil.rmtree, DATA_DIR, ignore_errors=True)
+
+os.environ['CPD_DATA_DIR'] = str(DATA_DIR)
+os.environ['CPD_RAW_DIR'] = str(DATA_DIR / 'raw')
+os.environ['CPD_CACHE_DIR'] = str(DATA_DIR / 'cache')
+os.environ['CPD_STAGE_LOG'] = os.devnull
+os.environ['CPD_MEMO'] = '0'
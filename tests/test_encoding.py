@@ -0,0 +1,28 @@
+import numpy as np
+import scipy.sparse as sp
+
+from cpd_pipeline.encoding import NUMERICAL_FEATURES, _as_float32, build_shootings_preprocessor, matrix_size_mb
+from cpd_pipeline.schemas import apply_schema
+from cpd_pipeline.synthetic import make_shootings
+
+
+def test_output_is_a_float32_sparse_matrix_with_bounded_columns():
+    df = make_shootings(5_000, seed=1)
+    X = build_shootings_preprocessor(datetime_format='%Y/%m/%d %H:%M:%S').fit_transform(df)
+    assert sp.issparse(X)
+    #one float64 block would upcast the whole stacked matrix
+    assert X.dtype == np.float32
+    assert X.shape[1] < 400
+    #a float32 value and an int32 index per stored cell, plus the row pointers
+    assert matrix_size_mb(X) * 2 ** 20 <= X.nnz * 8 + (X.shape[0] + 1) * 8
+
+
+def test_typed_frame_matches_the_raw_csv_columns():
+    raw = make_shootings(3_000, seed=2)
+    typed = apply_schema(raw.copy(), 'shootings')
+    typed.loc[typed.index[:5], ['DateOccurred', 'Age']] = None
+    X = build_shootings_preprocessor().fit_transform(typed)
+    assert X.dtype == np.float32 and X.shape[0] == len(typed)
+    #dates are YYYYMMDD numbers and nullable ints plain floats, as read from the csv
+    np.testing.assert_array_equal(_as_float32(typed[NUMERICAL_FEATURES])[5:],
+                                  _as_float32(raw[NUMERICAL_FEATURES].astype(float))[5:])
@@ -0,0 +1,24 @@
+import pandas as pd
+
+from cpd_pipeline.features import parse_timestamps
+from cpd_pipeline.schemas import SOCRATA_CSV_TIME
+
+
+def test_fast_path_matches_pandas_and_rejects_other_lengths():
+    values = pd.Series(['01/02/2024 03:04:05 PM', '12/31/2023 12:00:00 AM', '01/02/2024 03:04:05 PMXYZ',
+                        '1/2/2024 3:04:05 PM', '13/02/2024 03:04:05 PM', None, ''])
+    expected = pd.to_datetime(values, format=SOCRATA_CSV_TIME, errors='coerce')
+    parsed = pd.to_datetime(parse_timestamps(values))
+    assert parsed.equals(pd.DatetimeIndex(expected).as_unit('ns'))
+    #the cast to S22 would have cut the trailing text off and parsed the row
+    assert pd.isna(parsed[2])
+
+
+def test_days_past_the_end_of_the_month_are_nat():
+    values = pd.Series(['02/31/2024 03:04:05 PM', '04/31/2024 01:00:00 AM', '02/29/2024 11:59:59 PM',
+                        '02/29/2023 11:59:59 PM', '02/29/2000 01:00:00 AM', '02/29/1900 01:00:00 AM',
+                        '12/31/2024 01:00:00 AM', '06/30/2024 01:00:00 AM'])
+    expected = pd.to_datetime(values, format=SOCRATA_CSV_TIME, errors='coerce')
+    parsed = pd.to_datetime(parse_timestamps(values))
+    assert parsed.equals(pd.DatetimeIndex(expected).as_unit('ns'))
+    assert parsed.isna().tolist() == [True, True, False, True, False, True, False, False]
@@ -0,0 +1,20 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from cpd_pipeline.hashing import fingerprint
+
+
+def test_equal_contents_give_equal_hashes():
+    df = pd.DataFrame({'a': [1, 2, 3], 'b': ['x', 'y', None]})
+    assert fingerprint(df, np.arange(3)) == fingerprint(df.copy(), np.arange(3))
+    assert fingerprint(sp.csr_matrix(np.eye(3))) == fingerprint(sp.csc_matrix(np.eye(3)))
+
+
+def test_values_names_and_types_change_the_hash():
+    df = pd.DataFrame({'a': [1, 2, 3]})
+    base = fingerprint(df)
+    assert fingerprint(df.assign(a=[1, 2, 4])) != base
+    assert fingerprint(df.rename(columns={'a': 'b'})) != base
+    assert fingerprint(df.astype('int32')) != base
+    assert fingerprint(np.arange(3, dtype=np.int64)) != fingerprint(np.arange(3, dtype=np.int32))
@@ -0,0 +1,45 @@
+import tracemalloc
+
+import numpy as np
+
+from cpd_pipeline.instrument import measure, peak_rss_mb, rss_mb, summary
+
+
+def test_nested_traced_steps_keep_the_outer_trace_and_peak():
+    with measure('outer', trace_memory=True, log=False) as outer:
+        big = np.ones(8 * 2 ** 20 // 8)
+        del big
+        with measure('inner', trace_memory=True, log=False) as inner:
+            small = np.ones(2 ** 20 // 8)
+            del small
+        #the inner step must not stop the trace the outer step owns
+        assert tracemalloc.is_tracing()
+    assert not tracemalloc.is_tracing()
+    assert 1 <= inner['traced_peak_mb'] < 4
+    #the outer peak happened before the inner step reset tracemalloc's peak
+    assert outer['traced_peak_mb'] >= 8
+
+
+def test_untraced_step_records_no_peak():
+    with measure('plain', trace_memory=False, log=False) as record:
+        pass
+    assert record['traced_peak_mb'] is None
+
+
+def test_a_small_step_does_not_inherit_an_earlier_large_peak(tmp_path, monkeypatch):
+    monkeypatch.setenv('CPD_STAGE_LOG', str(tmp_path / 'stages.jsonl'))
+    #enough to raise the process peak, whatever earlier tests reached
+    size = max(peak_rss_mb() - rss_mb(), 0) + 128
+    with measure('large') as large:
+        big = np.ones(int(size * 2 ** 20 // 8))
+        del big
+    with measure('small') as small:
+        np.ones(2 ** 20 // 8).sum()
+    assert large['peak_rss_growth_mb'] >= 64
+    assert small['peak_rss_growth_mb'] < 8
+    assert abs(small['rss_delta_mb']) < 8
+    #the process peak is the same for both, it can't tell them apart
+    assert small['peak_rss_mb'] >= large['peak_rss_mb']
+
+    table = summary(tmp_path / 'stages.jsonl')
+    assert table.loc['small', 'peak_rss_growth_mb'] < 8 <= table.loc['large', 'peak_rss_growth_mb']
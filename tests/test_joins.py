@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cpd_pipeline.joins import build_indexes, iter_window_join, window_counts, window_join
+
+
+@pytest.fixture
+def indexes():
+    rng = np.random.default_rng(7)
+    start = pd.Timestamp('2024-01-01')
+
+    def events(n):
+        return pd.DataFrame({
+            'neighborhood': pd.Series(rng.choice(['AVONDALE', 'CUF', 'WEST END'], n), dtype='string'),
+            'time': start + pd.to_timedelta(rng.integers(0, 3 * 86_400, n), unit='s'),
+        })
+
+    return build_indexes(events(400), events(3_000))
+
+
+def merge_reference(left, right):
+    pairs = []
+    for i, key in enumerate(left.keys):
+        j = np.flatnonzero((right.keys >= key - 3_600) & (right.keys <= key))
+        pairs.extend((left.positions[i], right.positions[k], right.keys[k] - key) for k in j)
+    return sorted(pairs)
+
+
+@pytest.mark.parametrize('chunk_rows', [1, 7, 100, 10 ** 9])
+def test_chunks_hold_every_pair_once(indexes, chunk_rows):
+    left, right = indexes
+    chunks = list(iter_window_join(left, right, before='1h', chunk_rows=chunk_rows))
+    pairs = pd.concat(chunks, ignore_index=True)
+    assert sorted(pairs.itertuples(index=False, name=None)) == merge_reference(left, right)
+    #a chunk only goes over the budget when a single left event has more matches
+    counts = window_counts(left, right, before='1h')
+    assert all(len(c) <= max(chunk_rows, counts.max()) for c in chunks)
+
+
+def test_window_join_refuses_too_many_rows(indexes):
+    left, right = indexes
+    total = int(window_counts(left, right).sum())
+    assert len(window_join(left, right, max_rows=total)) == total
+    with pytest.raises(ValueError, match='max_rows'):
+        window_join(left, right, max_rows=total - 1)
@@ -0,0 +1,14 @@
+from cpd_pipeline.runner import code_sources, producers
+from cpd_pipeline.stages import STAGES
+
+
+def test_code_follows_the_imported_modules():
+    sources = code_sources(STAGES['calls_summary'].func)
+    #streaming is imported by the stage, schemas only through streaming
+    assert {'cpd_pipeline.streaming', 'cpd_pipeline.schemas'} <= set(sources)
+    assert 'cpd_pipeline.training' not in sources
+
+
+def test_every_output_has_one_stage():
+    outputs = [out for st in STAGES.values() for out in st.outputs]
+    assert len(outputs) == len(set(outputs)) == len(producers())
@@ -0,0 +1,58 @@
+import pytest
+
+from cpd_pipeline import service as service_module
+from cpd_pipeline.cache import load_dataset, raw_path
+from cpd_pipeline.service import QueryService, arrow_file, service_dir
+from cpd_pipeline.synthetic import write_synthetic
+
+
+@pytest.fixture(scope='module')
+def calls():
+    path = raw_path('calls')
+    path.parent.mkdir(parents=True, exist_ok=True)
+    write_synthetic('calls', 20_000, path, seed=8)
+    return load_dataset('calls')
+
+
+@pytest.fixture(scope='module')
+def service(calls):
+    return QueryService(['calls'])
+
+
+def counts(frame, fields):
+    return {tuple(row[:-1]): row[-1] for row in frame[[*fields, 'count']].itertuples(index=False)}
+
+
+def test_group_counts_match_pandas(calls, service):
+    top = calls['SNA_NEIGHBORHOOD'].value_counts().index[0]
+    result = service.query('calls', neighborhood=top.lower(), group_by=['incident_type', 'hour'])
+    rows = calls[calls['SNA_NEIGHBORHOOD'] == top]
+    expected = rows.groupby([rows['INCIDENT_TYPE_ID'].astype(str), rows['CREATE_TIME_INCIDENT'].dt.hour]).size()
+    assert counts(result, ['incident_type', 'hour']) == {k: v for k, v in expected.items() if v}
+    assert len(result) and result['count'].is_monotonic_decreasing
+
+
+def test_time_range_and_top_match_pandas(calls, service):
+    start, end = calls['CREATE_TIME_INCIDENT'].quantile([0.25, 0.75])
+    result = service.query('calls', start=start, end=end, group_by='day_of_week', top=3)
+    ts = calls['CREATE_TIME_INCIDENT']
+    expected = ts[(ts >= start) & (ts < end)].dt.dayofweek.value_counts()
+    assert result['count'].tolist() == expected.head(3).tolist()
+    assert service.query('calls', start=start, end=end)['count'].item() == expected.sum()
+
+
+def test_repeated_queries_are_cached(service):
+    service.query('calls', district='1', group_by='month')
+    hits = service.cache.hits
+    service.query('calls', district=['1'], group_by=['month'])
+    assert service.cache.hits == hits + 1
+
+
+def test_arrow_copy_follows_the_query_fields(calls, monkeypatch):
+    path = arrow_file('calls')
+    fields = {**service_module.FIELDS['calls'], 'priority': 'PRIORITY'}
+    monkeypatch.setitem(service_module.FIELDS, 'calls', fields)
+    rebuilt = arrow_file('calls')
+    assert rebuilt != path and not path.exists()
+    assert list(service_dir().glob('calls-*.arrow')) == [rebuilt]
+    assert QueryService(['calls']).query('calls', group_by='priority')['count'].sum() == len(calls)
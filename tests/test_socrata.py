@@ -0,0 +1,128 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from cpd_pipeline.socrata import SocrataClient, SocrataError
+
+DATASET_ID = 'test-0001'
+
+
+class CannedPages:
+    """Stand-in SODA endpoint serving fixed rows with ``$limit``/``$offset``.
+
+    Statuses queued in ``failures`` are answered (in order) before any
+    successful response, to exercise the client's retries.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.requests = []
+        self.failures = []
+        self.lock = threading.Lock()
+        pages = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                with pages.lock:
+                    pages.requests.append(params)
+                    status = pages.failures.pop(0) if pages.failures else 200
+                if url.path != f'/resource/{DATASET_ID}.json':
+                    status = 404
+                if status != 200:
+                    self.send_error(status)
+                    return
+                body = json.dumps(pages.answer(params)).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def answer(self, params):
+        if params.get('$select') == 'count(*) AS count':
+            return [{'count': str(len(self.rows))}]
+        offset = int(params.get('$offset', 0))
+        return self.rows[offset:offset + int(params.get('$limit', 1000))]
+
+    def page_requests(self):
+        with self.lock:
+            return [p for p in self.requests if '$offset' in p]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def pages():
+    server = CannedPages([{'id': str(i), 'value': str(i * 10)} for i in range(35)])
+    yield server
+    server.close()
+
+
+def client_for(pages, **options):
+    return SocrataClient(DATASET_ID, domain=pages.url, **{'page_size': 10, 'max_workers': 2, 'backoff': 0,
+                                                         **options})
+
+
+def test_pages_follow_limit_and_offset(pages):
+    with client_for(pages) as client:
+        df = client.fetch_frame()
+    assert df['id'].tolist() == [str(i) for i in range(35)]
+    requested = sorted((int(p['$offset']), int(p['$limit'])) for p in pages.page_requests())
+    assert requested == [(0, 10), (10, 10), (20, 10), (30, 5)]
+    assert {p['$order'] for p in pages.page_requests()} == {':id'}
+
+
+def test_limit_stops_at_the_requested_rows(pages):
+    with client_for(pages) as client:
+        df = client.fetch_frame(limit=12)
+    assert df['id'].tolist() == [str(i) for i in range(12)]
+    assert sorted(int(p['$limit']) for p in pages.page_requests()) == [2, 10]
+
+
+def test_pages_in_flight_are_bounded(pages):
+    pages.rows = [{'id': str(i)} for i in range(200)]
+    with client_for(pages, page_size=5, max_workers=2) as client:
+        stream = client.iter_pages()
+        first = next(stream)
+        #the generator is paused after its first page, at most two pages per worker were requested
+        assert len(pages.page_requests()) <= 2 * client.max_workers
+        rest = list(stream)
+    assert [r['id'] for page in [first, *rest] for r in page] == [str(i) for i in range(200)]
+    assert len(pages.page_requests()) == 40
+
+
+def test_server_error_is_retried(pages):
+    pages.failures = [500]
+    with client_for(pages) as client:
+        assert client.count() == 35
+    assert len(pages.requests) == 2
+
+
+def test_retries_give_up_after_max_retries(pages):
+    pages.failures = [503, 503, 503]
+    with client_for(pages, max_retries=2) as client, pytest.raises(SocrataError, match='503'):
+        client.count()
+    assert len(pages.requests) == 3
+
+
+def test_client_errors_are_not_retried(pages):
+    with SocrataClient('missing', domain=pages.url, backoff=0) as client, pytest.raises(SocrataError, match='404'):
+        client.count()
+    assert len(pages.requests) == 1
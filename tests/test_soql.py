@@ -0,0 +1,180 @@
+"""SoQL push-down against a mock SODA endpoint backed by SQLite.
+
+The server side is evaluated by a different engine than the pandas
+fallback, so every query must give the same frame on both paths.
+"""
+
+import json
+import re
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cpd_pipeline.config import CALLS_FOR_SERVICE_ID
+from cpd_pipeline.schemas import SOCRATA_CSV_TIME, apply_schema
+from cpd_pipeline.socrata import SocrataClient
+from cpd_pipeline.soql import AggregateQuery, date, day_of_week, hour
+from cpd_pipeline.synthetic import make_calls
+
+#soql functions the mock understands, as sqlite expressions
+SQLITE_FUNCTIONS = [
+    (r'date_extract_hh\((\w+)\)', r"CAST(strftime('%H', \1) AS INTEGER)"),
+    (r'date_extract_dow\((\w+)\)', r"CAST(strftime('%w', \1) AS INTEGER)"),
+    (r'date_extract_m\((\w+)\)', r"CAST(strftime('%m', \1) AS INTEGER)"),
+    (r'date_extract_y\((\w+)\)', r"CAST(strftime('%Y', \1) AS INTEGER)"),
+    (r'date_trunc_ymd\((\w+)\)', r"strftime('%Y-%m-%dT00:00:00.000', \1)"),
+]
+
+
+def to_sql(expression):
+    for pattern, replacement in SQLITE_FUNCTIONS:
+        expression = re.sub(pattern, replacement, expression)
+    return expression
+
+
+class MockSoda:
+    """A SODA ``/resource/<id>.json`` endpoint over one SQLite table."""
+
+    def __init__(self, frame, dataset_id):
+        self.db = sqlite3.connect(':memory:', check_same_thread=False)
+        frame.to_sql('t', self.db, index=False)
+        self.lock = threading.Lock()
+        self.bytes_sent = 0
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path != f'/resource/{dataset_id}.json':
+                    self.send_error(404)
+                    return
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                body = json.dumps(mock.query(params)).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with mock.lock:
+                    mock.bytes_sent += len(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def query(self, params):
+        sql = f"SELECT {to_sql(params.get('$select', '*'))} FROM t"
+        if '$where' in params:
+            sql += f" WHERE {to_sql(params['$where'])}"
+        if '$group' in params:
+            sql += f" GROUP BY {to_sql(params['$group'])}"
+        order = params.get('$order', ':id').replace(':id', 'rowid')
+        sql += f' ORDER BY {to_sql(order)} LIMIT {int(params.get("$limit", 1000))} OFFSET {int(params.get("$offset", 0))}'
+        with self.lock:
+            cursor = self.db.execute(sql)
+            names = [d[0] for d in cursor.description]
+            rows = cursor.fetchall()
+        #socrata sends every value as a string and leaves out nulls
+        return [{k: str(v) for k, v in zip(names, row) if v is not None} for row in rows]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.db.close()
+
+
+def api_frame(calls):
+    """The synthetic csv rows as the JSON api has them: lowercase names, ISO timestamps."""
+    api = calls.copy()
+    for col in ('CREATE_TIME_INCIDENT', 'DISPATCH_TIME_PRIMARY_UNIT', 'ARRIVAL_TIME_PRIMARY_UNIT'):
+        ts = pd.to_datetime(api[col], format=SOCRATA_CSV_TIME)
+        api[col] = ts.dt.strftime('%Y-%m-%dT%H:%M:%S.000').where(ts.notna(), None)
+    api.columns = [c.lower() for c in api.columns]
+    return api
+
+
+@pytest.fixture(scope='module')
+def calls():
+    calls = make_calls(20_000, seed=7)
+    #a few calls without a neighborhood, so null groups are compared too
+    calls.loc[np.random.default_rng(7).random(len(calls)) < 0.01, 'SNA_NEIGHBORHOOD'] = None
+    return calls
+
+
+@pytest.fixture(scope='module')
+def local(calls):
+    return apply_schema(calls.copy(), 'calls')
+
+
+@pytest.fixture(scope='module')
+def mock(calls):
+    server = MockSoda(api_frame(calls), CALLS_FOR_SERVICE_ID)
+    yield server
+    server.close()
+
+
+@pytest.fixture(scope='module')
+def client(mock):
+    with SocrataClient(CALLS_FOR_SERVICE_ID, domain=mock.url, max_retries=0) as client:
+        yield client
+
+
+def queries(top_neighborhoods):
+    return {
+        'top 3 neighborhoods': AggregateQuery('calls').count_by('sna_neighborhood').top(3),
+        'hourly, top neighborhoods': AggregateQuery('calls').count_by(
+            'sna_neighborhood', incident_hour=hour('create_time_incident')).isin('sna_neighborhood', top_neighborhoods),
+        'types in 2023': AggregateQuery('calls').count_by('incident_type_id').between(
+            'create_time_incident', '2023-01-01', '2024-01-01'),
+        'day of week x type': AggregateQuery('calls').count_by(
+            'incident_type_id', day=day_of_week('create_time_incident')),
+        'daily counts': AggregateQuery('calls').count_by(day=date('create_time_incident')),
+        'top 5 dispatch hours': AggregateQuery('calls').count_by(
+            dispatch_hour=hour('dispatch_time_primary_unit')).top(5),
+        'total in june 2022': AggregateQuery('calls').between('create_time_incident', '2022-06-01', '2022-07-01'),
+    }
+
+
+@pytest.fixture(scope='module')
+def top_neighborhoods(local):
+    top = AggregateQuery('calls').count_by('sna_neighborhood').top(3).run_local(local)['sna_neighborhood']
+    return list(top.dropna())
+
+
+@pytest.mark.parametrize('name', list(queries([])))
+def test_remote_matches_local(name, client, local, top_neighborhoods):
+    query = queries(top_neighborhoods)[name]
+    remote = query.run(client=client, df=local, fallback=False)
+    assert remote.attrs['source'] == 'remote'
+    assert len(remote)
+    pd.testing.assert_frame_equal(remote, query.run_local(local))
+
+
+@pytest.mark.parametrize('name', list(queries([])))
+def test_fallback_matches_local(name, local, top_neighborhoods):
+    query = queries(top_neighborhoods)[name]
+    #nothing listens on the discard port
+    with SocrataClient(CALLS_FOR_SERVICE_ID, domain='http://127.0.0.1:9', max_retries=0, timeout=2) as offline:
+        result = query.run(client=offline, df=local)
+    assert result.attrs['source'] == 'local'
+    pd.testing.assert_frame_equal(result, query.run_local(local))
+
+
+def test_aggregates_send_less_than_the_raw_rows(mock, client):
+    before = mock.bytes_sent
+    queries([])['top 3 neighborhoods'].run_remote(client)
+    aggregated = mock.bytes_sent - before
+    before = mock.bytes_sent
+    client.fetch_frame(select='sna_neighborhood')
+    assert aggregated * 100 < mock.bytes_sent - before
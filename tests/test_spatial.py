@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cpd_pipeline.spatial import GridIndex, brute_force_radius, haversine_m
+from cpd_pipeline.synthetic import make_shootings
+
+RADIUS = 400.0
+
+
+@pytest.fixture(scope='module')
+def shootings():
+    df = make_shootings(20_000, seed=2)
+    df['occurred'] = pd.to_datetime(df['DateTimeOccured'], format='%Y/%m/%d %H:%M:%S')
+    return df
+
+
+@pytest.fixture(scope='module')
+def probes(shootings):
+    return np.random.default_rng(0).integers(0, len(shootings), 50)
+
+
+def assert_same_hits(grid_ids, brute_ids, brute_dist):
+    #the projection and haversine differ by centimetres, ignore points right on the circle
+    edge = set(brute_ids[np.abs(brute_dist - RADIUS) < 1.0])
+    assert set(grid_ids) - edge == set(brute_ids) - edge
+
+
+def test_radius_matches_brute_force(shootings, probes):
+    lat, lon = shootings['LATITUDE_X'].to_numpy(), shootings['LONGITUDE_X'].to_numpy()
+    index = GridIndex.from_frame(shootings, cell_size=250)
+    for i in probes:
+        grid_ids, grid_dist = index.radius(lat[i], lon[i], RADIUS)
+        brute_ids, brute_dist = brute_force_radius(lat, lon, lat[i], lon[i], RADIUS)
+        assert_same_hits(grid_ids, brute_ids, brute_dist)
+        assert (np.diff(grid_dist) >= 0).all()
+
+
+def test_radius_time_window_and_added_points(shootings, probes):
+    lat, lon = shootings['LATITUDE_X'].to_numpy(), shootings['LONGITUDE_X'].to_numpy()
+    times = shootings['occurred'].to_numpy()
+    #most points go through the unsorted buffer of add
+    index = GridIndex.from_frame(shootings.iloc[:5_000], time='occurred', rebuild_fraction=10.0)
+    index.add(lat[5_000:], lon[5_000:], times[5_000:])
+    end = shootings['occurred'].max()
+    start = end - pd.Timedelta(days=365)
+    window = (times >= np.datetime64(start)) & (times < np.datetime64(end))
+    for i in probes:
+        grid_ids, _ = index.radius(lat[i], lon[i], RADIUS, start=start, end=end)
+        brute_ids, brute_dist = brute_force_radius(lat, lon, lat[i], lon[i], RADIUS)
+        assert_same_hits(grid_ids, brute_ids[window[brute_ids]], brute_dist[window[brute_ids]])
+
+
+def test_nearest_matches_brute_force(shootings, probes):
+    lat, lon = shootings['LATITUDE_X'].to_numpy(), shootings['LONGITUDE_X'].to_numpy()
+    index = GridIndex.from_frame(shootings, cell_size=100)
+    for i in probes:
+        _, dist = index.nearest(lat[i], lon[i], k=10)
+        brute = np.sort(haversine_m(lat, lon, lat[i], lon[i]))[:10]
+        np.testing.assert_allclose(dist, brute, rtol=1e-3, atol=1.0)
+
+
+def test_density_counts_every_point(shootings):
+    density = GridIndex.from_frame(shootings).density()
+    assert density['count'].sum() == shootings[['LATITUDE_X', 'LONGITUDE_X']].notna().all(axis=1).sum()
+    assert density['count'].is_monotonic_decreasing
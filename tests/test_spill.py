@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cpd_pipeline.schemas import read_csv_typed
+from cpd_pipeline.spill import GroupCounter, grouped_counts
+from cpd_pipeline.synthetic import write_synthetic
+
+KEYS = ['CREATE_TIME_INCIDENT:date', 'SNA_NEIGHBORHOOD', 'INCIDENT_TYPE_ID']
+
+
+@pytest.fixture(scope='module')
+def calls_csv(tmp_path_factory):
+    return write_synthetic('calls', 30_000, tmp_path_factory.mktemp('spill') / 'calls.csv', seed=5,
+                           chunk_rows=10_000)
+
+
+def expected_counts(calls_csv):
+    df = read_csv_typed(calls_csv, 'calls')
+    keys = pd.DataFrame({'CREATE_TIME_INCIDENT:date': df['CREATE_TIME_INCIDENT'].dt.normalize(),
+                         'SNA_NEIGHBORHOOD': df['SNA_NEIGHBORHOOD'].astype('string'),
+                         'INCIDENT_TYPE_ID': df['INCIDENT_TYPE_ID'].astype('string')})
+    counts = keys.groupby(KEYS, dropna=False).size().reset_index(name='counts')
+    return counts.sort_values(KEYS, na_position='first', ignore_index=True)
+
+
+#in memory, spilled, and spilled with the partitions split again in the final merge
+@pytest.mark.parametrize('budget_mb', [None, 0.2, 0.1])
+def test_grouped_counts_match_groupby_size(calls_csv, budget_mb, tmp_path):
+    out = tmp_path / 'counts.parquet'
+    grouped_counts(calls_csv, 'calls', KEYS, budget_mb=budget_mb, chunksize=2_000, out=out, partitions=4)
+    result = pd.read_parquet(out).sort_values(KEYS, na_position='first', ignore_index=True)
+    expected = expected_counts(calls_csv)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_skewed_partition_is_split_again(tmp_path):
+    rng = np.random.default_rng(0)
+    counter = GroupCounter(['key'], budget_mb=0.05, partitions=2, directory=tmp_path)
+    keys = rng.integers(0, 20_000, 200_000)
+    for start in range(0, len(keys), 10_000):
+        counter.update(pd.DataFrame({'key': keys[start:start + 10_000]}))
+    result = counter.result()
+    stats = counter.stats()
+    #each of the two partitions holds more groups than the budget, so both are split again
+    assert stats['spills'] and stats['repartitions'] >= 2
+    expected = pd.Series(keys).value_counts().sort_index()
+    assert result.set_index('key')['counts'].to_dict() == expected.to_dict()
+    assert not any(tmp_path.iterdir())
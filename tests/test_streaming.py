@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+
+from cpd_pipeline.parallel import aggregate_calls_parallel
+from cpd_pipeline.schemas import read_csv_typed
+from cpd_pipeline.streaming import aggregate_calls, aggregate_calls_in_memory
+from cpd_pipeline.synthetic import write_synthetic
+
+TABLES = ['day_type_counts', 'hour_neighborhood_counts', 'response_time']
+
+#the in-memory reference parses timestamps without a format, like the notebook
+pytestmark = pytest.mark.filterwarnings('ignore:Could not infer format')
+
+
+@pytest.fixture(scope='module')
+def calls_csv(tmp_path_factory):
+    return write_synthetic('calls', 20_000, tmp_path_factory.mktemp('calls') / 'calls.csv', seed=3,
+                           chunk_rows=7_000)
+
+
+@pytest.fixture(scope='module')
+def expected(calls_csv):
+    return aggregate_calls_in_memory(pd.read_csv(calls_csv))
+
+
+def assert_same_tables(result, expected):
+    assert result['rows'] == expected['rows']
+    for table in TABLES:
+        pd.testing.assert_frame_equal(result[table], expected[table])
+
+
+def test_streaming_matches_in_memory(calls_csv, expected):
+    assert_same_tables(aggregate_calls(calls_csv, chunksize=3_000), expected)
+
+
+def test_streaming_parquet_matches_in_memory(calls_csv, expected, tmp_path):
+    path = tmp_path / 'calls.parquet'
+    read_csv_typed(calls_csv, 'calls').to_parquet(path, index=False)
+    assert_same_tables(aggregate_calls(path, chunksize=3_000), expected)
+
+
+def test_parallel_matches_in_memory(calls_csv, expected):
+    assert_same_tables(aggregate_calls_parallel(calls_csv, workers=2, parts=3, chunksize=3_000), expected)
@@ -0,0 +1,69 @@
+import re
+
+import pandas as pd
+import pytest
+
+from cpd_pipeline.sync import load_store, load_watermarks, sync_dataset
+
+
+class FakeClient:
+    """Stand-in for ``SocrataClient.iter_frames`` over a list of calls, answering ``>=`` watermark filters."""
+
+    def __init__(self, rows, page_size=2):
+        self.rows = rows
+        self.page_size = page_size
+        self.wheres = []
+
+    def iter_frames(self, where=None, order=None):
+        self.wheres.append(where)
+        rows = sorted(self.rows, key=lambda r: (r['create_time_incident'], r['event_number']))
+        if where:
+            mark = re.search(r"'(.*)'", where).group(1)
+            rows = [r for r in rows if r['create_time_incident'] >= mark]
+        for start in range(0, len(rows), self.page_size):
+            #like the json api, null fields are left out of each row
+            yield pd.DataFrame.from_records([{k: v for k, v in r.items() if v is not None}
+                                             for r in rows[start:start + self.page_size]])
+
+
+def call(number, day, x, note=None):
+    return {'event_number': str(number), 'create_time_incident': f'2024-01-{day:02d}T00:00:00.000',
+            'x': str(x), 'note': note}
+
+
+@pytest.fixture
+def client():
+    return FakeClient([call(1, 1, 10), call(2, 2, 20, 'a'), call(3, 3, 30), call(4, 3, 40)])
+
+
+def sync(client, root):
+    return sync_dataset('calls_for_service', client=client, root=root)
+
+
+def test_first_sync_stores_every_row(client, tmp_path):
+    result = sync(client, tmp_path)
+    assert (result['fetched'], result['appended'], result['updated']) == (4, 4, 0)
+    assert result['watermark'] == '2024-01-03T00:00:00.000'
+    assert load_watermarks(tmp_path)['calls_for_service'] == result['watermark']
+    assert load_store('calls_for_service', root=tmp_path)['x'].tolist() == ['10', '20', '30', '40']
+
+
+def test_resync_without_changes_appends_nothing(client, tmp_path):
+    sync(client, tmp_path)
+    result = sync(client, tmp_path)
+    assert client.wheres[-1] == "create_time_incident >= '2024-01-03T00:00:00.000'"
+    #the two rows at the watermark come back, but they are the same as the stored ones
+    assert (result['fetched'], result['appended'], result['updated']) == (2, 0, 0)
+    assert len(list((tmp_path / 'store' / 'calls_for_service').glob('part-*.parquet'))) == 1
+
+
+def test_revised_records_replace_the_stored_version(client, tmp_path):
+    sync(client, tmp_path)
+    client.rows[3] = call(4, 3, 44, 'revised')
+    client.rows.append(call(5, 4, 50))
+    result = sync(client, tmp_path)
+    assert (result['fetched'], result['appended'], result['updated']) == (3, 2, 1)
+    store = load_store('calls_for_service', root=tmp_path).set_index('event_number')
+    assert store['x'].to_dict() == {'1': '10', '2': '20', '3': '30', '4': '44', '5': '50'}
+    assert store.loc['4', 'note'] == 'revised'
+    assert result['watermark'] == '2024-01-04T00:00:00.000'
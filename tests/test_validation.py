@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+
+from cpd_pipeline.features import response_time_features
+from cpd_pipeline.parallel import aggregate_calls_parallel
+from cpd_pipeline.schemas import read_csv_typed
+from cpd_pipeline.spill import grouped_counts
+from cpd_pipeline.streaming import aggregate_calls
+from cpd_pipeline.synthetic import make_calls, make_shootings
+from cpd_pipeline.validation import Validator, read_quarantine
+
+BAD_TIME, EARLY_ARRIVAL, OUTSIDE = 5, 7, 9
+
+
+@pytest.fixture(scope='module')
+def calls_csv(tmp_path_factory):
+    calls = make_calls(6_000, seed=11)
+    calls.loc[BAD_TIME, 'CREATE_TIME_INCIDENT'] = '13/45/2023 99:00:00 XM'
+    calls.loc[EARLY_ARRIVAL, ['DISPATCH_TIME_PRIMARY_UNIT', 'ARRIVAL_TIME_PRIMARY_UNIT']] = [
+        '01/02/2023 10:30:00 AM', '01/02/2023 10:00:00 AM']
+    calls.loc[OUTSIDE, ['LATITUDE_X', 'LONGITUDE_X']] = [41.5, -81.7]
+    path = tmp_path_factory.mktemp('validation') / 'calls.csv'
+    calls.to_csv(path, index=False)
+    return path
+
+
+def test_only_unparseable_rows_are_quarantined(calls_csv):
+    with Validator('calls') as validator:
+        df = read_csv_typed(calls_csv, 'calls', validator=validator)
+    assert len(df) == 6_000 - 1
+    quarantined = read_quarantine('calls')
+    assert quarantined['_row'].tolist() == [BAD_TIME]
+    assert quarantined['_reasons'].tolist() == ['bad_timestamp']
+
+    flags = df['quality_flags']
+    assert flags.loc[EARLY_ARRIVAL] == 'arrival_before_dispatch'
+    assert flags.loc[OUTSIDE] == 'outside_cincinnati'
+    assert flags.notna().sum() == validator.flagged == 2
+
+
+def test_feature_builder_drops_flagged_response_times(calls_csv):
+    with Validator('calls') as validator:
+        df = read_csv_typed(calls_csv, 'calls', validator=validator)
+    X, y, _ = response_time_features(df, fill=None)
+    assert len(y) == len(df) - 1
+    assert not (y < 0).any()
+
+
+def test_every_reader_validates_the_same_way(calls_csv):
+    streamed = aggregate_calls(calls_csv, chunksize=1_000)['validation']
+    assert streamed['quarantined'] == 1 and streamed['flagged'] == 2
+    streamed_rows = read_quarantine('calls').drop(columns=['_file'])
+
+    parallel = aggregate_calls_parallel(calls_csv, workers=2, parts=3, chunksize=1_000)['validation']
+    assert {k: parallel[k] for k in ('rows', 'quarantined', 'flagged', 'rules')} == \
+        {k: streamed[k] for k in ('rows', 'quarantined', 'flagged', 'rules')}
+    #the part files hold the same rows, numbered from the start of their part
+    parts = read_quarantine('calls')
+    assert parts['_file'].str.startswith('part-').all()
+    pd.testing.assert_frame_equal(parts.drop(columns=['_file', '_row']), streamed_rows.drop(columns=['_row']))
+
+    #the timestamp and coordinate columns are read for the rules, though the counts don't need them
+    counts = grouped_counts(calls_csv, 'calls', ['SNA_NEIGHBORHOOD'], chunksize=1_000)
+    assert counts['counts'].sum() == 6_000 - 1
+    assert len(read_quarantine('calls')) == 1
+    assert read_quarantine('calls')['_file'].tolist() == ['calls.parquet']
+
+
+def test_unknown_neighborhoods_are_flagged_after_normalizing(tmp_path):
+    shootings = make_shootings(6, seed=12).astype({'SNA_NEIGHBORHOOD': object})
+    #cpd spellings of known neighborhoods, a missing one and one that isn't a neighborhood
+    shootings['SNA_NEIGHBORHOOD'] = ['CUF', 'Mt. Airy', 'over the rhine', None, 'WESTWOOD', 'NOT A PLACE']
+    with Validator('shootings', path=tmp_path / 'quarantine.parquet') as validator:
+        df = validator.check(shootings)
+    assert len(df) == 6
+    assert df['quality_flags'].isna().tolist() == [True] * 5 + [False]
+    assert df['quality_flags'].iloc[-1] == 'unknown_neighborhood'
+    assert validator.counts['unknown_neighborhood'] == validator.flagged == 1